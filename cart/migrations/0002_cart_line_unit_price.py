@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_cart_line'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cartline',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+    ]
@@ -1,3 +1,23 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+from products.models import HennaProduct
+
+
+class CartLine(models.Model):
+    """
+    A line of a signed in user's cart. The unit price is the discounted
+    price when the product was first added.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='cart_lines', on_delete=models.CASCADE)
+    product = models.ForeignKey(HennaProduct, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_line'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} (x{self.quantity})"
@@ -0,0 +1,18 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .storage import DatabaseCartStore, get_anonymous_cart_store
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Move the lines added before signing in into the user's cart."""
+    if request is None:
+        return
+    anonymous = get_anonymous_cart_store(request)
+    if anonymous.cart:
+        store = DatabaseCartStore(request, user)
+        for product_id, quantity, price in anonymous.cart:
+            store.add(product_id, quantity, price)
+        anonymous.clear()
+    request._cart_store = None
@@ -1,24 +1,66 @@
+// Send a quantity change and update the page from the JSON response
+function updateQuantity(form) {
+    $.post(form.attr('action'), form.serialize())
+        .done(function (data) {
+            // Removing the last of a line or emptying the cart changes the layout
+            if (data.quantity === 0 || data.product_count === 0) {
+                location.reload();
+                return;
+            }
+            $(`.qty_input[data-item_id="${data.item_id}"]`).val(data.quantity);
+            $(`.line-total[data-item_id="${data.item_id}"]`).text(`£${data.line_total}`);
+            $('.cart-total-value').text(`£${data.total}`);
+            $('.delivery-cost-value').text(`£${data.delivery_cost}`);
+            $('.vat-amount-value').text(`£${data.vat_amount}`);
+            $('.grand-total-value').text(`£${data.grand_total}`);
+            $('.cart-summary-total').text(`£${data.total}`);
+
+            let deltaFields = $('.free-delivery-delta-value');
+            let needsDelta = parseFloat(data.free_delivery_delta) > 0;
+            if (needsDelta && !deltaFields.length) {
+                location.reload();
+                return;
+            }
+            deltaFields.text(`£${data.free_delivery_delta}`);
+            deltaFields.closest('tr, .free-delivery-alert').toggle(needsDelta);
+        })
+        .fail(function () {
+            alert('Failed to update quantity. Please try again.');
+        });
+}
+
 // Increment Quantity
 $('.increment-qty').click(function (e) {
     e.preventDefault();  // Prevent default button behaviour
-    let inputField = $(this).closest('tr').find('.qty_input');
+    let inputField = $(this).closest('form').find('.qty_input');
     let currentQty = parseInt(inputField.val());
-    inputField.val(currentQty + 1);  // Increment the quantity
-    $(this).closest('form').submit();  // Submit the form to update the quantity
+    if (currentQty < 99) {
+        inputField.val(currentQty + 1);  // Increment the quantity
+        updateQuantity($(this).closest('form'));
+    }
 });
 
 // Decrement Quantity
 $('.decrement-qty').click(function (e) {
     e.preventDefault();
-    let inputField = $(this).closest('tr').find('.qty_input');
+    let inputField = $(this).closest('form').find('.qty_input');
     let currentQty = parseInt(inputField.val());
 
     if (currentQty > 1) {  // Ensure quantity does not go below 1
         inputField.val(currentQty - 1);  // Decrement the quantity
-        $(this).closest('form').submit();  // Submit the form to update the quantity
+        updateQuantity($(this).closest('form'));
     }
 });
 
+// Typed quantities are sent when the field changes or the form is submitted
+$('.update-form').on('submit', function (e) {
+    e.preventDefault();
+    updateQuantity($(this));
+});
+$('.update-form .qty_input').on('change', function () {
+    updateQuantity($(this).closest('form'));
+});
+
 // Remove item from cart and reload page
 $('.remove-item').click(function (e) {
     e.preventDefault();
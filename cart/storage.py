@@ -0,0 +1,389 @@
+"""
+Server-side cart storage.
+
+A cart is held as three parallel integer arrays (product ids, quantities
+and unit prices in pence) and is stored by one of three backends:
+
+* `DatabaseCartStore` keeps one `CartLine` row per product for signed in
+  users, so their cart follows them between devices.
+* `CacheCartStore` keeps anonymous carts in the cache under a random token
+  held in the session. Each line's quantity is its own cache key, so
+  adding to a line is a single atomic `incr`.
+* `SessionCartStore` keeps the encoded cart in the session itself. It is
+  the fallback when there is no shared cache, and every change rewrites
+  the session.
+
+The `CART_STORE` setting ('session' or 'cache') picks the store for
+anonymous visitors. Use `get_cart_store(request)` rather than reading
+`request.session['cart']`.
+"""
+import json
+import secrets
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CartLine
+
+SESSION_KEY = 'cart'
+TOKEN_SESSION_KEY = 'cart_token'
+CACHE_PREFIX = 'cart'
+
+
+def to_pence(price):
+    """Return a price as a whole number of pence."""
+    return int((Decimal(price) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_pence(pence):
+    """Return a number of pence as a price in pounds."""
+    return Decimal(pence).scaleb(-2)
+
+
+class Cart:
+    """
+    The lines of a cart in insertion order. Iterating yields
+    `(product_id, quantity, unit_price)` tuples.
+    """
+
+    __slots__ = ('ids', 'quantities', 'prices')
+
+    def __init__(self, lines=()):
+        self.ids = array('q')
+        self.quantities = array('q')
+        self.prices = array('q')
+        for product_id, quantity, pence in lines:
+            self.set_line(product_id, quantity, pence)
+
+    @classmethod
+    def decode(cls, data):
+        """
+        Build a cart from its encoded form, a flat list of
+        `[product_id, quantity, pence, ...]`. The dict form used before
+        (`{item_id: {'quantity', 'discounted_price'}}`) is also accepted.
+        """
+        if not data:
+            return cls()
+        if isinstance(data, dict):
+            return cls(
+                (int(item_id), int(item_data.get('quantity', 1)),
+                 to_pence(item_data.get('discounted_price', '0.00')))
+                for item_id, item_data in data.items() if str(item_id).isdigit()
+            )
+        return cls(zip(data[0::3], data[1::3], data[2::3]))
+
+    @classmethod
+    def loads(cls, text):
+        """Build a cart from the JSON produced by `dumps()`."""
+        return cls.decode(json.loads(text))
+
+    def encode(self):
+        """Return the cart as a flat list of integers."""
+        encoded = []
+        for line in zip(self.ids, self.quantities, self.prices):
+            encoded.extend(line)
+        return encoded
+
+    def dumps(self):
+        """Return the cart as compact JSON, e.g. for Stripe metadata."""
+        return json.dumps(self.encode(), separators=(',', ':'))
+
+    def __iter__(self):
+        for product_id, quantity, pence in zip(self.ids, self.quantities, self.prices):
+            yield product_id, quantity, from_pence(pence)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, product_id):
+        return product_id in self.ids
+
+    def quantity(self, product_id):
+        """Return the quantity of a product in the cart, or 0."""
+        return self.quantities[self.ids.index(product_id)] if product_id in self.ids else 0
+
+    def price(self, product_id):
+        """Return the unit price of a product's line."""
+        return from_pence(self.prices[self.ids.index(product_id)])
+
+    def set_line(self, product_id, quantity, pence):
+        """Add a line or replace an existing one."""
+        if product_id in self.ids:
+            index = self.ids.index(product_id)
+            self.quantities[index] = quantity
+            self.prices[index] = pence
+        else:
+            self.ids.append(product_id)
+            self.quantities.append(quantity)
+            self.prices.append(pence)
+
+    def remove(self, product_ids):
+        """Remove the lines for the given products."""
+        for product_id in product_ids:
+            if product_id in self.ids:
+                index = self.ids.index(product_id)
+                del self.ids[index], self.quantities[index], self.prices[index]
+
+
+class CartStore:
+    """
+    Base class for cart stores. `cart` is loaded once per request; the
+    mutating methods update the backend and the loaded cart together.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._cart = None
+
+    @property
+    def cart(self):
+        if self._cart is None:
+            self._cart = self.load()
+        return self._cart
+
+    def load(self):
+        raise NotImplementedError
+
+    def add(self, product_id, quantity, price):
+        """
+        Add `quantity` of a product, keeping the price of an existing line,
+        and return the line's new quantity.
+        """
+        raise NotImplementedError
+
+    def set(self, product_id, quantity, price=None):
+        """
+        Set the quantity of a line, removing it when `quantity` is 0. An
+        existing line keeps its price unless `price` is given.
+        """
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        """Remove the lines for the given products."""
+        raise NotImplementedError
+
+    def reprice(self, prices):
+        """Replace the unit prices of lines, given as `{product_id: price}`."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Empty the cart."""
+        raise NotImplementedError
+
+
+class SessionCartStore(CartStore):
+    """Cart encoded in the session."""
+
+    def load(self):
+        return Cart.decode(self.request.session.get(SESSION_KEY))
+
+    def save(self):
+        self.request.session[SESSION_KEY] = self.cart.encode()
+
+    def add(self, product_id, quantity, price):
+        cart = self.cart
+        if product_id in cart:
+            quantity += cart.quantity(product_id)
+            cart.set_line(product_id, quantity, cart.prices[cart.ids.index(product_id)])
+        else:
+            cart.set_line(product_id, quantity, to_pence(price))
+        self.save()
+        return quantity
+
+    def set(self, product_id, quantity, price=None):
+        if quantity <= 0:
+            self.remove([product_id])
+            return
+        if price is None:
+            price = self.cart.price(product_id)
+        self.cart.set_line(product_id, quantity, to_pence(price))
+        self.save()
+
+    def remove(self, product_ids):
+        self.cart.remove(product_ids)
+        self.save()
+
+    def reprice(self, prices):
+        for product_id, price in prices.items():
+            self.cart.set_line(product_id, self.cart.quantity(product_id), to_pence(price))
+        self.save()
+
+    def clear(self):
+        self._cart = Cart()
+        self.request.session.pop(SESSION_KEY, None)
+
+
+class CacheCartStore(CartStore):
+    """
+    Cart kept in the cache. `cart:<token>` holds the line index (a flat
+    list of `[product_id, pence, ...]`) and `cart:<token>:<product_id>`
+    the line's quantity. The index is only rewritten when lines are added
+    or removed.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.timeout = settings.SESSION_COOKIE_AGE
+
+    @property
+    def token(self):
+        token = self.request.session.get(TOKEN_SESSION_KEY)
+        if token is None:
+            token = self.request.session[TOKEN_SESSION_KEY] = secrets.token_urlsafe(16)
+        return token
+
+    def index_key(self):
+        return f'{CACHE_PREFIX}:{self.token}'
+
+    def line_key(self, product_id):
+        return f'{CACHE_PREFIX}:{self.token}:{product_id}'
+
+    def load(self):
+        if TOKEN_SESSION_KEY not in self.request.session:
+            return Cart()
+        index = cache.get(self.index_key()) or []
+        keys = {self.line_key(product_id): product_id for product_id in index[0::2]}
+        quantities = {keys[key]: quantity for key, quantity in cache.get_many(keys).items()}
+        # Lines whose quantity key expired or was deleted are dropped
+        return Cart(
+            (product_id, quantities[product_id], pence)
+            for product_id, pence in zip(index[0::2], index[1::2])
+            if product_id in quantities
+        )
+
+    def save_index(self):
+        cart = self.cart
+        index = []
+        for line in zip(cart.ids, cart.prices):
+            index.extend(line)
+        cache.set(self.index_key(), index, self.timeout)
+
+    def add(self, product_id, quantity, price):
+        cart = self.cart
+        if product_id in cart:
+            try:
+                quantity = cache.incr(self.line_key(product_id), quantity)
+                cache.touch(self.line_key(product_id), self.timeout)
+                cart.quantities[cart.ids.index(product_id)] = quantity
+                return quantity
+            except ValueError:
+                # The quantity key expired since the cart was loaded
+                pass
+        self.set(product_id, quantity, price)
+        return quantity
+
+    def set(self, product_id, quantity, price=None):
+        if quantity <= 0:
+            self.remove([product_id])
+            return
+        if price is None:
+            price = self.cart.price(product_id)
+        is_new = product_id not in self.cart
+        cache.set(self.line_key(product_id), quantity, self.timeout)
+        self.cart.set_line(product_id, quantity, to_pence(price))
+        if is_new:
+            self.save_index()
+
+    def remove(self, product_ids):
+        self.cart.remove(product_ids)
+        self.save_index()
+        cache.delete_many([self.line_key(product_id) for product_id in product_ids])
+
+    def reprice(self, prices):
+        # Prices live in the index, so quantities are left alone
+        for product_id, price in prices.items():
+            self.cart.set_line(product_id, self.cart.quantity(product_id), to_pence(price))
+        self.save_index()
+
+    def clear(self):
+        if TOKEN_SESSION_KEY in self.request.session:
+            self.remove(list(self.cart.ids))
+            cache.delete(self.index_key())
+        self._cart = Cart()
+
+
+class DatabaseCartStore(CartStore):
+    """Cart kept as `CartLine` rows for a signed in user."""
+
+    def __init__(self, request, user=None):
+        super().__init__(request)
+        self.user = user or request.user
+
+    def lines(self):
+        return CartLine.objects.filter(user=self.user)
+
+    def load(self):
+        rows = self.lines().order_by('pk').values_list('product_id', 'quantity', 'unit_price')
+        return Cart((product_id, quantity, to_pence(price)) for product_id, quantity, price in rows)
+
+    def add(self, product_id, quantity, price):
+        lines = self.lines().filter(product_id=product_id)
+        if not lines.update(quantity=F('quantity') + quantity):
+            try:
+                with transaction.atomic():
+                    lines.create(user=self.user, product_id=product_id,
+                                 quantity=quantity, unit_price=price)
+                self.cart.set_line(product_id, quantity, to_pence(price))
+                return quantity
+            except IntegrityError:
+                # Another request created the line first
+                lines.update(quantity=F('quantity') + quantity)
+        self._cart = None
+        return self.cart.quantity(product_id)
+
+    def set(self, product_id, quantity, price=None):
+        if quantity <= 0:
+            self.remove([product_id])
+            return
+        if price is None:
+            price = self.cart.price(product_id)
+        CartLine.objects.update_or_create(
+            user=self.user, product_id=product_id, defaults={'quantity': quantity, 'unit_price': price}
+        )
+        self.cart.set_line(product_id, quantity, to_pence(price))
+
+    def remove(self, product_ids):
+        self.lines().filter(product_id__in=product_ids).delete()
+        self.cart.remove(product_ids)
+
+    def reprice(self, prices):
+        for product_id, price in prices.items():
+            self.lines().filter(product_id=product_id).update(unit_price=price)
+            self.cart.set_line(product_id, self.cart.quantity(product_id), to_pence(price))
+
+    def clear(self):
+        self.lines().delete()
+        self._cart = Cart()
+
+
+ANONYMOUS_STORES = {
+    'session': SessionCartStore,
+    'cache': CacheCartStore,
+}
+
+
+def get_anonymous_cart_store(request):
+    """Return the store configured for visitors who are not signed in."""
+    return ANONYMOUS_STORES[getattr(settings, 'CART_STORE', 'session')](request)
+
+
+def get_cart_store(request):
+    """Return the cart store for this request, memoized on the request."""
+    store = getattr(request, '_cart_store', None)
+    if store is None:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            store = DatabaseCartStore(request)
+        else:
+            store = get_anonymous_cart_store(request)
+        request._cart_store = store
+    return store
+
+
+def get_cart(request):
+    """Return the request's Cart."""
+    return get_cart_store(request).cart
@@ -1,3 +1,199 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products.models import HennaProduct
+
+from .models import CartLine
+from .storage import Cart
+
+
+class CartHydrationTest(TestCase):
+    """Test suite for loading cart products in bulk."""
+
+    def setUp(self):
+        """Set up products to put in the cart."""
+        self.products = [
+            HennaProduct.objects.create(
+                name=f'Henna Cone {index}', sku=f'HC{index}', description='Test',
+                price=Decimal('4.00')
+            )
+            for index in range(6)
+        ]
+        # The cart template shows product images; skip generating variants
+        HennaProduct.objects.update(image='products/cone.jpeg')
+
+    def fill_cart(self, products):
+        session = self.client.session
+        session['cart'] = {
+            str(product.pk): {'quantity': 2, 'discounted_price': '4.00'}
+            for product in products
+        }
+        session.save()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_cart_page_query_count_is_constant(self):
+        """Test that the cart page loads every product with one query."""
+        self.fill_cart(self.products[:1])
+        # Load the process-wide delivery methods first
+        self.client.get(reverse('view_cart'))
+        one_line = self.count_queries(reverse('view_cart'))
+        self.fill_cart(self.products)
+        self.assertEqual(self.count_queries(reverse('view_cart')), one_line)
+
+    def test_stale_prices_are_updated(self):
+        """Test that lines added at an old price are repriced on the cart page."""
+        session = self.client.session
+        session['cart'] = Cart([(self.products[0].pk, 2, 500), (self.products[1].pk, 2, 400)]).encode()
+        session.save()
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['total'], Decimal('16.00'))
+        self.assertEqual([str(message) for message in response.context['messages']],
+                         ['Some prices in your cart have changed since you added them.'])
+        self.assertEqual(list(Cart.decode(self.client.session['cart'])),
+                         [(self.products[0].pk, 2, Decimal('4.00')),
+                          (self.products[1].pk, 2, Decimal('4.00'))])
+
+    def test_deleted_products_are_dropped(self):
+        """Test that a deleted product is removed from the cart instead of a 404."""
+        self.fill_cart(self.products[:2])
+        self.products[0].delete()
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['product'] for item in response.context['cart_items']],
+                         [self.products[1]])
+        self.assertEqual(response.context['total'], Decimal('8.00'))
+        self.assertEqual(list(Cart.decode(self.client.session['cart']).ids), [self.products[1].pk])
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+
+    def test_other_pages_do_not_load_cart_products(self):
+        """Test that a page showing only cart totals costs the same for any cart size."""
+        # Warm the cached home page blocks first
+        self.client.get(reverse('home'))
+        self.fill_cart(self.products[:1])
+        one_line = self.count_queries(reverse('home'))
+        self.fill_cart(self.products)
+        self.assertEqual(self.count_queries(reverse('home')), one_line)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total'], Decimal('48.00'))
+        self.assertEqual(response.context['product_count'], 12)
+        self.assertContains(response, '<p class="mb-0 cart-summary-total">£48.00</p>', html=True)
+        self.assertTemplateUsed(response, 'includes/mini-cart.html')
+
+
+class CartStoreTest(TestCase):
+    """Test suite for the cart storage backends."""
+
+    def setUp(self):
+        """Set up two products."""
+        self.cone = HennaProduct.objects.create(
+            name='Henna Cone', sku='HC1', description='Test', price=Decimal('4.00')
+        )
+        self.powder = HennaProduct.objects.create(
+            name='Henna Powder', sku='HP1', description='Test', price=Decimal('6.50')
+        )
+        # The cart toast shows product images; skip generating variants
+        HennaProduct.objects.update(image='products/cone.jpeg')
+
+    def add(self, product, quantity=1):
+        return self.client.post(reverse('add_to_cart', args=[product.pk]), {'quantity': quantity})
+
+    def cart_lines(self):
+        response = self.client.get(reverse('home'))
+        return [(item['product'], item['quantity']) for item in response.context['cart_items']]
+
+    def test_encoding_round_trip(self):
+        """Test that a cart survives encoding and still reads the old dict format."""
+        cart = Cart([(3, 2, 400), (5, 1, 650)])
+        self.assertEqual(cart.encode(), [3, 2, 400, 5, 1, 650])
+        self.assertEqual(list(Cart.loads(cart.dumps())), list(cart))
+        legacy = Cart.decode({'3': {'quantity': 2, 'discounted_price': '4.00'}})
+        self.assertEqual(list(legacy), [(3, 2, Decimal('4.00'))])
+
+    def test_session_store_adds_to_existing_line(self):
+        """Test that adding a product twice increments its line."""
+        self.add(self.cone, 2)
+        self.add(self.cone, 3)
+        self.assertEqual(self.cart_lines(), [(self.cone, 5)])
+
+    @override_settings(CART_STORE='cache')
+    def test_cache_store_keeps_cart_out_of_session(self):
+        """Test that the cache store keeps only a token in the session."""
+        cache.clear()
+        self.add(self.cone, 2)
+        self.add(self.powder)
+        self.add(self.cone)
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(self.cart_lines(), [(self.cone, 3), (self.powder, 1)])
+        self.client.post(reverse('adjust_cart', args=[self.cone.pk]), {'quantity': 0})
+        self.assertEqual(self.cart_lines(), [(self.powder, 1)])
+
+    def test_signed_in_cart_is_stored_in_database(self):
+        """Test that lines added before signing in move to the user's cart."""
+        user = User.objects.create_user('shopper', password='secret')
+        self.add(self.cone, 2)
+        self.client.login(username='shopper', password='secret')
+        self.add(self.cone)
+        self.add(self.powder)
+        self.assertEqual(
+            list(CartLine.objects.filter(user=user).values_list('product_id', 'quantity')),
+            [(self.cone.pk, 3), (self.powder.pk, 1)]
+        )
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(self.cart_lines(), [(self.cone, 3), (self.powder, 1)])
+
+
+class CartJsonTest(TestCase):
+    """Test suite for the JSON responses of the cart endpoints."""
+
+    def setUp(self):
+        """Set up a product in the cart."""
+        self.product = HennaProduct.objects.create(
+            name='Henna Cone', sku='HC1', description='Test', price=Decimal('4.00')
+        )
+        HennaProduct.objects.update(image='products/cone.jpeg')
+        self.client.post(reverse('add_to_cart', args=[self.product.pk]), {'quantity': 1})
+        # Drop the message queued by the redirecting request
+        self.client.get(reverse('home'))
+
+    def post(self, name, quantity):
+        return self.client.post(
+            reverse(name, args=[self.product.pk]), {'quantity': quantity},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+
+    def test_adjust_cart_returns_totals(self):
+        """Test that a quantity change answers with the line, totals and toast."""
+        response = self.post('adjust_cart', 3)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['quantity'], 3)
+        self.assertEqual(data['line_total'], '12.00')
+        self.assertEqual(data['total'], '12.00')
+        self.assertEqual(data['vat_amount'], '2.40')
+        self.assertEqual(data['product_count'], 3)
+        self.assertIn('Updated Henna Cone quantity to 3', data['mini_cart_html'])
+        # The message is in the response, not queued for the next page
+        response = self.client.get(reverse('home'))
+        self.assertEqual(list(response.context['messages']), [])
+
+    def test_add_to_cart_returns_json(self):
+        """Test that adding to the cart answers with JSON instead of a redirect."""
+        data = self.post('add_to_cart', 2).json()
+        self.assertEqual(data['quantity'], 3)
+        self.assertEqual(data['total'], '12.00')
+
+    def test_adjust_missing_line(self):
+        """Test that adjusting a product not in the cart returns 404."""
+        self.post('adjust_cart', 0)
+        self.assertEqual(self.post('adjust_cart', 2).status_code, 404)
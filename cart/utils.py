@@ -0,0 +1,116 @@
+from decimal import Decimal
+
+from django.conf import settings
+
+from checkout.totals import calculate_totals, cart_subtotal, free_delivery_delta, line_total
+from checkout.deliveries import get_delivery_rates
+from products.models import HennaProduct
+from products.pricing import price_products
+
+from .storage import get_cart, get_cart_store
+
+
+def get_cart_items(request):
+    """
+    Return the lines of the cart with their products, loaded with a single
+    `in_bulk` query and memoized on the request, so the context processor
+    and the views share one lookup. Lines whose product has been deleted
+    are dropped from the cart instead of raising a 404.
+    """
+    store = get_cart_store(request)
+    snapshot = tuple(store.cart.encode())
+    memo = getattr(request, '_cart_items', None)
+    if memo is not None and memo[0] == snapshot:
+        return memo[1]
+
+    product_ids = list(store.cart.ids)
+    products = HennaProduct.objects.with_pricing().in_bulk(product_ids) if product_ids else {}
+
+    cart_items = []
+    missing = []
+    for product_id, quantity, discounted_price in store.cart:
+        product = products.get(product_id)
+        if product is None:
+            missing.append(product_id)
+            continue
+
+        cart_items.append({
+            'item_id': str(product_id),
+            'quantity': quantity,
+            'product': product,
+            'discounted_price': discounted_price,
+            'subtotal': line_total(discounted_price, quantity),
+        })
+
+    if missing:
+        store.remove(missing)
+        snapshot = tuple(store.cart.encode())
+
+    request._cart_items = (snapshot, cart_items)
+    return cart_items
+
+
+def revalidate_cart_prices(request):
+    """
+    Reprice every cart line at the current time and store the new prices
+    of lines whose discount has started or ended since they were added.
+    The products loaded by `get_cart_items()` are priced together with
+    `price_products()`, so this costs no queries of its own, and the cart
+    is only written when a price changed. Returns the changed cart items.
+    """
+    cart_items = get_cart_items(request)
+    prices = price_products((item['product'].pk, item['product'].price) for item in cart_items)
+
+    changed = [
+        item for item in cart_items
+        if prices[item['product'].pk].price != item['discounted_price']
+    ]
+    if changed:
+        store = get_cart_store(request)
+        store.reprice({item['product'].pk: prices[item['product'].pk].price for item in changed})
+        for item in changed:
+            item['discounted_price'] = prices[item['product'].pk].price
+            item['subtotal'] = line_total(item['discounted_price'], item['quantity'])
+        # The loaded products still match the cart
+        request._cart_items = (tuple(store.cart.encode()), cart_items)
+    return changed
+
+
+def get_cart_totals(request):
+    """
+    Return the cart totals, worked out from the prices stored with the
+    cart lines so no products are loaded. VAT and delivery are only added
+    on the cart and checkout pages. Memoized on the request like
+    `get_cart_items()`.
+    """
+    cart = get_cart(request)
+    snapshot = tuple(cart.encode())
+    memo = getattr(request, '_cart_totals', None)
+    if memo is not None and memo[0] == snapshot:
+        return memo[1]
+
+    total, product_count = cart_subtotal(
+        (quantity, unit_price) for product_id, quantity, unit_price in cart
+    )
+
+    # Add VAT and delivery cost on cart or checkout pages
+    if request.path in ['/cart/', '/checkout/']:
+        calculations = calculate_totals(total, get_delivery_rates())
+        grand_total = calculations.grand_total_with_vat
+        vat_amount = calculations.vat_amount
+        delivery_cost = calculations.delivery_cost
+    else:
+        grand_total = total
+        vat_amount = delivery_cost = Decimal('0.00')
+
+    totals = {
+        'total': total,
+        'product_count': product_count,
+        'grand_total': grand_total,
+        'vat_amount': vat_amount,
+        'delivery_cost': delivery_cost,
+        'free_delivery_threshold': Decimal(settings.FREE_DELIVERY_THRESHOLD),
+        'free_delivery_delta': free_delivery_delta(total),
+    }
+    request._cart_totals = (snapshot, totals)
+    return totals
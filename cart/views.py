@@ -1,63 +1,87 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from decimal import Decimal
 from products.models import HennaProduct
 from django.http import JsonResponse
-from django.conf import settings
-from checkout.utils import calculate_delivery_cost_and_totals
+from django.template.loader import render_to_string
+from checkout.totals import calculate_totals, cart_subtotal
+from checkout.deliveries import get_delivery_rates
+from .storage import get_cart_store
+from .utils import get_cart_items, revalidate_cart_prices
+
+def get_cart_page_totals(cart_items):
+    """Return the Totals shown on the cart page, with the default delivery."""
+    subtotal, product_count = cart_subtotal(
+        (item['quantity'], item['discounted_price']) for item in cart_items
+    )
+    return calculate_totals(subtotal, get_delivery_rates())
+
 
 def view_cart(request):
     """Retrieve and display the shopping cart contents and calculate totals."""
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total = Decimal('0.00')
-
-    for item_id, item_data in cart.items():
-        quantity = item_data.get('quantity', 1)
-        discounted_price = Decimal(item_data.get('discounted_price', '0.00'))
-        product = get_object_or_404(HennaProduct, id=item_id)
-        subtotal = quantity * discounted_price
-
-        cart_items.append({
-            'product': product,
-            'quantity': quantity,
-            'discounted_price': discounted_price,
-            'subtotal': subtotal
-        })
-        total += subtotal
-
-    totals = calculate_delivery_cost_and_totals(total)
+    if revalidate_cart_prices(request):
+        messages.info(request, 'Some prices in your cart have changed since you added them.')
+    cart_items = get_cart_items(request)
+    totals = get_cart_page_totals(cart_items)
 
     return render(request, 'cart/cart.html', {
         'cart_items': cart_items,
-        'total': total,
-        'delivery': totals['delivery_cost'],
-        'vat_amount': totals['vat_amount'],
-        'grand_total': totals['grand_total_with_vat'],
-        'free_delivery_delta': totals['free_delivery_delta']
+        'total': totals.subtotal,
+        'delivery_cost': totals.delivery_cost,
+        'vat_amount': totals.vat_amount,
+        'grand_total': totals.grand_total_with_vat,
+        'free_delivery_delta': totals.free_delivery_delta
+    })
+
+def is_ajax(request):
+    """Return True for requests sent by the cart scripts, which expect JSON."""
+    return request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+
+def cart_update_response(request, item_id, message):
+    """
+    Return the JSON answer to a cart change: the changed line, the totals
+    shown on the cart page and the cart toast pre-rendered with `message`.
+    """
+    cart_items = get_cart_items(request)
+    totals = get_cart_page_totals(cart_items)
+    line = next((item for item in cart_items if item['product'].pk == item_id), None)
+
+    return JsonResponse({
+        'success': True,
+        'message': message,
+        'item_id': item_id,
+        'quantity': line['quantity'] if line else 0,
+        'line_total': f"{line['subtotal'] if line else 0:.2f}",
+        'total': f'{totals.subtotal:.2f}',
+        'product_count': sum(item['quantity'] for item in cart_items),
+        'delivery_cost': f'{totals.delivery_cost:.2f}',
+        'vat_amount': f'{totals.vat_amount:.2f}',
+        'grand_total': f'{totals.grand_total_with_vat:.2f}',
+        'free_delivery_delta': f'{totals.free_delivery_delta:.2f}',
+        'mini_cart_html': render_to_string(
+            'includes/toasts/toast_success.html', {'message': message}, request=request
+        ),
     })
 
+
 def add_to_cart(request, item_id):
     """Add a specified quantity of a product to the shopping cart with its discounted price."""
     product = get_object_or_404(HennaProduct, pk=item_id)
     quantity = int(request.POST.get('quantity', 1))
     redirect_url = request.POST.get('redirect_url', '/')
 
-    cart = request.session.setdefault('cart', {})
-    discounted_price = product.get_discounted_price()
-    str_item_id = str(item_id)
+    store = get_cart_store(request)
+    in_cart = item_id in store.cart
+    new_quantity = store.add(item_id, quantity, product.get_discounted_price())
 
-    if str_item_id in cart:
-        cart[str_item_id]['quantity'] += quantity
-        messages.success(request, f'Updated {product.name} quantity to {cart[str_item_id]["quantity"]}')
+    if in_cart:
+        message = f'Updated {product.name} quantity to {new_quantity}'
     else:
-        cart[str_item_id] = {
-            'quantity': quantity,
-            'discounted_price': str(discounted_price)
-        }
-        messages.success(request, f'Added {product.name} to your shopping cart.')
+        message = f'Added {product.name} to your shopping cart.'
 
-    request.session.modified = True
+    if is_ajax(request):
+        return cart_update_response(request, item_id, message)
+    messages.success(request, message)
     return redirect(redirect_url)
 
 def adjust_cart(request, item_id):
@@ -67,20 +91,26 @@ def adjust_cart(request, item_id):
 
     product = get_object_or_404(HennaProduct, pk=item_id)
     quantity = int(request.POST.get('quantity', 0))
-    str_item_id = str(item_id)
-    cart = request.session.get('cart', {})
-
-    if str_item_id in cart:
-        if quantity > 0:
-            cart[str_item_id]['quantity'] = quantity
-            messages.success(request, f'Updated {product.name} quantity to {quantity}')
-        else:
-            cart.pop(str_item_id)
-            messages.warning(request, f'Removed {product.name} from your shopping cart.')
-    else:
+    store = get_cart_store(request)
+
+    if item_id not in store.cart:
+        if is_ajax(request):
+            return JsonResponse({'error': 'Item not found in cart'}, status=404)
         messages.error(request, f'{product.name} was not found in your cart.')
+        return redirect('view_cart')
 
-    request.session['cart'] = cart
+    store.set(item_id, quantity)
+    if quantity > 0:
+        message = f'Updated {product.name} quantity to {quantity}'
+    else:
+        message = f'Removed {product.name} from your shopping cart.'
+
+    if is_ajax(request):
+        return cart_update_response(request, item_id, message)
+    if quantity > 0:
+        messages.success(request, message)
+    else:
+        messages.warning(request, message)
     return redirect('view_cart')
 
 def remove_from_cart(request, item_id):
@@ -89,13 +119,11 @@ def remove_from_cart(request, item_id):
         return JsonResponse({'error': 'Invalid request method'}, status=400)
 
     product = get_object_or_404(HennaProduct, pk=item_id)
-    str_item_id = str(item_id)
-    cart = request.session.get('cart', {})
+    store = get_cart_store(request)
 
-    if str_item_id in cart:
-        cart.pop(str_item_id)
+    if item_id in store.cart:
+        store.remove([item_id])
         messages.success(request, f'Removed {product.name} from your shopping cart.')
-        request.session['cart'] = cart
         return JsonResponse({'success': True, 'message': f'Removed {product.name} from your cart.'})
     else:
         messages.error(request, f'{product.name} was not found in your cart.')
@@ -0,0 +1,116 @@
+"""
+Process-local registry of delivery methods.
+
+The Delivery table holds a handful of rows that rarely change, so each
+process loads all of them once and answers lookups by id or name from
+memory. Saving or deleting a Delivery (see checkout.signals) bumps a
+shared stamp in the cache, and other processes reload when they see it
+change.
+
+Deliveries returned from the registry are shared between requests and
+must be treated as read-only.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Delivery
+
+STAMP_KEY = 'checkout:deliveries'
+# Seconds between checks of the shared stamp written by other processes
+STAMP_CHECK_INTERVAL = 1
+
+
+class DeliveryRegistry:
+    """Every delivery method by id, and the active ones by name."""
+
+    def __init__(self, deliveries):
+        self.deliveries = sorted(deliveries, key=lambda delivery: delivery.pk)
+        self.by_id = {delivery.pk: delivery for delivery in self.deliveries}
+        self.active = [delivery for delivery in self.deliveries if delivery.active]
+        # The first active method wins when names are reused
+        self.by_name = {delivery.name: delivery for delivery in reversed(self.active)}
+        self.rates = {name: delivery.cost for name, delivery in self.by_name.items()}
+
+    def get(self, delivery_id):
+        """Return the delivery with this id, or None."""
+        try:
+            return self.by_id.get(int(delivery_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_name(self, name):
+        """Return the active delivery with this name, or None."""
+        return self.by_name.get(name)
+
+
+_registry = None
+_stamp = None
+_stamp_checked = 0
+_lock = threading.Lock()
+
+
+def _current_stamp():
+    stamp = cache.get(STAMP_KEY)
+    if stamp is None:
+        cache.add(STAMP_KEY, 1, None)
+        stamp = cache.get(STAMP_KEY, 1)
+    return stamp
+
+
+def get_registry():
+    """Return this process's registry, reloading it after changes."""
+    global _registry, _stamp, _stamp_checked
+    registry = _registry
+    if registry is not None and time.monotonic() - _stamp_checked > STAMP_CHECK_INTERVAL:
+        _stamp_checked = time.monotonic()
+        if _current_stamp() != _stamp:
+            registry = None
+
+    if registry is None:
+        with _lock:
+            stamp = _current_stamp()
+            registry = DeliveryRegistry(Delivery.objects.all())
+            _registry, _stamp, _stamp_checked = registry, stamp, time.monotonic()
+    return registry
+
+
+def get_delivery(delivery_id):
+    """Return the delivery with this id, or None."""
+    return get_registry().get(delivery_id)
+
+
+def get_delivery_by_name(name):
+    """Return the active delivery with this name, or None."""
+    return get_registry().get_by_name(name)
+
+
+def get_active_deliveries():
+    """Return the active delivery methods in id order."""
+    return get_registry().active
+
+
+def get_delivery_rates():
+    """Return `{name: cost}` for the active delivery methods."""
+    return get_registry().rates
+
+
+def _reset():
+    global _registry
+    _registry = None
+    try:
+        cache.incr(STAMP_KEY)
+    except ValueError:
+        cache.add(STAMP_KEY, 1, None)
+        cache.incr(STAMP_KEY)
+
+
+def invalidate():
+    """
+    Drop the registry in this process and tell other processes to reload
+    theirs, again on commit so no one keeps rows that were rolled back.
+    """
+    _reset()
+    transaction.on_commit(_reset)
@@ -0,0 +1,168 @@
+"""
+A local stand-in for the PaymentIntents endpoints of the Stripe API, used by
+the tests and `manage.py benchmark_stripe`.
+
+Intents are kept in memory, every response can be delayed to simulate a
+slow Stripe and the next few requests can be made to fail. Like Stripe,
+it refuses to modify an intent that has been paid. Point the checkout at
+it with the `STRIPE_API_BASE` setting:
+
+    with FakeStripe(latency=0.2) as fake, override_settings(STRIPE_API_BASE=fake.url):
+        ...
+"""
+import json
+import re
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+INTENT_PATH = re.compile(r'^/v1/payment_intents(?:/(?P<id>[^/]+)(?P<cancel>/cancel)?)?$')
+
+
+def parse_params(body):
+    """Parse a Stripe form body, nesting `metadata[key]=value` pairs."""
+    params = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        name, _, nested = key.partition('[')
+        if nested:
+            params.setdefault(name, {})[nested.rstrip(']')] = value
+        else:
+            params[name] = value
+    return params
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections open so pooled clients can reuse them
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; don't let them wait on ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.respond('GET')
+
+    def do_POST(self):
+        self.respond('POST')
+
+    def respond(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        path = urlsplit(self.path).path
+        status, payload = self.server.fake.handle(
+            method, path, parse_params(body), self.headers.get('Idempotency-Key')
+        )
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a burst of concurrent connections from an async client
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before the response is written
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeStripe:
+    """
+    An in-memory PaymentIntents API served on a local port. Each response
+    is delayed by `latency` seconds and the next `failures` requests get a
+    500 error. `calls` records `(method, path)` and `idempotency_keys` the
+    Idempotency-Key header (or None) of every request received.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.failures = 0
+        self.intents = {}
+        self.calls = []
+        self.idempotency_keys = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, method, path, params, idempotency_key=None):
+        """Return `(status, payload)` for a request."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls.append((method, path))
+            self.idempotency_keys.append(idempotency_key)
+            if self.failures:
+                self.failures -= 1
+                return 500, {'error': {'type': 'api_error', 'message': 'Injected failure'}}
+            match = INTENT_PATH.match(path)
+            if match is None:
+                return 404, self.error(f'Unrecognized request URL ({method}: {path})')
+
+            pid = match['id']
+            if pid is None:
+                if method != 'POST':
+                    return 405, self.error('Listing is not supported')
+                return 200, self.create(params)
+
+            intent = self.intents.get(pid)
+            if intent is None:
+                return 404, self.error(f"No such payment_intent: '{pid}'", 'resource_missing')
+            if match['cancel']:
+                intent['status'] = 'canceled'
+            elif method == 'POST':
+                if intent['status'] in ('processing', 'succeeded'):
+                    return 400, self.error(
+                        'This PaymentIntent could not be updated because it has a status '
+                        f"of {intent['status']}.", 'payment_intent_unexpected_state'
+                    )
+                if 'amount' in params:
+                    intent['amount'] = int(params['amount'])
+                intent['metadata'].update(params.get('metadata', {}))
+            return 200, intent
+
+    def create(self, params):
+        pid = f'pi_{secrets.token_hex(12)}'
+        intent = {
+            'id': pid,
+            'object': 'payment_intent',
+            'amount': int(params['amount']),
+            'currency': params.get('currency', 'gbp').lower(),
+            'status': 'requires_payment_method',
+            'client_secret': f'{pid}_secret_{secrets.token_hex(12)}',
+            'metadata': params.get('metadata', {}),
+            'livemode': False,
+        }
+        self.intents[pid] = intent
+        return intent
+
+    def error(self, message, code=None):
+        return {'error': {'type': 'invalid_request_error', 'message': message, 'code': code}}
@@ -1,6 +1,7 @@
 from django import forms
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from .deliveries import get_delivery_by_name
 from .models import Order, Delivery
 
 class OrderForm(forms.ModelForm):
@@ -51,20 +52,19 @@ class OrderForm(forms.ModelForm):
 
         # Get active delivery methods
         delivery_methods = Delivery.objects.filter(active=True)
+        free_delivery = get_delivery_by_name('Free Delivery')
+        standard_delivery = get_delivery_by_name('Standard Delivery')
 
         # Default to Standard Delivery
         if total_cost and total_cost >= settings.FREE_DELIVERY_THRESHOLD:
-            free_delivery = delivery_methods.filter(name='Free Delivery').first()
             if free_delivery:
                 self.fields['delivery_method'].initial = free_delivery.id
                 self.fields['delivery_method'].queryset = delivery_methods.filter(name='Free Delivery')
             else:
-                standard_delivery = delivery_methods.filter(name='Standard Delivery').first()
                 if standard_delivery:
                     self.fields['delivery_method'].initial = standard_delivery.id
                     self.fields['delivery_method'].queryset = delivery_methods
         else:
-            standard_delivery = delivery_methods.filter(name='Standard Delivery').first()
             if standard_delivery:
                 self.fields['delivery_method'].initial = standard_delivery.id
                 self.fields['delivery_method'].queryset = delivery_methods
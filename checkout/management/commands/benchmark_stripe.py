@@ -0,0 +1,70 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from checkout import payments
+from checkout.fake_stripe import FakeStripe
+
+
+class Command(BaseCommand):
+    """
+    Time PaymentIntent updates against a local fake Stripe with added
+    latency: blocking calls spread over a fixed number of threads, as with
+    sync workers, and async calls awaited together on one event loop. Then
+    defer one update per request, as delivery changes are, and flush them.
+    Nothing is sent to Stripe.
+    """
+    help = 'Benchmark blocking and async Stripe calls against a fake Stripe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Delivery updates to make (default 200).')
+        parser.add_argument('--latency', type=float, default=0.1,
+                            help='Seconds the fake Stripe waits before answering (default 0.1).')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Threads for the blocking calls (default 4).')
+
+    def time(self, label, count, function):
+        started = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - started
+        self.stdout.write(f'{label:<28}{seconds:.3f}s ({count / seconds:.0f}/s)')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        metadata = {'delivery_method_id': '1'}
+
+        with FakeStripe(latency=options['latency']) as fake, \
+                override_settings(STRIPE_API_BASE=fake.url, STRIPE_SECRET_KEY='sk_test_fake'):
+            pid = payments.create_intent(1000).id
+
+            def blocking():
+                with ThreadPoolExecutor(options['workers']) as pool:
+                    list(pool.map(
+                        lambda amount: payments.update_or_create_intent(pid, amount, metadata),
+                        range(1000, 1000 + count)
+                    ))
+
+            async def awaited():
+                await asyncio.gather(*(
+                    payments.aupdate_or_create_intent(pid, amount, metadata)
+                    for amount in range(1000, 1000 + count)
+                ))
+
+            self.time(f'Blocking ({options["workers"]} threads)', count, blocking)
+            self.time('Async (one event loop)', count, lambda: asyncio.run(awaited()))
+            self.stdout.write(f'Fake Stripe answered {len(fake.calls)} requests')
+
+            def deferred():
+                # A dict stands in for the customer's session
+                session = {}
+                for amount in range(2000, 2000 + count):
+                    payments.defer_update(session, pid, amount, metadata)
+                payments.flush_update(session, pid)
+
+            fake.calls.clear()
+            self.time('Deferred, one flush', count, deferred)
+            self.stdout.write(f'Deferred updates sent {len(fake.calls)} request(s)')
@@ -0,0 +1,68 @@
+import gc
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from checkout import totals
+from checkout.totals import calculate_totals, cart_subtotal, to_minor_units
+
+
+class Command(BaseCommand):
+    """
+    Time the totals engine on synthetic carts: cart subtotals, totals with
+    a cold and a warm memo, and conversion to Stripe minor units. Nothing
+    is read from or written to the database.
+    """
+    help = 'Benchmark the order totals engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=50000,
+                            help='Synthetic carts to total (default 50000).')
+        parser.add_argument('--lines', type=int, default=4,
+                            help='Lines per cart (default 4).')
+
+    def time(self, label, count, function):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - started
+        finally:
+            gc.enable()
+        self.stdout.write(f'{label:<28}{seconds:.3f}s ({count / seconds:.0f}/s)')
+        return result
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        count = options['carts']
+        rates = {totals.STANDARD_DELIVERY: Decimal('4.99'), totals.FREE_DELIVERY: Decimal('0.00')}
+        carts = [
+            [(rng.randint(1, 5), Decimal(rng.randint(99, 4000)) / 100)
+             for _ in range(options['lines'])]
+            for _ in range(count)
+        ]
+
+        subtotals = self.time(
+            'Cart subtotals', count,
+            lambda: [cart_subtotal(lines)[0] for lines in carts]
+        )
+        totals._totals.cache_clear()
+        self.time(
+            'Totals (cold memo)', count,
+            lambda: [calculate_totals(subtotal, rates) for subtotal in subtotals]
+        )
+        # Pages showing the same cart total it again, so most lookups repeat
+        repeated = subtotals[:1000] * (count // 1000 or 1)
+        results = self.time(
+            'Totals (warm memo)', len(repeated),
+            lambda: [calculate_totals(subtotal, rates) for subtotal in repeated]
+        )
+        self.time(
+            'Stripe minor units', count,
+            lambda: [to_minor_units(result.grand_total_with_vat) for result in results]
+        )
+        info = totals._totals.cache_info()
+        self.stdout.write(f'Memo: {info.currsize} entries, {info.hits} hits, {info.misses} misses')
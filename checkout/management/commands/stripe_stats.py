@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from checkout.payments import LATENCY_BUCKETS, OPERATIONS, get_stripe_stats
+
+
+class Command(BaseCommand):
+    help = 'Show call, error and latency counters for each Stripe operation.'
+
+    def handle(self, *args, **options):
+        for operation in OPERATIONS:
+            stats = get_stripe_stats(operation)
+            average = stats['ms'] / stats['calls'] if stats['calls'] else 0
+            self.stdout.write(
+                f"{operation}: {stats['calls']} calls, {stats['errors']} errors, "
+                f'{average:.0f} ms average'
+            )
+            buckets = ', '.join(
+                f'<= {bound} ms: {stats["buckets"][bound]}' for bound in LATENCY_BUCKETS
+            )
+            self.stdout.write(f"  {buckets}, slower: {stats['buckets']['more']}")
@@ -7,6 +7,7 @@ from django.db.models import Sum, F, DecimalField
 from django_countries.fields import CountryField
 from products.models import HennaProduct
 from profiles.models import UserProfile
+from .totals import calculate_totals
 
 
 class Delivery(models.Model):
@@ -59,37 +60,40 @@ class Order(models.Model):
         """
         return uuid.uuid4().hex.upper()
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, update_total=True, **kwargs):
         """
         Override the save method to assign an order number if it hasn't been set already.
+        Pass `update_total=False` when the totals have already been set.
         """
         if not self.order_number:
             self.order_number = self._generate_order_number()
         super().save(*args, **kwargs)  # Save the order first
-        self.update_total()  # Then update totals after saving
+        if update_total:
+            self.update_total()  # Then update totals after saving
 
-    def update_total(self):
+    def set_totals(self, order_total):
         """
-        Update the grand total for the order, considering VAT, discounts, and delivery costs.
+        Set VAT, delivery and grand totals from the total of the order's items.
         """
-        # Calculate the total price of all items, factoring in their quantities
-        self.order_total = self.orderitems.aggregate(
-            total=Sum(F('price_at_order') * F('quantity'), output_field=DecimalField())
-        )['total'] or Decimal('0.00')
-
         # Fetch delivery cost if method is selected
         if self.delivery_method:
             self.delivery_cost = self.delivery_method.cost
 
-        # Calculate VAT (Assuming a VAT_RATE constant in settings)
-        vat_rate = Decimal(settings.VAT_RATE)
-        self.vat_amount = (self.order_total * vat_rate).quantize(Decimal('0.01'))
-
-        # Calculate grand total (order total + delivery cost)
-        self.grand_total = self.order_total + self.delivery_cost
+        # VAT, grand total (order total + delivery cost) and grand total including VAT
+        totals = calculate_totals(order_total, delivery_cost=self.delivery_cost)
+        self.order_total = totals.subtotal
+        self.vat_amount = totals.vat_amount
+        self.grand_total = totals.grand_total
+        self.grand_total_with_vat = totals.grand_total_with_vat
 
-        # Calculate grand total including VAT
-        self.grand_total_with_vat = (self.grand_total + self.vat_amount).quantize(Decimal('0.01'))
+    def update_total(self):
+        """
+        Update the grand total for the order, considering VAT, discounts, and delivery costs.
+        """
+        # Calculate the total price of all items, factoring in their quantities
+        self.set_totals(self.orderitems.aggregate(
+            total=Sum(F('price_at_order') * F('quantity'), output_field=DecimalField())
+        )['total'] or Decimal('0.00'))
 
         # Save changes to the totals
         super().save(update_fields=['order_total', 'grand_total', 'vat_amount', 'grand_total_with_vat', 'delivery_cost'])
@@ -0,0 +1,36 @@
+"""
+Building orders and their line items in a fixed number of queries.
+"""
+from django.db import transaction
+
+from products.pricing import price_products
+
+from .models import OrderItem
+from .totals import cart_subtotal
+
+
+@transaction.atomic
+def build_order(order, lines):
+    """
+    Save an unsaved `order` with an OrderItem for each `(product, quantity)`
+    line and return it.
+
+    Lines are priced together with `price_products()` and the items are
+    written with one `bulk_create`, which sends no signals, so the totals
+    are worked out once here instead of by `Order.update_total()` after
+    every item.
+    """
+    lines = list(lines)
+    prices = price_products((product.pk, product.price) for product, quantity in lines)
+    items = [
+        OrderItem(order=order, product=product, quantity=quantity,
+                  price_at_order=prices[product.pk].price)
+        for product, quantity in lines
+    ]
+    order_total, product_count = cart_subtotal(
+        (item.quantity, item.price_at_order) for item in items
+    )
+    order.set_totals(order_total)
+    order.save(update_total=False)
+    OrderItem.objects.bulk_create(items)
+    return order
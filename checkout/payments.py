@@ -0,0 +1,501 @@
+"""
+PaymentIntent calls made by the checkout views and the webhook handler.
+
+All calls go through StripeClients built once per process from the
+settings: each keeps a pool of open connections on httpx, bounds every
+request by `STRIPE_CONNECT_TIMEOUT` and `STRIPE_TIMEOUT`, and retries
+connection errors and retryable responses up to `STRIPE_MAX_RETRIES`
+times with jittered exponential backoff. Creates and updates carry an
+idempotency key, shared by the retries of the call, so a retry never
+makes a second intent. The latency of each operation is counted in the
+cache (see `get_stripe_stats` and `manage.py stripe_stats`).
+
+The last known state of each PaymentIntent is kept in the cache, updated
+from our own create and modify responses and from webhooks, and used to
+skip calls: an intent it shows as reusable at the current amount is
+reused without asking Stripe, one it shows cannot be reused is replaced,
+and an amount or metadata it already holds is not sent again. An intent
+that has been paid, or is being paid, is never modified. Changes that
+can wait until the customer pays, like picking a delivery method, are
+deferred with `defer_update()` and sent once, if they change anything,
+by `flush_update()`. Deferred updates are kept in the customer's
+session, which every worker shares, rather than in a cache that may be
+process-local.
+
+Each flow has a blocking version for the WSGI views and an `a`-prefixed
+version for the async views, which also uses the async cache API.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# A PaymentIntent is reused on the checkout page if its amount is within
+# this fraction of the current total
+REUSE_TOLERANCE = 0.05
+
+# Statuses of an intent the customer has paid, which Stripe will not modify
+PAID_STATUSES = ('processing', 'succeeded')
+
+OPERATIONS = ('create', 'retrieve', 'modify', 'cancel')
+# Upper bounds of the latency buckets, in milliseconds
+LATENCY_BUCKETS = (100, 250, 500, 1000, 2500, 5000)
+
+# `metadata_hashes` holds a digest of each metadata value on the intent
+IntentState = namedtuple('IntentState', ('id', 'amount', 'status', 'client_secret', 'metadata_hashes'))
+# Client secrets are only used while the customer is checking out
+INTENT_STATE_TIMEOUT = 60 * 60 * 24
+# Session key of the update deferred until the customer pays
+PENDING_UPDATE_SESSION_KEY = 'payment_intent_update'
+
+_client = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def _build_client(http_client):
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        base_addresses={'api': settings.STRIPE_API_BASE},
+        http_client=http_client,
+        max_network_retries=settings.STRIPE_MAX_RETRIES,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(settings.STRIPE_TIMEOUT, connect=settings.STRIPE_CONNECT_TIMEOUT)
+
+
+def get_client():
+    """Return the process's StripeClient for blocking calls."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _build_client(
+                    stripe.HTTPXClient(timeout=_timeout(), allow_sync_methods=True)
+                )
+    return _client
+
+
+def get_async_client():
+    """
+    Return the StripeClient for the running event loop.
+
+    Pooled connections belong to the loop that opened them, so a new
+    client is made when the loop changes.
+    """
+    global _async_client
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client[0] is not loop:
+        _async_client = (loop, _build_client(stripe.HTTPXClient(timeout=_timeout())))
+    return _async_client[1]
+
+
+def reset_clients():
+    """Drop the clients so the next call builds them from the settings."""
+    global _client, _async_client
+    _client = _async_client = None
+
+
+def _count(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+
+
+async def _acount(key, delta=1):
+    try:
+        await cache.aincr(key, delta)
+    except ValueError:
+        await cache.aadd(key, 0, None)
+        await cache.aincr(key, delta)
+
+
+def _call_counters(operation, seconds, failed):
+    milliseconds = round(seconds * 1000)
+    bucket = next((bound for bound in LATENCY_BUCKETS if milliseconds <= bound), 'more')
+    counters = [
+        (f'stripe:{operation}:calls', 1),
+        (f'stripe:{operation}:ms', milliseconds),
+        (f'stripe:{operation}:le:{bucket}', 1),
+    ]
+    if failed:
+        counters.append((f'stripe:{operation}:errors', 1))
+    return counters
+
+
+def record_call(operation, seconds, failed=False):
+    """Count one call of a Stripe operation and how long it took."""
+    for key, delta in _call_counters(operation, seconds, failed):
+        _count(key, delta)
+
+
+async def arecord_call(operation, seconds, failed=False):
+    for key, delta in _call_counters(operation, seconds, failed):
+        await _acount(key, delta)
+
+
+def get_stripe_stats(operation):
+    """
+    Return the call, error and total millisecond counters of a Stripe
+    operation, with the number of calls in each latency bucket.
+    """
+    keys = [f'stripe:{operation}:{name}' for name in ('calls', 'errors', 'ms')]
+    buckets = [f'stripe:{operation}:le:{bound}' for bound in LATENCY_BUCKETS + ('more',)]
+    counters = cache.get_many(keys + buckets)
+    calls, errors, ms = (counters.get(key, 0) for key in keys)
+    return {
+        'calls': calls,
+        'errors': errors,
+        'ms': ms,
+        'buckets': {
+            bound: counters.get(key, 0)
+            for bound, key in zip(LATENCY_BUCKETS + ('more',), buckets)
+        },
+    }
+
+
+@contextmanager
+def _timed(operation):
+    started = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        record_call(operation, time.perf_counter() - started, failed)
+
+
+@asynccontextmanager
+async def _atimed(operation):
+    started = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        await arecord_call(operation, time.perf_counter() - started, failed)
+
+
+def _idempotent():
+    return {'idempotency_key': str(uuid.uuid4())}
+
+
+def metadata_hash(value):
+    """Return a digest of a PaymentIntent metadata value."""
+    return hashlib.md5(str(value).encode()).hexdigest()
+
+
+def intent_state_key(pid):
+    return f'stripe:intent:{pid}'
+
+
+def get_intent_state(pid):
+    """Return the last known IntentState of the PaymentIntent `pid`, or None."""
+    return cache.get(intent_state_key(pid))
+
+
+async def aget_intent_state(pid):
+    return await cache.aget(intent_state_key(pid))
+
+
+def _intent_state(intent, previous):
+    client_secret = intent.get('client_secret')
+    if client_secret is None:
+        # Kept from an earlier response if this one leaves it out
+        client_secret = getattr(previous, 'client_secret', None)
+    hashes = {key: metadata_hash(value) for key, value in (intent.get('metadata') or {}).items()}
+    return IntentState(intent['id'], intent['amount'], intent['status'], client_secret, hashes)
+
+
+def remember_intent(intent):
+    """
+    Store the state of a PaymentIntent returned by Stripe, or sent to a
+    webhook, and return it.
+    """
+    previous = get_intent_state(intent['id']) if intent.get('client_secret') is None else None
+    state = _intent_state(intent, previous)
+    cache.set(intent_state_key(state.id), state, INTENT_STATE_TIMEOUT)
+    return state
+
+
+async def aremember_intent(intent):
+    previous = await aget_intent_state(intent['id']) if intent.get('client_secret') is None else None
+    state = _intent_state(intent, previous)
+    await cache.aset(intent_state_key(state.id), state, INTENT_STATE_TIMEOUT)
+    return state
+
+
+def known_client_secret(pid):
+    """Return the client secret of the PaymentIntent `pid` if it is known."""
+    state = get_intent_state(pid)
+    return state.client_secret if state is not None else None
+
+
+async def aknown_client_secret(pid):
+    state = await aget_intent_state(pid)
+    return state.client_secret if state is not None else None
+
+
+def get_client_secret(pid):
+    """
+    Return the client secret of the PaymentIntent `pid`, retrieving the
+    intent if the secret is not known.
+    """
+    return known_client_secret(pid) or remember_intent(retrieve_intent(pid)).client_secret
+
+
+async def aget_client_secret(pid):
+    return (await aknown_client_secret(pid)
+            or (await aremember_intent(await aretrieve_intent(pid))).client_secret)
+
+
+def _pending_update(pid, amount, metadata):
+    return {'pid': pid, 'amount': amount, 'metadata': metadata}
+
+
+def defer_update(session, pid, amount, metadata):
+    """
+    Set the amount and metadata to send to the PaymentIntent `pid` at the
+    next `flush_update()` of `session`, replacing any update deferred
+    before.
+    """
+    session[PENDING_UPDATE_SESSION_KEY] = _pending_update(pid, amount, metadata)
+
+
+async def adefer_update(session, pid, amount, metadata):
+    await session.aset(PENDING_UPDATE_SESSION_KEY, _pending_update(pid, amount, metadata))
+
+
+def discard_update(session):
+    """Drop the update deferred in `session`."""
+    session.pop(PENDING_UPDATE_SESSION_KEY, None)
+
+
+def _pending_changes(pending, pid, metadata):
+    # An update deferred for an intent the session has since replaced is ignored
+    if pending is None or pending['pid'] != pid:
+        return None, metadata
+    return pending['amount'], {**pending['metadata'], **(metadata or {})}
+
+
+def _changes(state, amount, metadata):
+    """
+    Return the modify parameters for the `amount` and `metadata` values
+    that differ from the known state.
+    """
+    params = {}
+    if amount is not None and (state is None or state.amount != amount):
+        params['amount'] = amount
+    # Stripe merges metadata, so only the values being set are compared
+    if metadata is not None and (state is None or any(
+        value is not None and state.metadata_hashes.get(key) != metadata_hash(value)
+        for key, value in metadata.items()
+    )):
+        params['metadata'] = metadata
+    return params
+
+
+def _create_params(amount):
+    return {
+        'amount': amount,
+        'currency': settings.STRIPE_CURRENCY,
+        'automatic_payment_methods': {'enabled': True},
+        'metadata': {'initiated_from': 'checkout_page'},
+    }
+
+
+def _is_reusable(intent, amount):
+    return (intent.client_secret and intent.status == 'requires_payment_method'
+            and abs(intent.amount - amount) <= amount * REUSE_TOLERANCE)
+
+
+def create_intent(amount):
+    """
+    Create a PaymentIntent with standard settings. Preserves Stripe's
+    automatic payment methods feature.
+    """
+    params = _create_params(amount)
+    with _timed('create'):
+        intent = get_client().payment_intents.create(params, _idempotent())
+    return remember_intent(intent)
+
+
+def retrieve_intent(pid):
+    """Return the PaymentIntent `pid` as Stripe has it."""
+    with _timed('retrieve'):
+        return get_client().payment_intents.retrieve(pid)
+
+
+def modify_intent(pid, **params):
+    with _timed('modify'):
+        intent = get_client().payment_intents.update(pid, params, _idempotent())
+    return remember_intent(intent)
+
+
+def _is_settled(state, params):
+    # Nothing to send, or nothing Stripe would still accept
+    return state is not None and state.client_secret and (
+        not params or state.status in PAID_STATUSES
+    )
+
+
+def update_intent(pid, amount=None, metadata=None):
+    """
+    Set the amount and metadata of the PaymentIntent `pid` and return its
+    state. Stripe is not called when nothing changes or when the known
+    state shows the intent has been paid.
+    """
+    state = get_intent_state(pid)
+    params = _changes(state, amount, metadata)
+    if _is_settled(state, params):
+        return state
+    return modify_intent(pid, **params)
+
+
+def cancel_intent(pid):
+    """Cancel a PaymentIntent, ignoring one that has already finished."""
+    try:
+        with _timed('cancel'):
+            intent = get_client().payment_intents.cancel(pid)
+        remember_intent(intent)
+    except stripe.error.StripeError as e:
+        logger.warning('Error canceling PaymentIntent %s: %s', pid, e)
+
+
+def checkout_intent(pid, amount):
+    """
+    Return the state of the PaymentIntent `pid` if it can still take a
+    payment of about `amount`, otherwise of a new one. A known state for
+    exactly `amount` is trusted, so reloading the page costs no calls;
+    otherwise the intent is retrieved before it is reused, unless its
+    known state already rules it out.
+    """
+    if pid:
+        try:
+            state = get_intent_state(pid)
+            if state is not None and _is_reusable(state, amount) and state.amount == amount:
+                return state
+            if state is None or _is_reusable(state, amount):
+                state = remember_intent(retrieve_intent(pid))
+                if _is_reusable(state, amount):
+                    return state
+        except stripe.error.StripeError:
+            pass
+    return create_intent(amount)
+
+
+def update_or_create_intent(pid, amount, metadata):
+    """
+    Bring the PaymentIntent `pid` up to `amount` and `metadata` and return
+    its state, or create a new one if it cannot be modified. Called after
+    the customer has paid in the browser, so the intent is retrieved first
+    unless its known state already shows it paid, and a paid intent is
+    returned as it is.
+    """
+    if pid:
+        try:
+            state = get_intent_state(pid)
+            if state is None or state.status not in PAID_STATUSES:
+                remember_intent(retrieve_intent(pid))
+            return update_intent(pid, amount, metadata)
+        except stripe.error.StripeError:
+            pass
+    return create_intent(amount)
+
+
+def flush_update(session, pid, metadata=None):
+    """
+    Send the update deferred in `session` for the PaymentIntent `pid`,
+    with `metadata` added, and return its state. Called right before
+    payment; Stripe is only called if the update changes the intent. The
+    update stays deferred if Stripe fails.
+    """
+    amount, metadata = _pending_changes(session.get(PENDING_UPDATE_SESSION_KEY), pid, metadata)
+    state = update_intent(pid, amount, metadata)
+    discard_update(session)
+    return state
+
+
+async def acreate_intent(amount):
+    params = _create_params(amount)
+    async with _atimed('create'):
+        intent = await get_async_client().payment_intents.create_async(params, _idempotent())
+    return await aremember_intent(intent)
+
+
+async def aretrieve_intent(pid):
+    async with _atimed('retrieve'):
+        return await get_async_client().payment_intents.retrieve_async(pid)
+
+
+async def amodify_intent(pid, **params):
+    async with _atimed('modify'):
+        intent = await get_async_client().payment_intents.update_async(pid, params, _idempotent())
+    return await aremember_intent(intent)
+
+
+async def aupdate_intent(pid, amount=None, metadata=None):
+    state = await aget_intent_state(pid)
+    params = _changes(state, amount, metadata)
+    if _is_settled(state, params):
+        return state
+    return await amodify_intent(pid, **params)
+
+
+async def acancel_intent(pid):
+    try:
+        async with _atimed('cancel'):
+            intent = await get_async_client().payment_intents.cancel_async(pid)
+        await aremember_intent(intent)
+    except stripe.error.StripeError as e:
+        logger.warning('Error canceling PaymentIntent %s: %s', pid, e)
+
+
+async def acheckout_intent(pid, amount):
+    if pid:
+        try:
+            state = await aget_intent_state(pid)
+            if state is not None and _is_reusable(state, amount) and state.amount == amount:
+                return state
+            if state is None or _is_reusable(state, amount):
+                state = await aremember_intent(await aretrieve_intent(pid))
+                if _is_reusable(state, amount):
+                    return state
+        except stripe.error.StripeError:
+            pass
+    return await acreate_intent(amount)
+
+
+async def aupdate_or_create_intent(pid, amount, metadata):
+    if pid:
+        try:
+            state = await aget_intent_state(pid)
+            if state is None or state.status not in PAID_STATUSES:
+                await aremember_intent(await aretrieve_intent(pid))
+            return await aupdate_intent(pid, amount, metadata)
+        except stripe.error.StripeError:
+            pass
+    return await acreate_intent(amount)
+
+
+async def aflush_update(session, pid, metadata=None):
+    pending = await session.aget(PENDING_UPDATE_SESSION_KEY)
+    amount, metadata = _pending_changes(pending, pid, metadata)
+    state = await aupdate_intent(pid, amount, metadata)
+    await session.apop(PENDING_UPDATE_SESSION_KEY, None)
+    return state
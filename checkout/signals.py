@@ -1,6 +1,8 @@
+from django.core.signals import setting_changed
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import OrderItem
+from .models import Delivery, OrderItem
+from . import deliveries, payments
 
 @receiver(post_save, sender=OrderItem)
 def update_on_save(sender, instance, created, **kwargs):
@@ -15,3 +17,19 @@ def update_on_delete(sender, instance, **kwargs):
     Update order total on lineitem delete
     """
     instance.order.update_total()
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def invalidate_delivery_registry(sender, **kwargs):
+    """
+    Reload delivery methods in every process after a change
+    """
+    deliveries.invalidate()
+
+@receiver(setting_changed)
+def reset_stripe_clients(setting, **kwargs):
+    """
+    Rebuild the Stripe clients when their settings change in tests
+    """
+    if setting.startswith('STRIPE_'):
+        payments.reset_clients()
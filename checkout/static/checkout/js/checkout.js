@@ -72,10 +72,22 @@ document.addEventListener('DOMContentLoaded', function () {
         // Get the PaymentIntent ID from the client secret
         const paymentIntentId = clientSecret.split('_secret')[0];
         
-        // Create PaymentMethod and confirm payment
-        stripe.createPaymentMethod({
-            type: 'card',
-            card: card,
+        // Send the checkout data and the chosen delivery to the PaymentIntent,
+        // then create the PaymentMethod and confirm payment
+        const cacheData = {
+            'csrfmiddlewaretoken': $('input[name="csrfmiddlewaretoken"]').val(),
+            'client_secret': clientSecret,
+            'save_info': $('#id-save-info').is(':checked'),
+        };
+        $.post('/checkout/cache_checkout_data/', cacheData).then(function () {
+            return stripe.createPaymentMethod({
+                type: 'card',
+                card: card,
+            });
+        }, function () {
+            // The error message is shown on the reloaded page
+            location.reload();
+            return new Promise(function () {});
         }).then(function(pmResult) {
             if (pmResult.error) {
                 clearTimeout(paymentTimeout);
@@ -157,7 +169,7 @@ document.addEventListener('DOMContentLoaded', function () {
         // Disable the submit button during update
         $('#submit-button').attr('disabled', true).html('<i class="fas fa-spinner fa-spin"></i> Updating...');
 
-        // Fetch updated delivery details and update PaymentIntent
+        // Fetch updated delivery details; the PaymentIntent is updated on payment
         $.ajax({
             url: `/checkout/update-delivery/${deliveryMethodId}/`,
             method: 'POST',
@@ -173,8 +185,8 @@ document.addEventListener('DOMContentLoaded', function () {
                 grandTotalField.textContent = `£${data.grand_total_with_vat.toFixed(2)}`;
                 grandTotalToPayField.textContent = `£${data.grand_total_with_vat.toFixed(2)}`;
     
-                // Update Stripe elements with new client secret
-                if (data.client_secret) {
+                // Update Stripe elements if there is a new client secret
+                if (data.client_secret && data.client_secret !== clientSecret) {
                     clientSecret = data.client_secret;
                     $("input[name='client_secret']").val(data.client_secret);
 
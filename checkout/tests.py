@@ -1,3 +1,376 @@
-from django.test import TestCase
+import json
+import re
+import time
+from decimal import Decimal
+from importlib import import_module
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from cart.storage import get_cart_store
+from cart.views import view_cart
+from products.models import HennaProduct
+
+import stripe
+
+from . import deliveries, payments, views
+from .fake_stripe import FakeStripe
+from .webhook_handler import StripeWH_Handler
+from .models import Delivery, Order, OrderItem
+from .orders import build_order
+from .totals import STANDARD_DELIVERY, calculate_totals, cart_subtotal, to_minor_units
+
+
+class TotalsTest(SimpleTestCase):
+    """Test suite for the order totals engine."""
+
+    rates = {STANDARD_DELIVERY: Decimal('3.50')}
+
+    def test_default_delivery_below_threshold(self):
+        """Test that the standard rate applies below the free delivery threshold."""
+        totals = calculate_totals(Decimal('20.00'), self.rates)
+        self.assertEqual(totals.delivery_cost, Decimal('3.50'))
+        self.assertEqual(totals.delivery_name, STANDARD_DELIVERY)
+        self.assertEqual(totals.vat_amount, Decimal('4.00'))
+        self.assertEqual(totals.grand_total, Decimal('23.50'))
+        self.assertEqual(totals.grand_total_with_vat, Decimal('27.50'))
+        self.assertEqual(totals.free_delivery_delta, Decimal('30.00'))
+        self.assertEqual(totals.stripe_total, 2750)
+
+    def test_free_delivery_above_threshold(self):
+        """Test that delivery is free from the threshold up."""
+        totals = calculate_totals(Decimal('50.00'), self.rates)
+        self.assertEqual(totals.delivery_cost, Decimal('0.00'))
+        self.assertEqual(totals.free_delivery_delta, Decimal('0.00'))
+
+    def test_rounding_is_half_up(self):
+        """Test that VAT and minor units round half up."""
+        subtotal, count = cart_subtotal([(1, Decimal('0.125')), (2, Decimal('1.00'))])
+        self.assertEqual((subtotal, count), (Decimal('2.13'), 3))
+        self.assertEqual(calculate_totals(Decimal('0.03'), delivery_cost=0).vat_amount,
+                         Decimal('0.01'))
+        self.assertEqual(to_minor_units(Decimal('0.005')), 1)
+
+
+class OrderTotalsTest(TestCase):
+    """Test suite for order totals."""
+
+    def test_update_total_matches_engine(self):
+        """Test that an order's totals are the ones checkout charges."""
+        product = HennaProduct.objects.create(
+            name='Henna Cone', sku='HC1', description='Test', price=Decimal('4.99')
+        )
+        order = Order.objects.create(
+            full_name='Test', email='test@example.com', phone_number='1',
+            street_address1='1 Street', town_or_city='Town', postcode='AB1',
+            country='GB', delivery_cost=Decimal('3.50'),
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=3)
+        order.update_total()
+        expected = calculate_totals(Decimal('14.97'), delivery_cost=Decimal('3.50'))
+        self.assertEqual(order.vat_amount, expected.vat_amount)
+        self.assertEqual(order.grand_total_with_vat, expected.grand_total_with_vat)
+
+
+class DeliveryRegistryTest(TestCase):
+    """Test suite for the process-local delivery registry."""
+
+    def setUp(self):
+        """Set up delivery methods."""
+        self.standard = Delivery.objects.create(
+            company_name='Royal Mail', name='Standard Delivery', details='Test',
+            cost=Decimal('3.50'), estimated_delivery_time='3 days',
+        )
+        Delivery.objects.create(
+            company_name='Royal Mail', name='Express Delivery', details='Test',
+            cost=Decimal('7.00'), estimated_delivery_time='1 day', active=False,
+        )
+
+    def test_lookups_do_not_query(self):
+        """Test that lookups are answered from memory once loaded."""
+        deliveries.get_registry()
+        with self.assertNumQueries(0):
+            self.assertEqual(deliveries.get_delivery(self.standard.pk), self.standard)
+            self.assertEqual(deliveries.get_delivery_by_name('Standard Delivery'), self.standard)
+            self.assertIsNone(deliveries.get_delivery_by_name('Express Delivery'))
+            self.assertEqual(deliveries.get_delivery_rates(), {'Standard Delivery': Decimal('3.50')})
+
+    def test_saving_reloads_registry(self):
+        """Test that changing a delivery method is seen by the next lookup."""
+        deliveries.get_registry()
+        self.standard.cost = Decimal('4.00')
+        self.standard.save()
+        self.assertEqual(deliveries.get_delivery_rates()['Standard Delivery'], Decimal('4.00'))
+        self.standard.delete()
+        self.assertEqual(deliveries.get_delivery_rates(), {})
+
+
+class BuildOrderTest(TestCase):
+    """Test suite for building orders with their line items."""
+
+    def setUp(self):
+        """Set up products to order."""
+        HennaProduct.objects.bulk_create(
+            HennaProduct(name=f'Henna Cone {index}', sku=f'HC{index}', description='Test',
+                         price=Decimal('2.50'))
+            for index in range(30)
+        )
+        self.products = list(HennaProduct.objects.order_by('pk'))
+
+    def build(self, products):
+        order = Order(
+            full_name='Test', email='test@example.com', phone_number='1',
+            street_address1='1 Street', town_or_city='Town', postcode='AB1',
+            country='GB', delivery_cost=Decimal('3.50'),
+        )
+        return build_order(order, [(product, 2) for product in products])
+
+    def test_query_count_does_not_grow_with_lines(self):
+        """Test that an order costs the same queries for any number of lines."""
+        # Load the discount timeline first
+        self.build(self.products[:1])
+        with self.assertNumQueries(4):
+            self.build(self.products[:2])
+        with self.assertNumQueries(4):
+            order = self.build(self.products)
+        self.assertEqual(order.orderitems.count(), 30)
+        self.assertEqual(order.order_total, Decimal('150.00'))
+        self.assertEqual(order.grand_total_with_vat, Decimal('183.50'))
+
+        order.update_total()
+        self.assertEqual(order.grand_total_with_vat, Decimal('183.50'))
+
+
+class AsyncCheckoutTest(TestCase):
+    """Test suite for the async checkout views against a fake Stripe."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = FakeStripe().start()
+        cls.addClassCleanup(cls.stripe.stop)
+
+    def setUp(self):
+        """Set up a cart with one product and a delivery method."""
+        override = self.settings(STRIPE_API_BASE=self.stripe.url,
+                                 STRIPE_SECRET_KEY='sk_test_fake', STRIPE_TIMEOUT=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        product = HennaProduct.objects.create(
+            name='Henna Cone', sku='HC1', description='Test', price=Decimal('20.00'),
+        )
+        self.standard = Delivery.objects.create(
+            company_name='Royal Mail', name='Standard Delivery', details='Test',
+            cost=Decimal('3.50'), estimated_delivery_time='3 days',
+        )
+        self.express = Delivery.objects.create(
+            company_name='Royal Mail', name='Express Delivery', details='Test',
+            cost=Decimal('7.00'), estimated_delivery_time='1 day',
+        )
+        cache.clear()
+        self.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        get_cart_store(self.request('get', '/')).add(product.pk, 1, product.price)
+        self.stripe.calls.clear()
+
+    def request(self, method, path, data=None):
+        request = getattr(RequestFactory(), method)(path, data or {})
+        request.session = self.session
+        request.user = AnonymousUser()
+        request._messages = FallbackStorage(request)
+        return request
+
+    def update_delivery(self, delivery):
+        request = self.request('post', f'/checkout/update-delivery/{delivery.pk}/')
+        return async_to_sync(views.update_delivery_async)(request, delivery.pk)
+
+    def cache_checkout_data(self, pid):
+        request = self.request('post', '/checkout/cache_checkout_data/',
+                               {'client_secret': f'{pid}_secret_test'})
+        return async_to_sync(views.cache_checkout_data_async)(request)
+
+    def test_delivery_changes_are_sent_on_payment(self):
+        """Test that delivery changes are coalesced into one update before payment."""
+        response = self.update_delivery(self.standard)
+        self.assertEqual(response.status_code, 200)
+        pid = self.session['payment_intent_id']
+        self.assertEqual(self.stripe.intents[pid]['amount'], 2750)
+
+        for delivery in (self.express, self.standard, self.express):
+            response = self.update_delivery(delivery)
+        self.assertEqual(json.loads(response.content)['grand_total_with_vat'], 31.0)
+        self.assertEqual(self.stripe.calls, [('POST', '/v1/payment_intents')])
+        self.assertEqual(self.stripe.intents[pid]['amount'], 2750)
+
+        self.assertEqual(self.cache_checkout_data(pid).status_code, 200)
+        self.assertEqual(self.stripe.calls[1:], [('POST', f'/v1/payment_intents/{pid}')])
+        self.assertEqual(self.stripe.intents[pid]['amount'], 3100)
+        self.assertEqual(self.stripe.intents[pid]['metadata']['delivery_method_id'],
+                         str(self.express.pk))
+        self.assertIn('cart', self.stripe.intents[pid]['metadata'])
+
+    def test_cart_page_shows_the_amount_charged(self):
+        """Test that the cart page's grand total is the amount the PaymentIntent charges."""
+        # The cart page shows product images; skip generating variants
+        HennaProduct.objects.update(image='products/cone.jpeg')
+        response = view_cart(self.request('get', '/cart/'))
+        shown = re.findall(r'class="grand-total-value">£([\d.]+)<', response.content.decode())
+        views.checkout(self.request('get', '/checkout/'))
+        charged = self.stripe.intents[self.session['payment_intent_id']]['amount']
+        self.assertEqual(charged, 2750)
+        self.assertEqual(shown, ['27.50', '27.50'])
+
+    def test_checkout_reuses_intent(self):
+        """Test that reloading the checkout page reuses the intent without calling Stripe."""
+        response = async_to_sync(views.checkout_async)(self.request('get', '/checkout/'))
+        self.assertEqual(response.status_code, 200)
+        pid = self.session['payment_intent_id']
+        self.assertContains(response, self.stripe.intents[pid]['client_secret'])
+
+        self.stripe.calls.clear()
+        async_to_sync(views.checkout_async)(self.request('get', '/checkout/'))
+        self.assertEqual(self.stripe.calls, [])
+        self.assertEqual(self.session['payment_intent_id'], pid)
+
+        # Reported paid by a webhook, so it is replaced without asking Stripe
+        payments.remember_intent({**self.stripe.intents[pid], 'status': 'succeeded'})
+        async_to_sync(views.checkout_async)(self.request('get', '/checkout/'))
+        self.assertEqual(self.stripe.calls, [('POST', '/v1/payment_intents')])
+        self.assertNotEqual(self.session['payment_intent_id'], pid)
+
+    def test_unchanged_update_is_not_sent(self):
+        """Test that flushing an update the intent already has makes no Stripe call."""
+        self.update_delivery(self.express)
+        pid = self.session['payment_intent_id']
+        self.cache_checkout_data(pid)
+        self.assertEqual(self.stripe.intents[pid]['amount'], 3100)
+
+        self.update_delivery(self.express)
+        self.stripe.calls.clear()
+        self.assertEqual(self.cache_checkout_data(pid).status_code, 200)
+        self.assertEqual(self.stripe.calls, [])
+        self.assertNotIn(payments.PENDING_UPDATE_SESSION_KEY, self.session)
+
+    def test_paid_intent_is_kept_when_the_order_is_placed(self):
+        """Test that placing the order after payment neither modifies nor replaces the intent."""
+        self.update_delivery(self.express)
+        pid = self.session['payment_intent_id']
+        client_secret = self.stripe.intents[pid]['client_secret']
+        self.assertEqual(self.cache_checkout_data(pid).status_code, 200)
+        # Confirmed in the browser before the webhook arrives
+        self.stripe.intents[pid]['status'] = 'succeeded'
+
+        self.stripe.calls.clear()
+        request = self.request('post', '/checkout/', {
+            'full_name': 'Test', 'email': 'test@example.com', 'phone_number': '1',
+            'country': 'GB', 'postcode': 'AB1 2CD', 'town_or_city': 'Town',
+            'street_address1': '1 Street', 'delivery_method': self.express.pk,
+            'client_secret': client_secret, 'payment_intent_id': pid, 'save_info': 'on',
+        })
+        response = async_to_sync(views.checkout_async)(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stripe.calls, [('GET', f'/v1/payment_intents/{pid}')])
+        self.assertEqual(self.session['payment_intent_id'], pid)
+        self.assertEqual(Order.objects.get().stripe_pid, pid)
+
+    def test_checkout_page_discards_deferred_delivery(self):
+        """Test that reloading the checkout page drops an unsent delivery change."""
+        views.checkout(self.request('get', '/checkout/'))
+        pid = self.session['payment_intent_id']
+        request = self.request('post', f'/checkout/update-delivery/{self.express.pk}/')
+        self.assertEqual(views.update_delivery(request, self.express.pk).status_code, 200)
+        self.assertEqual(self.session[payments.PENDING_UPDATE_SESSION_KEY]['pid'], pid)
+
+        views.checkout(self.request('get', '/checkout/'))
+        self.assertNotIn(payments.PENDING_UPDATE_SESSION_KEY, self.session)
+
+    def test_deferred_delivery_does_not_depend_on_the_cache(self):
+        """Test that a delivery change is sent and answered when another worker's cache is empty."""
+        self.update_delivery(self.standard)
+        pid = self.session['payment_intent_id']
+        client_secret = self.stripe.intents[pid]['client_secret']
+
+        cache.clear()
+        response = self.update_delivery(self.express)
+        self.assertEqual(json.loads(response.content)['client_secret'], client_secret)
+        cache.clear()
+        self.assertEqual(self.cache_checkout_data(pid).status_code, 200)
+        self.assertEqual(self.stripe.intents[pid]['amount'], 3100)
+
+    def test_slow_stripe_times_out(self):
+        """Test that a Stripe call is abandoned after STRIPE_TIMEOUT."""
+        self.update_delivery(self.standard)
+        pid = self.session['payment_intent_id']
+        self.stripe.latency = 1
+        self.addCleanup(setattr, self.stripe, 'latency', 0)
+        with self.settings(STRIPE_TIMEOUT=0.2, STRIPE_MAX_RETRIES=0):
+            started = time.monotonic()
+            response = self.cache_checkout_data(pid)
+        self.assertEqual(response.status_code, 400)
+        self.assertLess(time.monotonic() - started, 1)
+        # The delivery change is sent on the next attempt
+        self.assertIn(payments.PENDING_UPDATE_SESSION_KEY, self.session)
+
+
+class StripeClientTest(SimpleTestCase):
+    """Test suite for the shared Stripe client against a fake Stripe."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = FakeStripe().start()
+        cls.addClassCleanup(cls.stripe.stop)
+
+    def setUp(self):
+        override = self.settings(STRIPE_API_BASE=self.stripe.url, STRIPE_SECRET_KEY='sk_test_fake')
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.stripe.calls.clear()
+        self.stripe.idempotency_keys.clear()
+
+    def test_retry_reuses_idempotency_key(self):
+        """Test that a failed create is retried with the same idempotency key."""
+        self.stripe.failures = 1
+        intent = payments.create_intent(1000)
+        self.assertEqual(self.stripe.intents[intent.id]['amount'], 1000)
+        self.assertEqual(self.stripe.calls, [('POST', '/v1/payment_intents')] * 2)
+        first, second = self.stripe.idempotency_keys
+        self.assertIsNotNone(first)
+        self.assertEqual(first, second)
+
+        payments.modify_intent(intent.id, amount=1200)
+        self.assertNotIn(self.stripe.idempotency_keys[-1], (None, first))
+
+    def test_latency_is_counted_per_operation(self):
+        """Test that calls, errors and latency are counted for each operation."""
+        intent = payments.create_intent(1000)
+        payments.retrieve_intent(intent.id)
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            payments.retrieve_intent('pi_missing')
+
+        async_to_sync(payments.aretrieve_intent)(intent.id)
+
+        self.assertEqual(payments.get_stripe_stats('create')['calls'], 1)
+        stats = payments.get_stripe_stats('retrieve')
+        self.assertEqual((stats['calls'], stats['errors']), (3, 1))
+        self.assertEqual(sum(stats['buckets'].values()), 3)
+        self.assertEqual(payments.get_stripe_stats('cancel')['calls'], 0)
+
+    def test_webhook_updates_known_state(self):
+        """Test that a succeeded intent reported by a webhook is not reused."""
+        intent = payments.create_intent(1000)
+        self.assertEqual(payments.checkout_intent(intent.id, 1000), intent)
+
+        payload = dict(self.stripe.intents[intent.id], status='succeeded')
+        StripeWH_Handler(None).handle_payment_intent_succeeded(
+            {'type': 'payment_intent.succeeded', 'data': {'object': payload}}
+        )
+        self.assertEqual(payments.get_intent_state(intent.id).status, 'succeeded')
+        self.stripe.calls.clear()
+        self.assertNotEqual(payments.checkout_intent(intent.id, 1000).id, intent.id)
+        self.assertEqual(self.stripe.calls, [('POST', '/v1/payment_intents')])
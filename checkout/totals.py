@@ -0,0 +1,102 @@
+"""
+Order totals: line totals, VAT, delivery, the free delivery delta and the
+amount charged through Stripe.
+
+Everything here is a pure function of its arguments. Delivery rates are
+passed in as a `{name: cost}` mapping (see `checkout.deliveries.get_delivery_rates`)
+and the VAT rate and free delivery threshold default to the settings, so
+the cart, checkout, the webhook handler and `Order.update_total()` all
+produce the same figures. Totals for a given subtotal and delivery cost
+are memoized.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+
+from django.conf import settings
+
+TWO_PLACES = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+STANDARD_DELIVERY = 'Standard Delivery'
+FREE_DELIVERY = 'Free Delivery'
+
+# `grand_total` is the subtotal plus delivery, as stored on Order;
+# `grand_total_with_vat` adds VAT and is the amount charged
+Totals = namedtuple('Totals', (
+    'subtotal', 'vat_amount', 'delivery_cost', 'delivery_name',
+    'grand_total', 'grand_total_with_vat', 'free_delivery_delta', 'stripe_total',
+))
+
+
+def money(amount):
+    """Round an amount to pence, half up."""
+    return Decimal(amount).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+def to_minor_units(amount):
+    """Return an amount in pence, as Stripe expects it."""
+    return int((Decimal(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def line_total(unit_price, quantity):
+    """Return the total of one line."""
+    return money(unit_price * quantity)
+
+
+def cart_subtotal(lines):
+    """
+    Return `(subtotal, product_count)` for `(quantity, unit_price)` lines.
+    """
+    subtotal, product_count = ZERO, 0
+    for quantity, unit_price in lines:
+        subtotal += unit_price * quantity
+        product_count += quantity
+    return money(subtotal), product_count
+
+
+def free_delivery_delta(subtotal, threshold=None):
+    """Return how much more must be spent to get free delivery."""
+    threshold = Decimal(settings.FREE_DELIVERY_THRESHOLD if threshold is None else threshold)
+    return threshold - subtotal if subtotal < threshold else ZERO
+
+
+def default_delivery(subtotal, rates, threshold=None):
+    """
+    Return `(name, cost)` of the delivery used until the customer picks
+    one: free above the threshold, otherwise the standard rate.
+    """
+    threshold = Decimal(settings.FREE_DELIVERY_THRESHOLD if threshold is None else threshold)
+    if subtotal >= threshold:
+        return FREE_DELIVERY, ZERO
+    return STANDARD_DELIVERY, rates.get(STANDARD_DELIVERY, ZERO)
+
+
+@lru_cache(maxsize=4096)
+def _totals(subtotal, delivery_cost, delivery_name, vat_rate, threshold):
+    vat_amount = money(subtotal * vat_rate)
+    grand_total = money(subtotal + delivery_cost)
+    grand_total_with_vat = money(grand_total + vat_amount)
+    return Totals(
+        subtotal, vat_amount, delivery_cost, delivery_name, grand_total,
+        grand_total_with_vat, free_delivery_delta(subtotal, threshold),
+        to_minor_units(grand_total_with_vat),
+    )
+
+
+def calculate_totals(subtotal, rates=None, delivery_cost=None, delivery_name=None,
+                     vat_rate=None, threshold=None):
+    """
+    Return the Totals for a subtotal. Pass `delivery_cost` (and optionally
+    `delivery_name`) for a chosen delivery method, or `rates` to apply the
+    default delivery.
+    """
+    subtotal = money(subtotal)
+    vat_rate = settings.VAT_RATE if vat_rate is None else vat_rate
+    threshold = settings.FREE_DELIVERY_THRESHOLD if threshold is None else threshold
+    if delivery_cost is None:
+        delivery_name, delivery_cost = default_delivery(subtotal, rates or {}, threshold)
+    elif delivery_name is None:
+        delivery_name = STANDARD_DELIVERY if delivery_cost > 0 else FREE_DELIVERY
+    return _totals(subtotal, money(delivery_cost), delivery_name,
+                   Decimal(vat_rate), Decimal(threshold))
@@ -1,12 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from .webhooks import webhook
 
+# Under ASGI the views that call Stripe can await it instead of blocking
+if settings.CHECKOUT_ASYNC_VIEWS:
+    checkout = views.checkout_async
+    update_delivery = views.update_delivery_async
+    checkout_success = views.checkout_success_async
+    cache_checkout_data = views.cache_checkout_data_async
+else:
+    checkout = views.checkout
+    update_delivery = views.update_delivery
+    checkout_success = views.checkout_success
+    cache_checkout_data = views.cache_checkout_data
+
 urlpatterns = [
-    path('', views.checkout, name='checkout'),
-    path('update-delivery/<int:delivery_id>/', views.update_delivery, name='update_delivery'),
-    path('checkout_success/<order_number>/', views.checkout_success, name='checkout_success'),
-    path('cache_checkout_data/', views.cache_checkout_data, name='cache_checkout_data'),
+    path('', checkout, name='checkout'),
+    path('update-delivery/<int:delivery_id>/', update_delivery, name='update_delivery'),
+    path('checkout_success/<order_number>/', checkout_success, name='checkout_success'),
+    path('cache_checkout_data/', cache_checkout_data, name='cache_checkout_data'),
     path('wh/', views.stripe_webhook, name='webhook'),
     path('delivery/add/', views.add_delivery, name='add_delivery'),
     path('delivery/edit/<int:delivery_id>/', views.edit_delivery, name='edit_delivery'),
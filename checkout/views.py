@@ -3,54 +3,51 @@ from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 from django.conf import settings
-from decimal import Decimal, ROUND_HALF_UP
 from django.http import JsonResponse
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.contrib.auth.decorators import login_required, user_passes_test
+from asgiref.sync import sync_to_async
 
 from profiles.forms import UserProfileForm
 from .forms import OrderForm, DeliveryForm
-from .models import Delivery, Order, OrderItem, HennaProduct, UserProfile 
-from cart.contexts import cart_contents
-from .utils import calculate_delivery_cost_and_totals
+from .models import Delivery, Order, UserProfile
+from cart.storage import get_cart, get_cart_store
+from cart.utils import get_cart_items, get_cart_totals, revalidate_cart_prices
+from . import payments
+from .orders import build_order
+from .totals import calculate_totals
+from .deliveries import get_active_deliveries, get_delivery, get_delivery_rates
 
 import stripe
-import json
 
 from .webhook_handler import StripeWH_Handler 
 
 stripe_public_key = settings.STRIPE_PUBLIC_KEY
-stripe_secret_key = settings.STRIPE_SECRET_KEY
 
 
-def create_new_payment_intent(amount):
-    """
-    Helper function to create a new PaymentIntent with standard settings.
-    Preserves Stripe's automatic payment methods feature.
-    """
-    return stripe.PaymentIntent.create(
-        amount=amount,
-        currency=settings.STRIPE_CURRENCY,
-        automatic_payment_methods={'enabled': True},
-        metadata={'initiated_from': 'checkout_page'}
-    )
+# The checkout views below are split into the work done in the database and
+# session, and the Stripe calls, so that the async versions at the end of
+# this module can make the Stripe calls without holding up a worker.
+
+def _checkout_metadata(request):
+    return {
+        'cart': get_cart(request).dumps(),
+        'save_info': request.POST.get('save_info'),
+        'username': request.user.username if request.user.is_authenticated else '',
+    }
 
 
 @require_POST
 def cache_checkout_data(request):
     """
-    Cache checkout data on the PaymentIntent before payment is processed.
+    Cache checkout data on the PaymentIntent before payment is processed,
+    along with any delivery change deferred by `update_delivery`.
     """
     try:
         pid = request.POST.get('client_secret').split('_secret')[0]
-        stripe.api_key = stripe_secret_key
-        stripe.PaymentIntent.modify(pid, metadata={
-            'cart': json.dumps(request.session.get('cart', {})),
-            'save_info': request.POST.get('save_info'),
-            'username': request.user.username if request.user.is_authenticated else '',
-        })
+        payments.flush_update(request.session, pid, _checkout_metadata(request))
         return HttpResponse(status=200)
     except Exception as e:
         messages.error(request,
@@ -58,150 +55,107 @@ def cache_checkout_data(request):
         return HttpResponse(content=str(e), status=400)
 
 
-def checkout(request):
+def _checkout_cart(request):
     """
-    Display checkout form and handle payment processing.
-    Reuses existing PaymentIntents or creates new ones.
+    Bring the cart up to date and return `(cart, cart_items, current_cart,
+    calculations)` with the default delivery, or None if it is empty.
     """
-    current_cart = cart_contents(request)
-    cart = request.session.get('cart', {})
+    # Drops lines whose product has been deleted and brings prices up to
+    # date before the totals are taken
+    if revalidate_cart_prices(request):
+        messages.info(request, 'Some prices in your cart have changed since you added them.')
+    cart_items = get_cart_items(request)
+    current_cart = get_cart_totals(request)
+    cart = get_cart(request)
 
     if not cart:
         messages.error(request, "Your cart is empty.")
-        return redirect('view_cart')
+        return None
 
-    # Calculate costs
-    delivery_cost = current_cart.get('delivery_cost', Decimal('0.00'))
-    calculations = calculate_delivery_cost_and_totals(current_cart['total'], delivery_cost)
+    # Calculate costs with the default delivery
+    calculations = calculate_totals(current_cart['total'], get_delivery_rates())
+    return cart, cart_items, current_cart, calculations
 
-    # Stripe setup
-    stripe.api_key = stripe_secret_key
-    stripe_total = int((calculations['grand_total_with_vat'] * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
 
-        # ----- Handle POST (form submission) -----
-    if request.method == 'POST':
-        payment_intent_id = request.POST.get('payment_intent_id')
-
-        # Handle order form submission
-        form_data = {
-            'full_name':        request.POST['full_name'],
-            'email':            request.POST['email'],
-            'phone_number':     request.POST['phone_number'],
-            'country':          request.POST['country'],
-            'postcode':         request.POST['postcode'],
-            'town_or_city':     request.POST['town_or_city'],
-            'street_address1':  request.POST['street_address1'],
-            'street_address2':  request.POST.get('street_address2', ''),
-            'county':           request.POST.get('county', ''),
-        }
-        order_form = OrderForm(form_data)
-
-        if order_form.is_valid():
-            order = order_form.save(commit=False)
-            pid = request.POST.get('client_secret').split('_secret')[0]
-            order.stripe_pid = pid
-            order.original_cart = json.dumps(cart)
-
-            # Get and assign delivery method safely
-            delivery_method_id = request.POST.get('delivery_method')
-            selected_delivery = None
-            if delivery_method_id:
-                try:
-                    selected_delivery = Delivery.objects.get(id=delivery_method_id)
-                except Delivery.DoesNotExist:
-                    messages.error(request, "Selected delivery method not found.")
-                    return redirect('checkout')
-
-            order.delivery_method = selected_delivery
-            order.save()
-
-            # Get the updated delivery cost based on the selected method
-            delivery_cost = selected_delivery.cost  
-
-            # Recalculate the totals with the updated delivery cost
-            calculations = calculate_delivery_cost_and_totals(current_cart['total'], delivery_cost)
-
-            # Update Stripe total with the new grand total (including updated delivery cost)
-            stripe_total = int((calculations['grand_total_with_vat'] * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
-
-            try:
-                # Try retrieving and updating existing PaymentIntent
-                intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-                if intent.amount != stripe_total:
-                    stripe.PaymentIntent.modify(
-                        payment_intent_id,
-                        amount=stripe_total,
-                        metadata={
-                            'cart': json.dumps(cart),
-                            'save_info': request.POST.get('save_info'),
-                            'username': request.user.username if request.user.is_authenticated else '',
-                            'delivery_method_id': str(selected_delivery.id)
-                        }
-                    )
-                client_secret = intent.client_secret
-                request.session['payment_intent_id'] = intent.id
-
-            except stripe.error.StripeError:
-                # Create new PaymentIntent if there's an issue
-                intent = create_new_payment_intent(stripe_total)
-                client_secret = intent.client_secret
-                request.session['payment_intent_id'] = intent.id
-
-            # Save user profile if requested
-            if request.POST.get('save_info') and request.user.is_authenticated:
-                profile = UserProfile.objects.get(user=request.user)
-                profile.default_phone_number = request.POST.get('phone_number', profile.default_phone_number)
-                profile.default_country = request.POST.get('country', profile.default_country)
-                profile.default_postcode = request.POST.get('postcode', profile.default_postcode)
-                profile.default_town_or_city = request.POST.get('town_or_city', profile.default_town_or_city)
-                profile.default_street_address1 = request.POST.get('street_address1', profile.default_street_address1)
-                profile.default_street_address2 = request.POST.get('street_address2', profile.default_street_address2)
-                profile.default_county = request.POST.get('county', profile.default_county)
-                profile.save()
-
-            # Create order line items
-            for item in current_cart['cart_items']:
-                try:
-                    product = HennaProduct.objects.get(id=item['product'].id)
-                    order_item = OrderItem(
-                        order=order,
-                        product=product,
-                        quantity=item['quantity'],
-                    )
-                    order_item.save()
-                except HennaProduct.DoesNotExist:
-                    messages.error(request, "One of the items in your cart wasn't found in our database.")
-                    order.delete()
-                    return redirect('view_cart')
-
-            # Finalise order total
-            order.update_total()
-
-            request.session['save_info'] = 'save-info' in request.POST
-            return redirect(reverse('checkout_success', args=[order.order_number]))
-
-        else:
-            messages.error(request, "There was an issue with your order form. Please check your details and try again.")
-
-    # ----- Handle GET (initial page load) -----
-    else:
-        if 'payment_intent_id' in request.session:
-            try:
-                intent = stripe.PaymentIntent.retrieve(request.session['payment_intent_id'])
-
-                # Only reuse if the status is "requires_payment_method" and the amount matches
-                if intent.status != 'requires_payment_method' or abs(intent.amount - stripe_total) > stripe_total * 0.05:
-                    intent = create_new_payment_intent(stripe_total)
+def _place_order(request, cart, cart_items, current_cart):
+    """
+    Validate the order form and build the order. Return `(order_form,
+    order, calculations, metadata)`, where the order is None if the form is
+    invalid, or a redirect if the delivery method cannot be found.
+    """
+    form_data = {
+        'full_name':        request.POST['full_name'],
+        'email':            request.POST['email'],
+        'phone_number':     request.POST['phone_number'],
+        'country':          request.POST['country'],
+        'postcode':         request.POST['postcode'],
+        'town_or_city':     request.POST['town_or_city'],
+        'street_address1':  request.POST['street_address1'],
+        'street_address2':  request.POST.get('street_address2', ''),
+        'county':           request.POST.get('county', ''),
+    }
+    order_form = OrderForm(form_data)
+
+    if not order_form.is_valid():
+        messages.error(request, "There was an issue with your order form. Please check your details and try again.")
+        return order_form, None, None, None
+
+    order = order_form.save(commit=False)
+    pid = request.POST.get('client_secret').split('_secret')[0]
+    order.stripe_pid = pid
+    order.original_cart = cart.dumps()
+
+    # Get and assign delivery method safely
+    delivery_method_id = request.POST.get('delivery_method')
+    selected_delivery = None
+    if delivery_method_id:
+        selected_delivery = get_delivery(delivery_method_id)
+        if selected_delivery is None:
+            messages.error(request, "Selected delivery method not found.")
+            return redirect('checkout')
+
+    order.delivery_method = selected_delivery
+    build_order(order, [(item['product'], item['quantity']) for item in cart_items])
+
+    # Recalculate the totals with the selected delivery method
+    calculations = calculate_totals(
+        current_cart['total'], delivery_cost=selected_delivery.cost,
+        delivery_name=selected_delivery.name
+    )
+    metadata = {
+        **_checkout_metadata(request),
+        'delivery_method_id': str(selected_delivery.id),
+    }
+    return order_form, order, calculations, metadata
 
-            except stripe.error.StripeError:
-                intent = create_new_payment_intent(stripe_total)
-        else:
-            intent = create_new_payment_intent(stripe_total)
 
-        request.session['payment_intent_id'] = intent.id
-        client_secret = intent.client_secret
+def _order_placed(request, order, intent):
+    """Save the profile if requested and go to the success page."""
+    request.session['payment_intent_id'] = intent.id
 
-        # Pre-fill form for logged in users
+    # Save user profile if requested
+    if request.POST.get('save_info') and request.user.is_authenticated:
+        profile = UserProfile.objects.get(user=request.user)
+        profile.default_phone_number = request.POST.get('phone_number', profile.default_phone_number)
+        profile.default_country = request.POST.get('country', profile.default_country)
+        profile.default_postcode = request.POST.get('postcode', profile.default_postcode)
+        profile.default_town_or_city = request.POST.get('town_or_city', profile.default_town_or_city)
+        profile.default_street_address1 = request.POST.get('street_address1', profile.default_street_address1)
+        profile.default_street_address2 = request.POST.get('street_address2', profile.default_street_address2)
+        profile.default_county = request.POST.get('county', profile.default_county)
+        profile.save()
+
+    request.session['save_info'] = 'save-info' in request.POST
+    return redirect(reverse('checkout_success', args=[order.order_number]))
+
+
+def _checkout_page(request, order_form, cart_items, current_cart, calculations, intent):
+    """Render the checkout page, pre-filling the form for logged in users."""
+    request.session['payment_intent_id'] = intent.id
+    # The page starts again from the default delivery
+    payments.discard_update(request.session)
+
+    if order_form is None:
         order_form_data = {}
         if request.user.is_authenticated:
             try:
@@ -228,16 +182,16 @@ def checkout(request):
     context = {
         'order_form':               order_form,
         'total_cost':               current_cart['total'],
-        'delivery_cost':            calculations['delivery_cost'],
-        'grand_total':              calculations['grand_total'],
-        'grand_total_with_vat':     calculations['grand_total_with_vat'],
-        'vat_amount':               calculations['vat_amount'],
-        'delivery_name':            calculations['delivery_name'],
+        'delivery_cost':            calculations.delivery_cost,
+        'grand_total':              calculations.grand_total,
+        'grand_total_with_vat':     calculations.grand_total_with_vat,
+        'vat_amount':               calculations.vat_amount,
+        'delivery_name':            calculations.delivery_name,
         'free_delivery_threshold':  settings.FREE_DELIVERY_THRESHOLD,
         'is_threshold_met':         current_cart['total'] >= settings.FREE_DELIVERY_THRESHOLD,
-        'delivery_methods':         Delivery.objects.filter(active=True),
-        'free_delivery_delta':      calculations['free_delivery_delta'],
-        'cart_items':               current_cart['cart_items'],
+        'delivery_methods':         get_active_deliveries(),
+        'free_delivery_delta':      calculations.free_delivery_delta,
+        'cart_items':               cart_items,
         'product_count':            current_cart['product_count'],
         'stripe_public_key':        stripe_public_key,
         'client_secret':            intent.client_secret,
@@ -246,9 +200,39 @@ def checkout(request):
     return render(request, 'checkout/checkout.html', context)
 
 
-def checkout_success(request, order_number):
+def checkout(request):
     """
-    Display order confirmation and send confirmation email.
+    Display checkout form and handle payment processing.
+    Reuses existing PaymentIntents or creates new ones.
+    """
+    checkout_cart = _checkout_cart(request)
+    if checkout_cart is None:
+        return redirect('view_cart')
+    cart, cart_items, current_cart, calculations = checkout_cart
+
+    order_form = None
+    if request.method == 'POST':
+        placed = _place_order(request, cart, cart_items, current_cart)
+        if isinstance(placed, HttpResponse):
+            return placed
+        order_form, order, order_calculations, metadata = placed
+        if order is not None:
+            intent = payments.update_or_create_intent(
+                request.POST.get('payment_intent_id'), order_calculations.stripe_total, metadata
+            )
+            return _order_placed(request, order, intent)
+
+    intent = payments.checkout_intent(
+        request.session.get('payment_intent_id'), calculations.stripe_total
+    )
+    return _checkout_page(request, order_form, cart_items, current_cart, calculations, intent)
+
+
+def _complete_order(request, order_number):
+    """
+    Attach the order to the user's profile, send the confirmation email and
+    empty the cart. Return the order and the session's PaymentIntent id,
+    which is removed from the session.
     """
     save_info = request.session.get('save-info')
     order = get_object_or_404(Order, order_number=order_number)
@@ -283,18 +267,18 @@ def checkout_success(request, order_number):
         'A confirmation email has been sent to your email address.')
 
     # Enhanced cleanup
-    if 'cart' in request.session:
-        del request.session['cart']
-        
-    if 'payment_intent_id' in request.session:
-        try:
-            # Cancel the PaymentIntent to prevent further charges
-            stripe.PaymentIntent.cancel(request.session['payment_intent_id'])
-        except stripe.error.StripeError as e:
-            print(f"Error canceling PaymentIntent: {e}")
-            # If already succeeded/canceled, ignore
-        finally:
-            del request.session['payment_intent_id']
+    get_cart_store(request).clear()
+    return order, request.session.pop('payment_intent_id', None)
+
+
+def checkout_success(request, order_number):
+    """
+    Display order confirmation and send confirmation email.
+    """
+    order, pid = _complete_order(request, order_number)
+    if pid:
+        # Cancel the PaymentIntent to prevent further charges
+        payments.cancel_intent(pid)
 
     return render(request, 'checkout/checkout_success.html', {'order': order})
 
@@ -324,6 +308,7 @@ def stripe_webhook(request):
         'checkout.session.completed':    handler.handle_checkout_session_completed,
         'payment_intent.succeeded':      handler.handle_payment_intent_succeeded,
         'payment_intent.payment_failed': handler.handle_payment_intent_payment_failed,
+        'payment_intent.canceled':       handler.handle_payment_intent_canceled,
     }
 
     event_type    = event['type']
@@ -332,29 +317,48 @@ def stripe_webhook(request):
     return event_handler(event)
 
 
-def calculate_delivery_cost_and_totals(subtotal, delivery_cost):
+def _delivery_update(request, delivery_id):
     """
-    Calculate VAT, delivery, and total amounts for the cart.
-    Returns a dict with VAT, totals, delivery info, and free delivery delta.
+    Work out the totals for the selected delivery method and defer the
+    change to the session's PaymentIntent until the customer pays. Return
+    `(delivery, calculations, payment_intent_id, metadata)`, or None if the
+    delivery method cannot be found.
     """
-    vat_rate = Decimal('0.20')
-    vat_amount = (subtotal * vat_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    grand_total = subtotal + delivery_cost
-    grand_total_with_vat = grand_total + vat_amount
-
-    free_delivery_threshold = Decimal(settings.FREE_DELIVERY_THRESHOLD)
-    free_delivery_delta = (
-        free_delivery_threshold - subtotal if subtotal < free_delivery_threshold else Decimal('0.00')
+    selected_delivery = get_delivery(delivery_id)
+    if selected_delivery is None:
+        return None
+    calculations = calculate_totals(
+        get_cart_totals(request)['total'], delivery_cost=selected_delivery.cost,
+        delivery_name=selected_delivery.name
     )
-
-    return {
-        'vat_amount': vat_amount,
-        'grand_total': grand_total,
-        'grand_total_with_vat': grand_total_with_vat,
-        'delivery_cost': delivery_cost,  
-        'free_delivery_delta': free_delivery_delta,
-        'delivery_name': 'Standard Delivery' if delivery_cost > 0 else 'Free Delivery',  
+    metadata = {
+        'cart': get_cart(request).dumps(),
+        'delivery_method_id': str(delivery_id),
     }
+    pid = request.session.get('payment_intent_id')
+    if pid:
+        # Only the last choice before paying is sent to Stripe
+        payments.defer_update(request.session, pid, calculations.stripe_total, metadata)
+    return selected_delivery, calculations, pid, metadata
+
+
+def _delivery_response(selected_delivery, calculations, client_secret):
+    return JsonResponse({
+        'delivery_cost': float(calculations.delivery_cost),
+        'grand_total': float(calculations.grand_total),
+        'grand_total_with_vat': float(calculations.grand_total_with_vat),
+        'estimated_delivery_time': selected_delivery.estimated_delivery_time,
+        'company_name': selected_delivery.company_name,
+        'delivery_name': selected_delivery.name,
+        'vat_amount': float(calculations.vat_amount),
+        'client_secret': client_secret,
+    })
+
+
+def _invalid_delivery_response():
+    return JsonResponse({
+        'error': 'Selected delivery option is invalid.',
+    }, status=400)
 
 
 @require_POST
@@ -362,54 +366,104 @@ def update_delivery(request, delivery_id):
     """
     AJAX endpoint to recalc delivery and totals when a delivery method is selected.
     """
-    cart = request.session.get('cart', {})
-    current_cart = cart_contents(request)
-    subtotal = current_cart['total']
+    update = _delivery_update(request, delivery_id)
+    if update is None:
+        return _invalid_delivery_response()
+    selected_delivery, calculations, pid, metadata = update
 
+    client_secret = None
+    if pid:
+        try:
+            client_secret = payments.get_client_secret(pid)
+        except stripe.error.StripeError:
+            pass
+    if client_secret is None:
+        # No PaymentIntent to defer to, so one is made now
+        intent = payments.create_intent(calculations.stripe_total)
+        payments.defer_update(request.session, intent.id, calculations.stripe_total, metadata)
+        request.session['payment_intent_id'] = intent.id
+        client_secret = intent.client_secret
+    return _delivery_response(selected_delivery, calculations, client_secret)
+
+
+# ----------------------------------------
+# Async checkout views
+# ----------------------------------------
+# The same views for serving under ASGI (see CHECKOUT_ASYNC_VIEWS in
+# checkout/urls.py). The database and session work runs in a thread and the
+# Stripe calls are awaited, so a slow Stripe response does not tie up a
+# worker.
+
+@require_POST
+async def cache_checkout_data_async(request):
+    """Async version of `cache_checkout_data`."""
     try:
-        selected_delivery = Delivery.objects.get(id=delivery_id)
-        delivery_cost = selected_delivery.cost
-        calculations = calculate_delivery_cost_and_totals(subtotal, delivery_cost)
-        
-        # Update Stripe PaymentIntent
-        stripe_total = int((calculations['grand_total_with_vat'] * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
-        
-        if 'payment_intent_id' in request.session:
-            try:
-                intent = stripe.PaymentIntent.modify(
-                    request.session['payment_intent_id'],
-                    amount=stripe_total,
-                    metadata={
-                        'cart': json.dumps(cart),
-                        'delivery_method_id': str(delivery_id),
-                    }
-                )
-                client_secret = intent.client_secret
-            except stripe.error.StripeError:
-                # Fallback to creating new intent if modification fails
-                intent = create_new_payment_intent(stripe_total)
-                request.session['payment_intent_id'] = intent.id
-                client_secret = intent.client_secret
-        else:
-            intent = create_new_payment_intent(stripe_total)
-            request.session['payment_intent_id'] = intent.id
-            client_secret = intent.client_secret
-
-        return JsonResponse({
-            'delivery_cost': float(delivery_cost),
-            'grand_total': float(calculations['grand_total']),
-            'grand_total_with_vat': float(calculations['grand_total_with_vat']),
-            'estimated_delivery_time': selected_delivery.estimated_delivery_time,
-            'company_name': selected_delivery.company_name,
-            'delivery_name': selected_delivery.name,
-            'vat_amount': float(calculations['vat_amount']),
-            'client_secret': client_secret, 
-        })
-
-    except Delivery.DoesNotExist:
-        return JsonResponse({
-            'error': 'Selected delivery option is invalid.',
-        }, status=400)
+        pid = request.POST.get('client_secret').split('_secret')[0]
+        metadata = await sync_to_async(_checkout_metadata)(request)
+        await payments.aflush_update(request.session, pid, metadata)
+        return HttpResponse(status=200)
+    except Exception as e:
+        messages.error(request,
+            'Sorry, your payment cannot be processed right now. Please try again later.')
+        return HttpResponse(content=str(e), status=400)
+
+
+async def checkout_async(request):
+    """Async version of `checkout`."""
+    checkout_cart = await sync_to_async(_checkout_cart)(request)
+    if checkout_cart is None:
+        return redirect('view_cart')
+    cart, cart_items, current_cart, calculations = checkout_cart
+
+    order_form = None
+    if request.method == 'POST':
+        placed = await sync_to_async(_place_order)(request, cart, cart_items, current_cart)
+        if isinstance(placed, HttpResponse):
+            return placed
+        order_form, order, order_calculations, metadata = placed
+        if order is not None:
+            intent = await payments.aupdate_or_create_intent(
+                request.POST.get('payment_intent_id'), order_calculations.stripe_total, metadata
+            )
+            return await sync_to_async(_order_placed)(request, order, intent)
+
+    intent = await payments.acheckout_intent(
+        await request.session.aget('payment_intent_id'), calculations.stripe_total
+    )
+    return await sync_to_async(_checkout_page)(
+        request, order_form, cart_items, current_cart, calculations, intent
+    )
+
+
+async def checkout_success_async(request, order_number):
+    """Async version of `checkout_success`."""
+    order, pid = await sync_to_async(_complete_order)(request, order_number)
+    if pid:
+        await payments.acancel_intent(pid)
+
+    return await sync_to_async(render)(request, 'checkout/checkout_success.html', {'order': order})
+
+
+@require_POST
+async def update_delivery_async(request, delivery_id):
+    """Async version of `update_delivery`."""
+    update = await sync_to_async(_delivery_update)(request, delivery_id)
+    if update is None:
+        return _invalid_delivery_response()
+    selected_delivery, calculations, pid, metadata = update
+
+    client_secret = None
+    if pid:
+        try:
+            client_secret = await payments.aget_client_secret(pid)
+        except stripe.error.StripeError:
+            pass
+    if client_secret is None:
+        intent = await payments.acreate_intent(calculations.stripe_total)
+        await payments.adefer_update(request.session, intent.id, calculations.stripe_total, metadata)
+        await request.session.aset('payment_intent_id', intent.id)
+        client_secret = intent.client_secret
+    return _delivery_response(selected_delivery, calculations, client_secret)
 
 
 # Helper function to check if the user is a superuser
@@ -1,8 +1,10 @@
 from django.http import HttpResponse
-from .models import Order, OrderItem, Delivery
+from .deliveries import get_delivery
+from .models import Order
 from products.models import HennaProduct
-from .utils import calculate_delivery_cost_and_totals
-import json
+from cart.storage import Cart
+from .orders import build_order
+from .payments import remember_intent, retrieve_intent
 import time
 import logging
 from decimal import Decimal
@@ -31,15 +33,7 @@ class StripeWH_Handler:
 
          # Get delivery method from metadata
         delivery_method_id = metadata.get('delivery_method_id')
-        if delivery_method_id:
-            try:
-                delivery_method = Delivery.objects.get(id=delivery_method_id)
-                delivery_cost = delivery_method.cost
-            except Delivery.DoesNotExist:
-                delivery_cost = Decimal('0.00')
-        else:
-            delivery_cost = Decimal('0.00')
-        
+
         cart = metadata.get('cart')
         save_info = metadata.get('save_info', False)
 
@@ -48,10 +42,7 @@ class StripeWH_Handler:
             return HttpResponse(status=400)
 
         # Retrieve the PaymentIntent to get billing/shipping details & amount
-        import stripe
-        from django.conf import settings
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        intent = stripe.PaymentIntent.retrieve(pid)
+        intent = retrieve_intent(pid)
 
         billing_details = intent.charges.data[0].billing_details
         shipping_details = session.get('shipping', {})
@@ -63,10 +54,9 @@ class StripeWH_Handler:
                 if value == "":
                     shipping_details['address'][field] = None
 
-        # Compute delivery cost & totals
+        # Get the delivery cost; totals are worked out when the order is built
         delivery_cost = self.get_delivery_cost(delivery_method_id)
-        totals = calculate_delivery_cost_and_totals(Decimal(grand_total_with_vat))
-        
+
         # Check for an existing order
         if self.check_order_exists(shipping_details, billing_details, cart, pid, grand_total_with_vat):
             return HttpResponse(
@@ -76,9 +66,7 @@ class StripeWH_Handler:
 
         # Create the order
         order = self.create_order(
-            shipping_details, billing_details, cart, pid,
-            delivery_cost,
-            totals  # pass the totals dict so create_order can set them
+            shipping_details, billing_details, cart, pid, delivery_cost
         )
         if not order:
             return HttpResponse(
@@ -93,6 +81,7 @@ class StripeWH_Handler:
 
     def handle_payment_intent_succeeded(self, event):
         """PaymentIntent succeeded (fallback)"""
+        remember_intent(event['data']['object'])
         return HttpResponse(
             content=f'Webhook received: {event["type"]} | Ignored (checkout.session.completed preferred)',
             status=200
@@ -100,6 +89,15 @@ class StripeWH_Handler:
 
     def handle_payment_intent_payment_failed(self, event):
         """PaymentIntent failed"""
+        remember_intent(event['data']['object'])
+        return HttpResponse(
+            content=f'Webhook received: {event["type"]}',
+            status=200
+        )
+
+    def handle_payment_intent_canceled(self, event):
+        """PaymentIntent canceled"""
+        remember_intent(event['data']['object'])
         return HttpResponse(
             content=f'Webhook received: {event["type"]}',
             status=200
@@ -110,12 +108,11 @@ class StripeWH_Handler:
         if not delivery_method_id:
             logger.error('No delivery method ID provided')
             return Decimal('0.00')
-        try:
-            delivery_method = Delivery.objects.get(id=delivery_method_id)
-            return Decimal(delivery_method.cost)
-        except Delivery.DoesNotExist:
+        delivery_method = get_delivery(delivery_method_id)
+        if delivery_method is None:
             logger.error(f'Delivery method not found: {delivery_method_id}')
             return Decimal('0.00')
+        return Decimal(delivery_method.cost)
 
     def check_order_exists(self, shipping_details, billing_details, cart, pid, grand_total):
         """Check if an order already exists in the database"""
@@ -143,11 +140,11 @@ class StripeWH_Handler:
                 time.sleep(1)
         return False
 
-    def create_order(self, shipping_details, billing_details, cart, pid, delivery_cost, totals):
-        """Create a new order in the database using the passed totals dict."""
+    def create_order(self, shipping_details, billing_details, cart, pid, delivery_cost):
+        """Create a new order and its line items in the database."""
         address = shipping_details.get('address', {})
         try:
-            order = Order.objects.create(
+            order = Order(
                 full_name=shipping_details.get('name'),
                 email=billing_details.get('email'),
                 phone_number=shipping_details.get('phone'),
@@ -159,21 +156,14 @@ class StripeWH_Handler:
                 country=address.get('country'),
                 original_cart=cart,
                 stripe_pid=pid,
-                delivery_cost=totals['delivery_cost'],
-                vat_amount=totals['vat_amount'],
-                grand_total=totals['grand_total'],
-                grand_total_with_vat=totals['grand_total_with_vat'],
+                delivery_cost=delivery_cost,
             )
 
-            for item_id, item_data in json.loads(cart).items():
-                product = HennaProduct.objects.get(id=item_id)
-                quantity = item_data if isinstance(item_data, int) else item_data.get('quantity', 1)
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                )
-            return order
+            lines = list(Cart.loads(cart))
+            products = HennaProduct.objects.in_bulk([product_id for product_id, quantity, price in lines])
+            return build_order(order, [
+                (products[product_id], quantity) for product_id, quantity, price in lines
+            ])
         except Exception as e:
             logger.error(f'Error creating order: {e}')
             return None
@@ -15,7 +15,6 @@ def webhook(request):
     """Listen for webhooks from Stripe"""
     # Setup
     wh_secret = settings.STRIPE_WH_SECRET
-    stripe.api_key = settings.STRIPE_SECRET_KEY
 
     # Get the webhook data and verify its signature
     payload = request.body
@@ -43,6 +42,7 @@ def webhook(request):
         'checkout.session.completed': handler.handle_checkout_session_completed,
         'payment_intent.succeeded': handler.handle_payment_intent_succeeded,
         'payment_intent.payment_failed': handler.handle_payment_intent_payment_failed,
+        'payment_intent.canceled': handler.handle_payment_intent_canceled,
     }
 
     # Get the webhook type from Stripe
@@ -1,7 +1,17 @@
 from django.contrib.admin import AdminSite, ModelAdmin
 from django.contrib import admin
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 from django.utils.html import format_html
 from products.models import HennaProduct, ProductsCategory, Discount
+from products.forms import SalePreviewForm
+from products.images import variant_url
+from products.pagination import InvalidCursor, KeysetPaginator
+from products.pricing import price_products
+from products.timeline import get_timeline
 from checkout.models import Delivery, Order, OrderItem
 from profiles.models import UserProfile
 from django.contrib.auth.models import Group, User
@@ -17,6 +27,8 @@ class CustomAdminSite(AdminSite):
 
 custom_admin_site = CustomAdminSite(name='custom_admin')
 
+SALE_PREVIEW_PER_PAGE = 100
+
 
 class DiscountInline(admin.TabularInline):
     model = HennaProduct.discounts.through
@@ -35,6 +47,7 @@ class HennaProductAdmin(ModelAdmin):
     inlines = [DiscountInline]
     date_hierarchy = 'date_added'
     actions = ['mark_as_unavailable']
+    change_list_template = 'admin/products/hennaproduct/change_list.html'
 
     fieldsets = (
         (None, {'fields': ('sku', 'name', 'category')}),
@@ -46,16 +59,63 @@ class HennaProductAdmin(ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_pricing()
+
+    def get_urls(self):
+        preview = path(
+            'sale-preview/', self.admin_site.admin_view(self.sale_preview_view),
+            name='products_hennaproduct_sale_preview'
+        )
+        return [preview] + super().get_urls()
+
+    def sale_preview_view(self, request):
+        """
+        Show products' prices at a chosen date, a page at a time by SKU,
+        each page priced in one batch.
+        """
+        form = SalePreviewForm(request.GET or {'at': timezone.localtime().strftime('%Y-%m-%dT%H:%M')})
+        rows = []
+        next_page_url = None
+        if form.is_valid():
+            at = form.cleaned_data['at']
+            timeline = get_timeline()
+            products = HennaProduct.objects.select_related('category')
+            if form.cleaned_data['discounted_only']:
+                products = products.filter(pk__in=timeline.discounted_products(at))
+            paginator = KeysetPaginator(products, Coalesce('sku', Value('')),
+                                        per_page=SALE_PREVIEW_PER_PAGE)
+            try:
+                page = paginator.get_page(request.GET.get('cursor'))
+            except InvalidCursor:
+                page = paginator.get_page()
+            prices = price_products([(product.pk, product.price) for product in page], at, timeline)
+            rows = [{'product': product, 'preview': prices[product.pk]} for product in page]
+            if page.has_next:
+                params = request.GET.copy()
+                params['cursor'] = page.next_cursor
+                next_page_url = f'?{params.urlencode()}'
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sale preview',
+            'opts': self.model._meta,
+            'form': form,
+            'rows': rows,
+            'next_page_url': next_page_url,
+        }
+        return TemplateResponse(request, 'admin/products/sale_preview.html', context)
+
     def mark_as_unavailable(self, request, queryset):
         queryset.update(is_available=False)
 
     def get_discounted_price(self, obj):
-        return obj.get_discounted_price()
+        return obj.discounted_price
 
     def display_image(self, obj):
         if obj.image:
             return format_html('<img src="{}" width="50" height="50" />',
-                               obj.image.url)
+                               variant_url(obj, 'thumb'))
         return 'No Image'
 
 
@@ -196,6 +196,24 @@ if 'USE_AWS' in os.environ:
     STATIC_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/{STATICFILES_LOCATION}/'
     MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/{MEDIAFILES_LOCATION}/'
 
+# Cache settings (per-process memory cache unless REDIS_URL is set)
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+
+# Where anonymous carts are kept: 'cache' needs a cache shared between
+# processes, so carts stay in the session unless REDIS_URL is set
+CART_STORE = os.environ.get('CART_STORE', 'cache' if 'REDIS_URL' in os.environ else 'session')
+
+# Part of page ETags, so cached pages are revalidated after each deploy
+# (Heroku sets HEROKU_RELEASE_VERSION when dyno metadata is enabled)
+TEMPLATE_VERSION = os.environ.get('HEROKU_RELEASE_VERSION', '1')
+
 # Other project settings
 FREE_DELIVERY_THRESHOLD = 50
 VAT_RATE = Decimal('0.20')
@@ -205,6 +223,14 @@ STRIPE_CURRENCY = 'GBP'
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_WH_SECRET = os.getenv('STRIPE_WH_SECRET', '')
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+# Seconds before a Stripe request gives up, and before connecting gives up
+STRIPE_TIMEOUT = float(os.getenv('STRIPE_TIMEOUT', 10))
+STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 3))
+# Retries of failed Stripe requests, with jittered exponential backoff
+STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', 2))
+# Serve the checkout views that call Stripe as async views (for ASGI)
+CHECKOUT_ASYNC_VIEWS = os.getenv('CHECKOUT_ASYNC_VIEWS', 'False') == 'True'
 
 # Email backend settings
 if 'DEVELOPMENT' in os.environ:
@@ -0,0 +1,47 @@
+"""
+Precomputed "top rated" block for the landing page.
+
+The block is rendered once per catalog version and kept in the cache, so
+the home page needs no catalog queries while nothing changes. Product,
+category and discount changes (and discount windows opening or closing)
+bump the catalog version, which makes the next request rebuild it.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from products.cache import fragment_cache_key, get_cached_fragment
+from products.models import HennaProduct
+
+TOP_RATED_COUNT = 6
+
+# The key changes with the catalog version, so the TTL only bounds how
+# long superseded copies linger in the cache
+TOP_RATED_CACHE_TTL = 60 * 60 * 24
+
+
+def get_top_rated_products(count=TOP_RATED_COUNT):
+    """Return the highest rated products with their prices resolved."""
+    return list(
+        HennaProduct.objects.with_pricing()
+        .filter(rating__isnull=False)
+        .order_by('-rating', 'pk')[:count]
+    )
+
+
+def render_top_rated():
+    """Render the top rated product cards to a picklable HTML string."""
+    return render_to_string(
+        'home/includes/top_rated.html', {'products': get_top_rated_products()}
+    )
+
+
+def get_top_rated_html(rebuild=False):
+    """
+    Return the rendered top rated block, building it on a cache miss or
+    when `rebuild` is set.
+    """
+    if rebuild:
+        cache.delete(fragment_cache_key('top_rated', {}))
+    return get_cached_fragment(
+        'top_rated', {}, render_top_rated, timeout=TOP_RATED_CACHE_TTL
+    )
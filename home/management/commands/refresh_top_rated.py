@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from home.featured import get_top_rated_html
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the cached top rated block on the landing page. The block is
+    rebuilt on demand after catalog changes anyway; running this on a
+    schedule keeps the first visitor after a change from paying for it.
+    """
+    help = 'Rebuild the cached top rated products block for the home page.'
+
+    def handle(self, *args, **options):
+        get_top_rated_html(rebuild=True)
+        self.stdout.write(self.style.SUCCESS('Rebuilt the top rated products block.'))
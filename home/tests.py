@@ -1,3 +1,40 @@
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Discount, HennaProduct
+
+
+class TopRatedBlockTest(TestCase):
+    """Test suite for the cached top rated block on the landing page."""
+
+    def setUp(self):
+        """Set up rated products and start from an empty cache."""
+        cache.clear()
+        for index in range(8):
+            HennaProduct.objects.create(
+                name=f'Henna Cone {index}', description='Test',
+                price=Decimal('5.00'), rating=Decimal(index) / 2
+            )
+
+    def test_steady_state_runs_no_catalog_queries(self):
+        """Test that repeat visits render the block without any queries."""
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Henna Cone 7')
+        self.assertNotContains(response, 'Henna Cone 1<')
 
-# Create your tests here.
+    def test_discount_change_refreshes_block(self):
+        """Test that a new discount shows up with its resolved price."""
+        self.client.get(reverse('home'))
+        discount = Discount.objects.create(
+            name='Sale', discount_type='fixed', value=Decimal('1.50'),
+            start_date=timezone.now() - timezone.timedelta(hours=1),
+            end_date=timezone.now() + timezone.timedelta(days=1)
+        )
+        HennaProduct.objects.get(name='Henna Cone 7').discounts.add(discount)
+        self.assertContains(self.client.get(reverse('home')), '£3.50')
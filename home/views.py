@@ -2,21 +2,18 @@ from django.core.mail import send_mail
 from django.shortcuts import render, redirect
 from django.conf import settings
 from .forms import ContactUsForm
-from products.models import HennaProduct
+from .featured import get_top_rated_html
 
 
 def index(request):
-    """Get the top 6 most-rated products."""
+    """Render the landing page with the cached top rated products block."""
 
     # Clear feedback session variables if they exist
     request.session.pop('feedback_sender_name', None)
     request.session.pop('feedback_contact_method', None)
 
-    top_rated_products = HennaProduct.objects.filter(rating__isnull=False) \
-        .order_by('-rating')[:6]
-
     context = {
-        'products': top_rated_products,
+        'top_rated_html': get_top_rated_html(),
     }
     return render(request, 'home/index.html', context)
 
@@ -0,0 +1,158 @@
+"""
+In-process prefix index for search box suggestions.
+
+Every word of a product name, the SKU and each category's friendly name
+are kept as lower-cased keys in one sorted list, so a prefix lookup is a
+`bisect` plus a scan of the matching keys and never touches the database.
+Short prefixes, which match too many keys to scan, look up the best
+entries for the prefix precomputed when the index is built. Each process
+builds its own index lazily and rebuilds it when the catalog version
+changes.
+"""
+import re
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .cache import get_catalog_version
+from .models import HennaProduct, ProductsCategory
+
+AUTOCOMPLETE_LIMIT = 8
+# Prefixes up to this length are answered from precomputed best matches
+SHORT_PREFIX_LENGTH = 3
+# Best matching entries kept per short prefix, enough to also filter by
+# the other words of a query
+SHORT_PREFIX_MATCHES = 200
+
+CATEGORY, PRODUCT = 0, 1
+WORD_RE = re.compile(r'\w+')
+
+
+def normalise(text):
+    """Lower-case `text` and collapse whitespace."""
+    return ' '.join(text.lower().split())
+
+
+class PrefixIndex:
+    """
+    Sorted keys over suggestion entries. An entry is a tuple
+    `(kind, value, label, search_text, rank)`. Entries are stored in
+    suggestion order (categories first, then by rank, lower first), so the
+    best matches for a prefix are simply the lowest positions in its range.
+    """
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda entry: (entry[0], entry[4], entry[2]))
+        pairs = []
+        for position, entry in enumerate(self.entries):
+            search_text = entry[3]
+            keys = set(WORD_RE.findall(search_text))
+            keys.add(search_text)
+            pairs.extend((key, position) for key in keys)
+        pairs.sort()
+        self.keys = [key for key, position in pairs]
+        self.positions = array('l', (position for key, position in pairs))
+
+        short = {}
+        for key, position in pairs:
+            for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                short.setdefault(key[:length], set()).add(position)
+        self.short_prefixes = {
+            prefix: array('l', sorted(positions)[:SHORT_PREFIX_MATCHES])
+            for prefix, positions in short.items()
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """
+        Return up to `limit` entries matching every word of `query`: the
+        first word by prefix through the index, the rest as word prefixes
+        of the entry's text.
+        """
+        terms = normalise(query).split()
+        if not terms:
+            return []
+        prefix, others = terms[0], terms[1:]
+
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            candidates = self.short_prefixes.get(prefix, ())
+            results = self._filter(candidates, others, limit)
+            if len(results) == limit or len(candidates) < SHORT_PREFIX_MATCHES:
+                return results
+            # The other words ruled out too many of the precomputed matches
+        return self._filter(self._scan(prefix), others, limit)
+
+    def _scan(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        stop = bisect_left(self.keys, prefix + '\uffff', start)
+        return sorted(set(self.positions[start:stop]))
+
+    def _filter(self, candidates, others, limit):
+        results = []
+        for position in candidates:
+            entry = self.entries[position]
+            if others:
+                words = entry[3].split()
+                if not all(any(word.startswith(term) for word in words) for term in others):
+                    continue
+            results.append(entry)
+            if len(results) == limit:
+                break
+        return results
+
+
+def build_index():
+    """Build a PrefixIndex over every category and product."""
+    entries = []
+    for name, friendly_name in ProductsCategory.objects.values_list('name', 'friendly_name'):
+        label = (friendly_name or name).replace('_', ' ').title()
+        value = friendly_name or name
+        entries.append((CATEGORY, value, label, normalise(label), 0))
+
+    products = HennaProduct.objects.values_list('pk', 'name', 'sku', 'rating')
+    for pk, name, sku, rating in products.iterator(chunk_size=2000):
+        search_text = normalise(f'{name} {sku}' if sku else name)
+        # Higher rated products rank first
+        rank = -(rating or 0)
+        entries.append((PRODUCT, pk, name, search_text, rank))
+    return PrefixIndex(entries)
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return this process's index, rebuilding it after catalog changes."""
+    global _index, _index_version
+    version = get_catalog_version()
+    if _index is None or _index_version != version:
+        with _index_lock:
+            if _index is None or _index_version != version:
+                _index = build_index()
+                _index_version = version
+    return _index
+
+
+def get_suggestions(query, limit=AUTOCOMPLETE_LIMIT):
+    """Return `{'label', 'type', 'url'}` suggestions for a search box query."""
+    suggestions = []
+    products_url = reverse('products')
+    for kind, value, label, search_text, rank in get_index().lookup(query, limit):
+        if kind == CATEGORY:
+            suggestions.append({
+                'label': label, 'type': 'category',
+                'url': f"{products_url}?{urlencode({'category': value})}",
+            })
+        else:
+            suggestions.append({
+                'label': label, 'type': 'product',
+                'url': reverse('product_detail', args=[value]),
+            })
+    return suggestions
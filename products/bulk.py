@@ -0,0 +1,336 @@
+"""
+Streaming import and export of the product catalog as CSV or JSON Lines.
+
+Rows are read and written one at a time and products are upserted by
+`sku` in fixed-size batches with `bulk_create`/`bulk_update`, so memory
+use depends on the batch size rather than the file size. Categories and
+discounts are resolved through lookup maps loaded once per import.
+
+Bulk writes do not send model signals, so each batch resolves its
+materialised prices and updates the search index itself. Image variants are not generated;
+run `generate_image_variants` after importing new images.
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from . import timeline
+from .cache import bump_catalog_version
+from .models import Discount, HennaProduct, ProductsCategory
+from .pricing import resolve_effective_price
+from .search import get_search_backend
+
+IMPORT_BATCH_SIZE = 1000
+# bulk_update() builds a CASE per field whose size grows with the batch,
+# so updates are written in smaller chunks than inserts
+UPDATE_BATCH_SIZE = 200
+EXPORT_CHUNK_SIZE = 2000
+
+FIELDS = (
+    'sku', 'name', 'description', 'price', 'rating', 'stock_quantity',
+    'is_available', 'category', 'discounts', 'image_url', 'image',
+)
+# Separator for discount names in a CSV cell
+DISCOUNT_SEPARATOR = '|'
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'n')
+
+
+class RowError(ValueError):
+    """Raised for an import row that cannot be applied."""
+
+
+def get_format(path, format=None):
+    """Return 'csv' or 'jsonl' from an explicit format or the file extension."""
+    if format:
+        return format
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, format):
+    """Yield `(line_number, row)` dicts from a CSV or JSON Lines stream."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, RowError(f'invalid JSON: {e}')
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _decimal(value, field, required=False):
+    if _blank(value):
+        if required:
+            raise RowError(f'{field} is required')
+        return None
+    try:
+        return Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RowError(f'{field} is not a number: {value!r}')
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    if _blank(value):
+        return True
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RowError(f'is_available is not a boolean: {value!r}')
+
+
+class CatalogImporter:
+    """
+    Upsert products from parsed rows. Use `feed()` for each row and
+    `finish()` once the stream is exhausted. `progress(importer)` is
+    called after every batch written.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.started = time.monotonic()
+        self.batch = {}
+        self.created = self.updated = self.unchanged = 0
+        self.errors = []
+        self.categories = {}
+        for pk, name, friendly_name in ProductsCategory.objects.values_list(
+                'pk', 'name', 'friendly_name'):
+            self.categories[name] = pk
+            if friendly_name:
+                self.categories.setdefault(friendly_name, pk)
+        self.discounts = {discount.name: discount for discount in Discount.objects.order_by('pk')}
+        self.discounts_by_pk = {discount.pk: discount for discount in self.discounts.values()}
+        self.search_backend = get_search_backend()
+
+    @property
+    def processed(self):
+        return self.created + self.updated + self.unchanged + len(self.errors)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        """Rows processed per second so far."""
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed else 0
+
+    def parse(self, row):
+        """Validate a raw row and convert it to model values."""
+        if isinstance(row, RowError):
+            raise row
+        if not isinstance(row, dict):
+            raise RowError('row is not an object')
+
+        sku = (row.get('sku') or '').strip()
+        if not sku:
+            raise RowError('sku is required')
+        name = (row.get('name') or '').strip()
+        if not name:
+            raise RowError('name is required')
+
+        values = {
+            'name': name,
+            'description': row.get('description') or '',
+            'price': _decimal(row.get('price'), 'price', required=True),
+            'rating': _decimal(row.get('rating'), 'rating'),
+            'is_available': _boolean(row.get('is_available')),
+            'image_url': None if _blank(row.get('image_url')) else row['image_url'],
+            'image': '' if _blank(row.get('image')) else row['image'],
+        }
+        try:
+            values['stock_quantity'] = int(row.get('stock_quantity') or 0)
+        except (TypeError, ValueError):
+            raise RowError(f"stock_quantity is not a number: {row.get('stock_quantity')!r}")
+
+        category = row.get('category')
+        if _blank(category):
+            values['category_id'] = None
+        elif category in self.categories:
+            values['category_id'] = self.categories[category]
+        else:
+            raise RowError(f'unknown category {category!r}')
+
+        # Leave discounts alone when the column is missing altogether
+        discounts = row.get('discounts')
+        if discounts is not None:
+            if isinstance(discounts, str):
+                discounts = [name for name in discounts.split(DISCOUNT_SEPARATOR) if name.strip()]
+            unknown = [name for name in discounts if name.strip() not in self.discounts]
+            if unknown:
+                raise RowError(f'unknown discount(s) {", ".join(unknown)}')
+            values['discount_ids'] = {self.discounts[name.strip()].pk for name in discounts}
+        return sku, values
+
+    def feed(self, line_number, row):
+        """Queue one row, flushing the batch when it is full."""
+        try:
+            sku, values = self.parse(row)
+        except RowError as e:
+            self.errors.append((line_number, str(e)))
+            return
+        # A later row for the same sku replaces an earlier one
+        self.batch[sku] = values
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def finish(self):
+        """
+        Flush the last batch and invalidate cached catalog pages and the
+        discount timeline, which bulk writes bypass the signals for.
+        """
+        self.flush()
+        bump_catalog_version()
+        timeline.invalidate()
+
+    @transaction.atomic
+    def flush(self):
+        """Write the queued rows with one bulk create and one bulk update."""
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, {}
+        now = timezone.now()
+
+        existing = {
+            product.sku: product
+            for product in HennaProduct.objects.filter(sku__in=batch.keys())
+            .prefetch_related(Prefetch('discounts', queryset=Discount.objects.only('pk')))
+        }
+        to_create, to_update, discount_changes = [], [], {}
+        update_fields = {'updated_at'}
+        for sku, values in batch.items():
+            discount_ids = values.pop('discount_ids', None)
+            product = existing.get(sku)
+            if product is None:
+                product = HennaProduct(sku=sku, **values)
+                linked_ids = discount_ids or set()
+                to_create.append(product)
+            else:
+                changed = False
+                for field, value in values.items():
+                    if getattr(product, field) != value:
+                        setattr(product, field, value)
+                        update_fields.add(field)
+                        changed = True
+                linked_ids = {discount.pk for discount in product.discounts.all()}
+                if discount_ids is not None and discount_ids != linked_ids:
+                    linked_ids = discount_ids
+                    changed = True
+                else:
+                    discount_ids = None
+                if not changed:
+                    self.unchanged += 1
+                    continue
+                product.updated_at = now
+                to_update.append(product)
+            if discount_ids is not None:
+                discount_changes[sku] = discount_ids
+
+            # Resolve the materialised price here rather than with a
+            # second pass through refresh_effective_prices()
+            product.prefetched_active_discounts = [
+                self.discounts_by_pk[pk] for pk in sorted(linked_ids)
+                if self.discounts_by_pk[pk].active
+            ]
+            pricing = resolve_effective_price(product)
+            if pricing != (product.effective_price, product.active_discount_id):
+                product.effective_price, product.active_discount_id = pricing
+                update_fields.update(('effective_price', 'active_discount_id'))
+
+        HennaProduct.objects.bulk_create(to_create)
+        if to_update:
+            HennaProduct.objects.bulk_update(
+                to_update, sorted(update_fields), batch_size=UPDATE_BATCH_SIZE
+            )
+
+        product_ids = dict(
+            HennaProduct.objects.filter(
+                sku__in=[product.sku for product in to_create + to_update]
+            ).values_list('sku', 'pk')
+        )
+        if discount_changes:
+            through = HennaProduct.discounts.through
+            through.objects.filter(
+                hennaproduct_id__in=[product_ids[sku] for sku in discount_changes]
+            ).delete()
+            through.objects.bulk_create([
+                through(hennaproduct_id=product_ids[sku], discount_id=discount_id)
+                for sku, discount_ids in discount_changes.items()
+                for discount_id in discount_ids
+            ])
+
+        if product_ids:
+            self.search_backend.index_products(list(product_ids.values()))
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        if self.progress:
+            self.progress(self)
+
+
+def import_products(stream, format, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Import every row of `stream` and return the finished CatalogImporter.
+    """
+    importer = CatalogImporter(batch_size, progress)
+    for line_number, row in read_rows(stream, format):
+        importer.feed(line_number, row)
+    importer.finish()
+    return importer
+
+
+def export_rows():
+    """Yield every product as an import-compatible dict, in pk order."""
+    products = HennaProduct.objects.select_related('category').prefetch_related(
+        Prefetch('discounts', queryset=Discount.objects.only('name').order_by('name'))
+    ).order_by('pk')
+    for product in products.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'sku': product.sku,
+            'name': product.name,
+            'description': product.description,
+            'price': str(product.price),
+            'rating': str(product.rating) if product.rating is not None else None,
+            'stock_quantity': product.stock_quantity,
+            'is_available': product.is_available,
+            'category': product.category.name if product.category else None,
+            'discounts': [discount.name for discount in product.discounts.all()],
+            'image_url': product.image_url,
+            'image': product.image.name or None,
+        }
+
+
+def export_products(stream, format):
+    """Write the catalog to `stream` and return the number of rows written."""
+    count = 0
+    if format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+    for row in export_rows():
+        if format == 'csv':
+            row['discounts'] = DISCOUNT_SEPARATOR.join(row['discounts'])
+            writer.writerow(row)
+        else:
+            stream.write(json.dumps(row) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,138 @@
+"""
+Catalog version stamp and the listing fragment cache built on it.
+
+Every cached catalog fragment is keyed on the current catalog version, so
+bumping the version (products.signals does this whenever a product,
+category or discount changes) invalidates all of them at once. The version
+is also bumped automatically when the next discount start/end time passes.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+VERSION_KEY = 'catalog:version'
+BOUNDARY_KEY = 'catalog:next_boundary'
+NO_BOUNDARY = 'none'
+
+LISTING_PARAMS = (
+    'sort', 'direction', 'category', 'q', 'discounted', 'price', 'rating', 'cursor',
+)
+# Parameters that only affect ordering and paging, not which products match
+ORDERING_PARAMS = ('sort', 'direction', 'cursor')
+
+
+def bump_catalog_version():
+    """Invalidate every fragment cached for the current catalog version."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    cache.delete(BOUNDARY_KEY)
+
+
+def get_next_discount_boundary():
+    """Return the next discount start or end time as a timestamp, if any."""
+    from .models import Discount
+
+    now = timezone.now()
+    boundaries = Discount.objects.filter(active=True).aggregate(
+        next_start=Min('start_date', filter=Q(start_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gt=now)),
+    )
+    upcoming = [value for value in boundaries.values() if value is not None]
+    return min(upcoming).timestamp() if upcoming else None
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version, bumping it first if a discount
+    window has opened or closed since it was stamped.
+    """
+    boundary = cache.get(BOUNDARY_KEY)
+    if boundary not in (None, NO_BOUNDARY) and boundary <= time.time():
+        bump_catalog_version()
+        boundary = None
+
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+
+    if boundary is None:
+        next_boundary = get_next_discount_boundary()
+        cache.set(BOUNDARY_KEY, next_boundary or NO_BOUNDARY, None)
+    return version
+
+
+def normalise_listing_params(params, ignore=()):
+    """
+    Reduce listing GET parameters to a canonical form so equivalent
+    requests share a cache entry.
+    """
+    normalised = {}
+    for name in LISTING_PARAMS:
+        if name in ignore:
+            continue
+        value = params.get(name)
+        if value is None:
+            continue
+        if name == 'category':
+            value = ','.join(sorted(value.split(',')))
+        elif name == 'q':
+            value = ' '.join(value.lower().split())
+        normalised[name] = value
+    return normalised
+
+
+def fragment_cache_key(namespace, params, ignore=()):
+    digest = hashlib.md5(
+        json.dumps(normalise_listing_params(params, ignore), sort_keys=True).encode()
+    ).hexdigest()
+    return f'catalog:{namespace}:{get_catalog_version()}:{digest}'
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_cached_fragment(namespace, params, build, ignore=(), timeout=None):
+    """
+    Return the fragment for `params` from the cache, calling `build()` and
+    caching its (picklable) result on a miss. Parameters in `ignore` are
+    left out of the key, and `timeout` defaults to CATALOG_CACHE_TTL.
+    Hits and misses are counted per namespace.
+    """
+    key = fragment_cache_key(namespace, params, ignore)
+    fragment = cache.get(key)
+    if fragment is not None:
+        _count(f'catalog:{namespace}:hits')
+        return fragment
+
+    _count(f'catalog:{namespace}:misses')
+    fragment = build()
+    if timeout is None:
+        timeout = getattr(settings, 'CATALOG_CACHE_TTL', 300)
+    cache.set(key, fragment, timeout)
+    return fragment
+
+
+def get_cached_listing(params, build):
+    """Return a listing page from the cache, building it on a miss."""
+    return get_cached_fragment('listing', params, build)
+
+
+def get_cache_stats(namespace='listing'):
+    """Return the hit and miss counters of a fragment namespace."""
+    return {
+        'hits': cache.get(f'catalog:{namespace}:hits', 0),
+        'misses': cache.get(f'catalog:{namespace}:misses', 0),
+    }
@@ -0,0 +1,90 @@
+"""
+Facet counts for the product listing.
+
+All counts for the current filter state come from a single query using
+conditional aggregation. Each dimension is counted with every other
+selected facet applied but not its own, so customers can see how many
+products they would get by switching bucket within a dimension.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import ORDERING_PARAMS, get_cached_fragment, get_catalog_version
+from .listing import (
+    PRICE_BUCKETS, RATING_BUCKETS, filter_products, get_facet_filters,
+    price_bucket_filter, rating_bucket_filter,
+)
+from .models import ProductsCategory
+
+FACET_DIMENSIONS = ('category', 'price', 'rating')
+
+
+def get_categories():
+    """Return `(value, label)` for every category, cached per catalog version."""
+    key = f'catalog:categories:{get_catalog_version()}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = [
+            (category.friendly_name or category.name, category.get_friendly_name())
+            for category in ProductsCategory.objects.order_by('friendly_name', 'name')
+        ]
+        cache.set(key, categories, None)
+    return categories
+
+
+def _other_facets(selected, dimension):
+    """Combine the selected filters of every dimension except `dimension`."""
+    combined = Q()
+    for other, facet_filter in selected.items():
+        if other != dimension:
+            combined &= facet_filter
+    return combined
+
+
+def compute_facets(params):
+    """
+    Return facet options with counts for the listing described by `params`:
+    `{'category': [{'value', 'label', 'count', 'selected'}, ...], ...}`.
+    """
+    selected = get_facet_filters(params)
+    products = filter_products(params, exclude_facets=FACET_DIMENSIONS)
+    categories = get_categories()
+
+    options = {dimension: [] for dimension in FACET_DIMENSIONS}
+    aggregates = {}
+    selected_categories = set(params.get('category', '').split(','))
+    for index, (value, label) in enumerate(categories):
+        bucket = Q(category__friendly_name=value) | Q(category__name=value)
+        aggregates[f'category_{index}'] = Count(
+            'pk', filter=bucket & _other_facets(selected, 'category')
+        )
+        options['category'].append({
+            'value': value, 'label': label, 'selected': value in selected_categories,
+        })
+    for index, (key, label, *bounds) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{index}'] = Count(
+            'pk', filter=price_bucket_filter(key) & _other_facets(selected, 'price')
+        )
+        options['price'].append({
+            'value': key, 'label': label, 'selected': params.get('price') == key,
+        })
+    for index, (key, label, minimum) in enumerate(RATING_BUCKETS):
+        aggregates[f'rating_{index}'] = Count(
+            'pk', filter=rating_bucket_filter(key) & _other_facets(selected, 'rating')
+        )
+        options['rating'].append({
+            'value': key, 'label': label, 'selected': params.get('rating') == key,
+        })
+
+    counts = products.aggregate(**aggregates)
+    for dimension, dimension_options in options.items():
+        for index, option in enumerate(dimension_options):
+            option['count'] = counts[f'{dimension}_{index}']
+    return options
+
+
+def get_facets(params):
+    """Return the facets for `params`, cached per catalog version."""
+    return get_cached_fragment(
+        'facets', params, lambda: compute_facets(params), ignore=ORDERING_PARAMS
+    )
@@ -97,3 +97,15 @@ class DiscountForm(forms.ModelForm):
             field.widget.attrs['class'] = field.widget.attrs.get(
                 'class', ''
             ) + ' form-control'
+
+
+# Sale Preview Form for pricing the catalog at a chosen date in the admin
+class SalePreviewForm(forms.Form):
+    at = forms.DateTimeField(
+        label='Preview prices at',
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+        input_formats=['%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M', '%Y-%m-%d'],
+    )
+    discounted_only = forms.BooleanField(
+        label='Only show discounted products', required=False
+    )
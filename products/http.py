@@ -0,0 +1,131 @@
+"""
+Conditional GET support for product detail pages.
+
+The validator is computed from one small query (the product's timestamp
+and the windows of its discounts) so unchanged pages can be answered with
+304 Not Modified without rendering. Parts of the page that belong to the
+visitor (cart summary, login state, CSRF token) are folded into the ETag,
+and only responses that carry none of them may be stored by shared caches.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from cart.storage import get_cart
+
+from .models import HennaProduct
+
+# Longest time anonymous, cookie-less clients (crawlers, shared caches)
+# may reuse a detail page before revalidating
+PRODUCT_DETAIL_MAX_AGE = 300
+
+
+class ProductValidators:
+    """Validators and caching lifetime for one product detail response."""
+
+    def __init__(self, etag, last_modified, max_age):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.max_age = max_age
+
+
+def get_product_validators(request, product_id):
+    """
+    Return ProductValidators for a product detail request, or None when the
+    product does not exist or the response must not be revalidated (e.g.
+    flash messages are waiting to be shown).
+    """
+    if request.session.get('_messages'):
+        return None
+
+    rows = list(
+        HennaProduct.objects.filter(pk=product_id).values_list(
+            'updated_at', 'discounts__pk', 'discounts__active',
+            'discounts__start_date', 'discounts__end_date',
+        )
+    )
+    if not rows:
+        return None
+
+    now = timezone.now()
+    last_modified = rows[0][0]
+    next_boundary = now + timedelta(seconds=PRODUCT_DETAIL_MAX_AGE)
+    active_discount = None
+
+    for updated_at, pk, active, start, end in sorted(rows, key=lambda row: row[1] or 0):
+        if pk is None or not active:
+            continue
+        if (start is None or start <= now) and (end is None or end >= now):
+            active_discount = active_discount or pk
+        # The page changes whenever a discount window opens or closes
+        for boundary in (start, end):
+            if boundary is None:
+                continue
+            if boundary <= now:
+                last_modified = max(last_modified, boundary)
+            else:
+                next_boundary = min(next_boundary, boundary)
+
+    visitor = (
+        request.user.pk,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        get_cart(request).dumps(),
+    )
+    digest = hashlib.md5(repr((
+        product_id, last_modified.isoformat(), active_discount,
+        getattr(settings, 'TEMPLATE_VERSION', ''), visitor,
+    )).encode()).hexdigest()
+
+    max_age = max(int((next_boundary - now).total_seconds()), 0)
+    return ProductValidators(f'"{digest}"', last_modified, max_age)
+
+
+def get_not_modified_response(request, validators):
+    """
+    Return a 304 response if the client's cached copy is still current.
+    Last-Modified is only trusted from clients without cookies, because it
+    does not cover the visitor-specific parts of the page.
+    """
+    last_modified = None if request.COOKIES else int(validators.last_modified.timestamp())
+    response = get_conditional_response(
+        request, etag=validators.etag, last_modified=last_modified
+    )
+    if response is not None and response.status_code == 304:
+        return patch_product_cache_headers(request, response, validators)
+    return None
+
+
+def patch_product_cache_headers(request, response, validators):
+    """
+    Add validators and a Cache-Control policy to a detail response.
+    Responses that are personal to the visitor always revalidate: they
+    show the visitor's cart, or carry a CSRF token or a cookie a shared
+    cache must not hand to anyone else. Everything else may be cached
+    until the next discount boundary.
+    """
+    response['ETag'] = validators.etag
+    patch_vary_headers(response, ['Cookie'])
+    if not request.COOKIES:
+        response['Last-Modified'] = http_date(validators.last_modified.timestamp())
+    if is_personal(request, response):
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=validators.max_age)
+    return response
+
+
+def is_personal(request, response):
+    """
+    Return whether a response belongs to one visitor. The CSRF and session
+    middleware add their cookies after the view, so the flags they act on
+    are checked as well as the cookies already set.
+    """
+    return bool(
+        request.COOKIES or response.cookies
+        or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        or getattr(request, 'session', None) is not None and request.session.modified
+    )
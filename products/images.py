@@ -0,0 +1,118 @@
+"""
+Resized WebP/JPEG derivatives of product images.
+
+Variants are written through the default storage (MediaStorage on S3 or
+MEDIA_ROOT locally) under products/variants/ and recorded in
+`HennaProduct.image_variants`, so templates can build srcsets without
+asking the storage what exists.
+"""
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> longest edge in pixels
+IMAGE_VARIANTS = {
+    'thumb': 100,
+    'card': 400,
+    'detail': 900,
+}
+
+# File extension -> Pillow format and save options
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANTS_LOCATION = 'products/variants'
+
+
+def variant_name(image_name, variant, extension):
+    """
+    Return the storage name of a variant. A digest of the full source name
+    keeps sources that share a stem, like cone.jpg and cone.png, apart.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    digest = hashlib.md5(image_name.encode()).hexdigest()[:8]
+    return f'{VARIANTS_LOCATION}/{stem}-{digest}-{variant}.{extension}'
+
+
+def generate_variants(image_name, storage=default_storage):
+    """
+    Write every variant of `image_name` to storage and return the mapping
+    to store on the product:
+    `{'source': name, 'card': {'width': 400, 'webp': ..., 'jpeg': ...}, ...}`.
+    """
+    with storage.open(image_name, 'rb') as source_file:
+        source = Image.open(source_file)
+        source.load()
+    source = ImageOps.exif_transpose(source)
+
+    # JPEG has no alpha channel, so flatten transparent PNGs onto white
+    if source.mode in ('RGBA', 'LA', 'P'):
+        source = source.convert('RGBA')
+        background = Image.new('RGB', source.size, (255, 255, 255))
+        background.paste(source, mask=source.getchannel('A'))
+        source = background
+    elif source.mode != 'RGB':
+        source = source.convert('RGB')
+
+    variants = {'source': image_name}
+    for variant, size in IMAGE_VARIANTS.items():
+        resized = source.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[variant] = {'width': resized.width}
+
+        for extension, (image_format, options) in IMAGE_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            name = variant_name(image_name, variant, extension)
+            # Only this source's own earlier variants can have this name
+            if storage.exists(name):
+                storage.delete(name)
+            variants[variant][extension] = storage.save(name, ContentFile(buffer.getvalue()))
+
+    return variants
+
+
+def safe_generate_variants(image_name, storage=default_storage):
+    """
+    Generate variants, logging and returning None when the source image is
+    missing or unreadable.
+    """
+    try:
+        return generate_variants(image_name, storage)
+    except (OSError, UnidentifiedImageError, ValueError) as e:
+        logger.error(f'Could not generate variants for {image_name}: {e}')
+        return None
+
+
+def variant_url(product, variant, extension='jpeg', storage=default_storage):
+    """
+    Return the URL of a product image variant, falling back to the
+    original upload when no variant has been generated.
+    """
+    variants = product.image_variants or {}
+    name = variants.get(variant, {}).get(extension)
+    if name:
+        return storage.url(name)
+    if product.image:
+        return product.image.url
+    return None
+
+
+def variant_srcset(product, extension, storage=default_storage):
+    """Return a `srcset` listing every generated variant in one format."""
+    variants = product.image_variants or {}
+    candidates = {}
+    for variant in IMAGE_VARIANTS:
+        details = variants.get(variant)
+        if details and details.get(extension):
+            candidates[details['width']] = storage.url(details[extension])
+    return ', '.join(f'{url} {width}w' for width, url in sorted(candidates.items()))
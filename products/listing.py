@@ -0,0 +1,165 @@
+"""
+Filtering, sorting and pagination shared by the product listing views.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Q, Value
+from django.db.models.functions import Coalesce, Lower
+from django.template.loader import render_to_string
+
+from .models import HennaProduct, ProductsCategory
+from .pagination import KeysetPaginator, count_products
+from .search import search_products
+
+
+# Price facet buckets: (key, label, lower bound, upper bound)
+PRICE_BUCKETS = (
+    ('under-5', 'Under £5', None, Decimal('5')),
+    ('5-10', '£5 to £10', Decimal('5'), Decimal('10')),
+    ('10-20', '£10 to £20', Decimal('10'), Decimal('20')),
+    ('20-plus', '£20 and over', Decimal('20'), None),
+)
+
+# Rating facet buckets: (key, label, minimum rating)
+RATING_BUCKETS = (
+    ('4-plus', '4 stars & up', Decimal('4')),
+    ('3-plus', '3 stars & up', Decimal('3')),
+    ('2-plus', '2 stars & up', Decimal('2')),
+)
+
+
+class EmptySearch(Exception):
+    """Raised when the search box was submitted without a query."""
+
+
+def get_sort_value(sort):
+    """
+    Return the expression a listing is sorted by. Nullable columns are
+    coalesced so every product has a comparable key for keyset pagination.
+    """
+    if sort == 'name':
+        return Lower('name')
+    if sort == 'price':
+        return F('listing_price')
+    if sort == 'rating':
+        return Coalesce('rating', Value(0), output_field=DecimalField(max_digits=3, decimal_places=1))
+    if sort == 'category':
+        return Coalesce('category__name', Value(''))
+    return F('pk')
+
+
+def price_bucket_filter(key):
+    """Return the filter for a price bucket key, or None if unknown."""
+    for bucket_key, label, lower, upper in PRICE_BUCKETS:
+        if bucket_key == key:
+            bucket = Q()
+            if lower is not None:
+                bucket &= Q(listing_price__gte=lower)
+            if upper is not None:
+                bucket &= Q(listing_price__lt=upper)
+            return bucket
+    return None
+
+
+def rating_bucket_filter(key):
+    """Return the filter for a rating bucket key, or None if unknown."""
+    for bucket_key, label, minimum in RATING_BUCKETS:
+        if bucket_key == key:
+            return Q(rating__gte=minimum)
+    return None
+
+
+def get_facet_filters(params):
+    """
+    Return the filter selected for each facet dimension, keyed by the
+    dimension's GET parameter. Unselected dimensions are omitted.
+    """
+    filters = {}
+    if params.get('category'):
+        categories = params['category'].split(',')
+        filters['category'] = (
+            Q(category__friendly_name__in=categories) | Q(category__name__in=categories)
+        )
+    price = price_bucket_filter(params.get('price'))
+    if price is not None:
+        filters['price'] = price
+    rating = rating_bucket_filter(params.get('rating'))
+    if rating is not None:
+        filters['rating'] = rating
+    return filters
+
+
+def filter_products(params, queryset=None, exclude_facets=()):
+    """
+    Apply the search, discount and facet parameters to `queryset`,
+    skipping the facet dimensions in `exclude_facets`. Products are
+    annotated with `listing_price`, the price the listing shows.
+    """
+    if queryset is None:
+        queryset = HennaProduct.objects.all()
+    products = queryset.annotate(listing_price=Coalesce('effective_price', 'price'))
+
+    if 'q' in params:
+        if not params['q']:
+            raise EmptySearch()
+        products = search_products(products, params['q'])
+
+    if params.get('discounted') == 'true':
+        products = products.filter(active_discount__isnull=False)
+
+    for dimension, facet_filter in get_facet_filters(params).items():
+        if dimension not in exclude_facets:
+            products = products.filter(facet_filter)
+    return products
+
+
+def build_listing(params):
+    """
+    Apply the sort, search, discount and facet parameters of a listing
+    request and return the first page after `params['cursor']` along with
+    the state the templates need.
+    """
+    products = filter_products(params, HennaProduct.objects.with_pricing())
+    query = params.get('q')
+    categories = None
+    sort = params.get('sort') or None
+    direction = params.get('direction') or None
+
+    if params.get('category'):
+        names = params['category'].split(',')
+        categories = ProductsCategory.objects.filter(
+            Q(friendly_name__in=names) | Q(name__in=names)
+        ).order_by('friendly_name')
+
+    if sort is None and query:
+        sort_value = F('search_rank')
+    else:
+        sort_value = get_sort_value(sort)
+
+    paginator = KeysetPaginator(products, sort_value, descending=direction == 'desc')
+    page = paginator.get_page(params.get('cursor'))
+    result_count, count_is_estimate = count_products(products)
+
+    return {
+        'products': page,
+        'result_count': result_count,
+        'count_is_estimate': count_is_estimate,
+        'search_term': query,
+        'current_categories': categories,
+        'current_sorting': f'{sort}_{direction}',
+        'next_cursor': page.next_cursor,
+    }
+
+
+def render_listing(params):
+    """
+    Build a listing and render its product grid, returning only picklable
+    values so the result can be stored in the listing cache.
+    """
+    listing = build_listing(params)
+    listing['grid_html'] = render_to_string(
+        'products/includes/product_cards.html', {'products': listing.pop('products')}
+    )
+    categories = listing['current_categories']
+    listing['current_categories'] = list(categories) if categories is not None else None
+    return listing
@@ -0,0 +1,72 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.autocomplete import PRODUCT, PrefixIndex, build_index, normalise
+
+WORDS = (
+    'henna', 'cone', 'natural', 'organic', 'paste', 'powder', 'bridal', 'kit',
+    'starter', 'professional', 'stencil', 'oil', 'eucalyptus', 'lavender', 'jamila',
+    'rajasthani', 'mehndi', 'applicator', 'bottle', 'aftercare', 'balm', 'jagua',
+)
+
+
+class Command(BaseCommand):
+    """
+    Time prefix index builds and lookups, either on a synthetic catalog of
+    --products entries or (with --catalog) on the real one.
+    """
+    help = 'Benchmark the autocomplete prefix index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000,
+                            help='Synthetic products to index (default 100000).')
+        parser.add_argument('--lookups', type=int, default=10000,
+                            help='Lookups to time (default 10000).')
+        parser.add_argument('--catalog', action='store_true',
+                            help='Index the products in the database instead.')
+
+    def synthetic_entries(self, count):
+        rng = random.Random(0)
+        entries = []
+        for pk in range(1, count + 1):
+            name = ' '.join(rng.sample(WORDS, 3)).title() + f' {pk}'
+            search_text = normalise(f'{name} SKU{pk:06d}')
+            entries.append((PRODUCT, pk, name, search_text, -rng.randint(0, 50) / 10))
+        return entries
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['catalog']:
+            index = build_index()
+        else:
+            index = PrefixIndex(self.synthetic_entries(options['products']))
+        build_seconds = time.perf_counter() - started
+
+        rng = random.Random(1)
+        queries = []
+        for _ in range(options['lookups']):
+            word = rng.choice(WORDS)
+            query = word[:rng.randint(1, len(word))]
+            if rng.random() < 0.3:
+                other = rng.choice(WORDS)
+                query = f'{word} {other[:rng.randint(1, len(other))]}'
+            queries.append(query)
+
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.lookup(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        self.stdout.write(
+            f'Indexed {len(index)} entries ({len(index.keys)} keys) in {build_seconds:.2f}s'
+        )
+        self.stdout.write(
+            f'{len(timings)} lookups: mean {statistics.mean(timings):.3f}ms, '
+            f'p50 {timings[len(timings) // 2]:.3f}ms, '
+            f'p99 {timings[int(len(timings) * 0.99)]:.3f}ms, max {timings[-1]:.3f}ms'
+        )
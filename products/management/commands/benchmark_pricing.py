@@ -0,0 +1,92 @@
+import gc
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.models import Discount, HennaProduct
+from products.pricing import price_products
+from products.timeline import DiscountTimeline
+
+
+class Command(BaseCommand):
+    """
+    Compare `price_products()` with per-object `get_discounted_price()` on
+    a synthetic in-memory catalog. Both price the same loaded products, so
+    the timings compare pricing alone; what batch pricing saves in
+    practice is loading model instances, since it accepts `(pk, price)`
+    rows. Nothing is read from or written to the database.
+    """
+    help = 'Benchmark batch pricing against per-object pricing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000,
+                            help='Synthetic products to price (default 50000).')
+        parser.add_argument('--discounts', type=int, default=50,
+                            help='Synthetic discounts to spread over them (default 50).')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        now = timezone.now()
+        discounts = [
+            Discount(
+                pk=pk, name=f'Discount {pk}',
+                discount_type=rng.choice(('percentage', 'fixed')),
+                value=Decimal(rng.randint(50, 6000)) / 100,
+                # Half-day offsets keep boundaries away from `now`
+                start_date=now + timedelta(days=rng.randint(-30, 10), hours=12),
+                end_date=now + timedelta(days=rng.randint(-5, 30), hours=12),
+            )
+            for pk in range(1, options['discounts'] + 1)
+        ]
+        rows, linked_discounts, links = [], {}, []
+        for pk in range(1, options['products'] + 1):
+            rows.append((pk, Decimal(rng.randint(50, 10000)) / 100))
+            linked = sorted(rng.sample(discounts, rng.choice((0, 0, 1, 2))), key=lambda d: d.pk)
+            linked_discounts[pk] = linked
+            links.extend((pk, discount.pk) for discount in linked)
+
+        # Both paths price the same loaded instances, built outside the timed
+        # sections so neither is charged for constructing models
+        products = []
+        for pk, price in rows:
+            product = HennaProduct(pk=pk, price=price)
+            product.prefetched_active_discounts = linked_discounts[pk]
+            products.append(product)
+        pairs = [(product.pk, product.price) for product in products]
+
+        # Collections triggered by the catalog itself would dominate timings
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            timeline = DiscountTimeline(discounts, links, now)
+            build_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            per_object = {product.pk: product.get_discounted_price(now) for product in products}
+            per_object_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            batch = price_products(pairs, now, timeline)
+            batch_seconds = time.perf_counter() - started
+        finally:
+            gc.enable()
+
+        mismatches = sum(
+            1 for pk, price in per_object.items()
+            if price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) != batch[pk].price
+        )
+        count = len(rows)
+        self.stdout.write(f'Timeline for {len(discounts)} discounts built in {build_seconds:.3f}s')
+        self.stdout.write(
+            f'Per object: {per_object_seconds:.3f}s ({count / per_object_seconds:.0f} products/s)'
+        )
+        self.stdout.write(
+            f'Batch:      {batch_seconds:.3f}s ({count / batch_seconds:.0f} products/s, '
+            f'{per_object_seconds / batch_seconds:.1f}x)'
+        )
+        self.stdout.write(f'Mismatched prices: {mismatches}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from products.cache import get_cache_stats, get_catalog_version
+
+
+NAMESPACES = ('listing', 'facets', 'top_rated')
+
+
+class Command(BaseCommand):
+    help = 'Show the catalog version and fragment cache hit/miss counters.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Catalog version: {get_catalog_version()}')
+
+        for namespace in NAMESPACES:
+            stats = get_cache_stats(namespace)
+            requests = stats['hits'] + stats['misses']
+            hit_rate = stats['hits'] / requests * 100 if requests else 0
+            self.stdout.write(
+                f"{namespace}: {stats['hits']} hits, {stats['misses']} misses "
+                f'({hit_rate:.1f}% hit rate)'
+            )
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.bulk import export_products, get_format
+
+
+class Command(BaseCommand):
+    """
+    Stream the catalog to a CSV or JSON Lines file in the format read by
+    `import_products`.
+    """
+    help = 'Export products to a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write, or '-' for stdout.")
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'),
+            help='File format (default: guessed from the file extension).'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = get_format(path, options['format'])
+        started = time.monotonic()
+
+        if path == '-':
+            export_products(self.stdout, format)
+            return
+
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            count = export_products(stream, format)
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} product(s) to {path} in {elapsed:.2f}s ({rate:.0f} rows/s).'
+        ))
@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from products.cache import bump_catalog_version
+from products.images import safe_generate_variants
+from products.models import HennaProduct
+
+SAVE_BATCH_SIZE = 100
+
+
+def _process_image(product_id, image_name):
+    """Worker entry point: resize one product image in a child process."""
+    return product_id, safe_generate_variants(image_name)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for existing product images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of worker processes (default: one per CPU).'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate variants that already exist.'
+        )
+
+    def handle(self, *args, **options):
+        products = HennaProduct.objects.exclude(image='').exclude(image__isnull=True)
+        jobs = [
+            (product.pk, product.image.name)
+            for product in products.only('pk', 'image', 'image_variants')
+            if options['force'] or product.image_variants.get('source') != product.image.name
+        ]
+        if not jobs:
+            self.stdout.write('All product images already have variants.')
+            return
+
+        started = time.monotonic()
+        pending = []
+        processed = failed = 0
+
+        # Child processes must not inherit open database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [executor.submit(_process_image, *job) for job in jobs]
+            for future in as_completed(futures):
+                product_id, variants = future.result()
+                if variants is None:
+                    failed += 1
+                    continue
+                pending.append(HennaProduct(pk=product_id, image_variants=variants))
+                processed += 1
+                if len(pending) >= SAVE_BATCH_SIZE:
+                    HennaProduct.objects.bulk_update(pending, ['image_variants'])
+                    pending = []
+
+        if pending:
+            HennaProduct.objects.bulk_update(pending, ['image_variants'])
+        bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants for {processed} image(s) in {elapsed:.1f}s '
+            f'({failed} failed).'
+        ))
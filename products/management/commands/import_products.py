@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from products.bulk import IMPORT_BATCH_SIZE, get_format, import_products
+
+
+class Command(BaseCommand):
+    """
+    Upsert products by sku from a CSV or JSON Lines file. The file is
+    streamed and written in batches, so large catalogs load in bounded
+    memory. Unlike `loaddata`, prices and the search index are refreshed.
+    """
+    help = 'Import products from a CSV or JSON Lines file, upserting by sku.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'),
+            help='File format (default: guessed from the file extension).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help=f'Rows written per batch (default {IMPORT_BATCH_SIZE}).'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = get_format(path, options['format'])
+
+        def progress(importer):
+            self.stdout.write(f'{importer.processed} rows ({importer.rate:.0f} rows/s)')
+
+        try:
+            if path == '-':
+                importer = import_products(sys.stdin, format, options['batch_size'], progress)
+            else:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    importer = import_products(stream, format, options['batch_size'], progress)
+        except OSError as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        except IntegrityError as e:
+            raise CommandError(f'Import stopped, a batch conflicts with existing products: {e}')
+
+        for line_number, error in importer.errors:
+            self.stderr.write(f'Line {line_number}: {error}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.processed} row(s) in {importer.elapsed:.2f}s '
+            f'({importer.rate:.0f} rows/s): {importer.created} created, {importer.updated} updated, '
+            f'{importer.unchanged} unchanged, {len(importer.errors)} skipped.'
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import HennaProduct
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all products.'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.monotonic()
+
+        with transaction.atomic():
+            backend.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {HennaProduct.objects.count()} product(s) with '
+            f'{type(backend).__name__} in {time.monotonic() - started:.2f}s.'
+        ))
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from products.models import HennaProduct
+from products.pricing import refresh_effective_prices
+from products.timeline import invalidate
+
+
+class Command(BaseCommand):
+    """
+    Re-materialise product prices around discount start/end boundaries.
+    Intended to run on a schedule (e.g. the Heroku Scheduler every 10
+    minutes) with a --window at least as long as the interval.
+    """
+    help = 'Refresh effective prices for products whose discounts started or ended recently.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=int, default=15,
+            help='Minutes to look back for discount start/end boundaries (default 15).'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Refresh every product in the catalog.'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Pick up discount edits made without signals (e.g. queryset updates)
+        invalidate()
+
+        if options['all']:
+            products = None
+        else:
+            since = now - timedelta(minutes=options['window'])
+            crossed_boundary = (
+                Q(discounts__start_date__gt=since, discounts__start_date__lte=now)
+                | Q(discounts__end_date__gte=since, discounts__end_date__lt=now)
+            )
+            # Also catch anything a missed run left behind: discounts that
+            # have ended, and discounts that have started but are not the
+            # one stored (the earliest applicable discount wins)
+            stale = (
+                Q(active_discount__end_date__lt=now)
+                | Q(active_discount__active=False)
+                | Q(effective_price__isnull=True)
+            )
+            started = (
+                Q(discounts__active=True)
+                & (Q(discounts__start_date__isnull=True) | Q(discounts__start_date__lte=now))
+                & (Q(discounts__end_date__isnull=True) | Q(discounts__end_date__gte=now))
+                & (Q(active_discount__isnull=True) | Q(discounts__pk__lt=F('active_discount')))
+            )
+            products = HennaProduct.objects.filter(
+                crossed_boundary | stale | started
+            ).values('pk')
+
+        changed = refresh_effective_prices(products)
+        self.stdout.write(self.style.SUCCESS(f'Refreshed prices for {changed} product(s).'))
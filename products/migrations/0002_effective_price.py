@@ -0,0 +1,52 @@
+# Generated by Django 5.1 on 2026-10-18 14:11
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_effective_prices(apps, schema_editor):
+    """Materialise prices for existing products using the rules in
+    HennaProduct.get_discounted_price (historical models lack methods)."""
+    HennaProduct = apps.get_model('products', 'HennaProduct')
+    now = timezone.now()
+    products = HennaProduct.objects.prefetch_related('discounts')
+    for product in products:
+        discount = next((
+            d for d in sorted(product.discounts.all(), key=lambda d: d.pk)
+            if d.active
+            and (d.start_date is None or d.start_date <= now)
+            and (d.end_date is None or d.end_date >= now)
+        ), None)
+        price = product.price
+        if discount and discount.discount_type == 'percentage':
+            price = product.price * (1 - (discount.value / 100))
+        elif discount and discount.discount_type == 'fixed':
+            price = product.price - discount.value
+        price = max(price, Decimal('0.99'))
+        product.effective_price = price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        product.active_discount = discount
+        product.save(update_fields=['effective_price', 'active_discount'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hennaproduct',
+            name='active_discount',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.discount'),
+        ),
+        migrations.AddField(
+            model_name='hennaproduct',
+            name='effective_price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(populate_effective_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Create the vendor-specific full-text index and populate it."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS products_search_index ("
+            "product_id bigint PRIMARY KEY "
+            "REFERENCES products_hennaproduct (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS products_search_index_document_gin "
+            "ON products_search_index USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO products_search_index (product_id, document) "
+            "SELECT id, "
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(sku, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B') "
+            "FROM products_hennaproduct"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_search_fts "
+            "USING fts5(name, sku, description, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            "INSERT INTO products_search_fts (rowid, name, sku, description) "
+            "SELECT id, name, coalesce(sku, ''), description FROM products_hennaproduct"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS products_search_index")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS products_search_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_effective_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
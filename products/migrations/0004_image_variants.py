@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hennaproduct',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 14:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hennaproduct',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hennaproduct',
+            name='rating',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=1, max_digits=3, null=True),
+        ),
+    ]
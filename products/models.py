@@ -1,5 +1,11 @@
+from decimal import Decimal
+
 from django.db import models
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+# No product is sold for less than this, whatever its discount
+MINIMUM_PRICE = Decimal('0.99')
 
 class ProductsCategory(models.Model):
     """
@@ -51,12 +57,26 @@ class Discount(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_discount_type_display()})"
 
-    def is_active(self):
-        """Check if the discount is active and within its date range."""
-        now = timezone.now()
+    def is_active(self, at=None):
+        """Check if the discount is active and within its date range at `at` (default now)."""
+        now = at or timezone.now()
         return self.active and (self.start_date is None or self.start_date <= now) and (self.end_date is None or self.end_date >= now)
 
 
+class HennaProductQuerySet(models.QuerySet):
+    """
+    QuerySet for products with helpers for bulk price resolution.
+    """
+
+    def with_pricing(self):
+        """
+        Select the category alongside each product. Discounts are resolved
+        through the process-local timeline in products.timeline, so
+        rendering prices for the whole result set issues no further queries.
+        """
+        return self.select_related('category')
+
+
 class HennaProduct(models.Model):
     """
     Model representing a product in the Henna app.
@@ -66,34 +86,59 @@ class HennaProduct(models.Model):
     name = models.CharField(max_length=254, unique=True)
     description = models.TextField() 
     price = models.DecimalField(max_digits=10, decimal_places=2) 
-    rating = models.DecimalField(max_digits=3, decimal_places=1, null=True, blank=True) 
+    rating = models.DecimalField(max_digits=3, decimal_places=1, null=True, blank=True, db_index=True)
     stock_quantity = models.PositiveIntegerField(default=0) 
     is_available = models.BooleanField(default=True) 
     date_added = models.DateTimeField(default=timezone.now)
+    # Set in save() rather than with auto_now, so fixtures loaded with
+    # loaddata (which skips pre_save) still get a value
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
     image_url = models.URLField(max_length=1024, null=True, blank=True)
     image = models.ImageField(upload_to='products/', null=True, blank=True) 
+    # Resized derivatives of `image`, written by products.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     discounts = models.ManyToManyField(Discount, blank=True) 
 
+    # Denormalised pricing, refreshed by products.signals and the
+    # refresh_prices management command.
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, null=True,
+                                          blank=True, editable=False, db_index=True)
+    active_discount = models.ForeignKey(Discount, null=True, blank=True, editable=False,
+                                        on_delete=models.SET_NULL, related_name='+')
+
+    objects = HennaProductQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
-    def get_current_discount(self):
+    def save(self, *args, **kwargs):
+        """Record the modification time for conditional GETs."""
+        self.updated_at = timezone.now()
+        super().save(*args, **kwargs)
+
+    def get_current_discount(self, at=None):
         """
-        Return the currently active discount applied to the product (if any).
+        Return the discount applied to the product at `at` (default now), if
+        any. Looked up in the discount timeline index unless the candidate
+        discounts were given explicitly as `prefetched_active_discounts`.
         """
-        active_discounts = self.discounts.filter(active=True)
-        for discount in active_discounts:
-            if discount.is_active():
-                return discount
-        return None
-
-    def get_discounted_price(self):
+        if hasattr(self, 'prefetched_active_discounts'):
+            for discount in self.prefetched_active_discounts:
+                if discount.is_active(at):
+                    return discount
+            return None
+        if self.pk is None:
+            return None
+        from .timeline import get_active_discount
+        return get_active_discount(self.pk, at)
+
+    def get_discounted_price(self, at=None):
         """
         Calculate the discounted price of the product, if any active discount applies.
         The minimum price is set to £0.99 regardless of discount.
         """
-        discount = self.get_current_discount()
+        discount = self.get_current_discount(at)
         if discount:
             if discount.discount_type == 'percentage':
                 discounted_price = self.price * (1 - (discount.value / 100))
@@ -105,4 +150,14 @@ class HennaProduct(models.Model):
             discounted_price = self.price
         
         # Ensure the discounted price does not go below £0.99
-        return max(discounted_price, 0.99)
+        return max(discounted_price, MINIMUM_PRICE)
+
+    @cached_property
+    def current_discount(self):
+        """The active discount, resolved once per instance."""
+        return self.get_current_discount()
+
+    @cached_property
+    def discounted_price(self):
+        """The effective price, resolved once per instance."""
+        return self.get_discounted_price()
@@ -0,0 +1,128 @@
+"""
+Keyset (cursor) pagination for product listings.
+
+Pages are addressed by the sort value and primary key of the last product
+on the previous page instead of an OFFSET, so fetching page N costs the
+same as fetching page 1 and results stay stable while the catalog changes.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+PRODUCTS_PER_PAGE = 24
+COUNT_EXACT_LIMIT = 1000
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor cannot be decoded or does not fit the sort."""
+
+
+def encode_cursor(sort_value, pk):
+    """Encode the position after a product as an opaque URL-safe token."""
+    payload = json.dumps([None if sort_value is None else str(sort_value), pk])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor token back into `(sort_value, pk)`."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, int(pk)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+    """A page of results and the cursor for the page after it."""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset ordered by a single non-null `sort_value`
+    expression, with the primary key as tie-breaker.
+    """
+
+    def __init__(self, queryset, sort_value, descending=False, per_page=PRODUCTS_PER_PAGE):
+        self.queryset = queryset.annotate(sort_value=sort_value)
+        self.descending = descending
+        self.per_page = per_page
+
+    def decode(self, cursor):
+        """
+        Decode `cursor`, converting its sort value to the type of the sort
+        expression so a forged value fails here rather than in the query.
+        """
+        sort_value, pk = decode_cursor(cursor)
+        field = self.queryset.query.annotations['sort_value'].output_field
+        try:
+            sort_value = field.to_python(sort_value)
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        if sort_value is None:
+            raise InvalidCursor(cursor)
+        return sort_value, pk
+
+    def get_page(self, cursor=None):
+        """Return the page following `cursor`, or the first page."""
+        queryset = self.queryset
+        if cursor:
+            sort_value, pk = self.decode(cursor)
+            if self.descending:
+                after = Q(sort_value__lt=sort_value) | Q(sort_value=sort_value, pk__lt=pk)
+            else:
+                after = Q(sort_value__gt=sort_value) | Q(sort_value=sort_value, pk__gt=pk)
+            queryset = queryset.filter(after)
+
+        if self.descending:
+            queryset = queryset.order_by('-sort_value', '-pk')
+        else:
+            queryset = queryset.order_by('sort_value', 'pk')
+
+        # Fetch one extra row to find out whether another page exists
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            last = rows[-1]
+            next_cursor = encode_cursor(last.sort_value, last.pk)
+        return KeysetPage(rows, next_cursor)
+
+
+def count_products(queryset, limit=COUNT_EXACT_LIMIT):
+    """
+    Count a queryset without scanning all of a large result.
+    Returns `(count, is_estimate)`: exact up to `limit`, otherwise the
+    planner's row estimate on Postgres or `limit` as a lower bound.
+    """
+    capped = queryset.order_by().values('pk')[:limit + 1].count()
+    if capped <= limit:
+        return capped, False
+
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return max(int(plan[0]['Plan']['Plan Rows']), limit), True
+
+    return limit, True
@@ -0,0 +1,136 @@
+"""
+Effective price resolution, per product and for many products at once.
+"""
+from array import array
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import islice
+
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import MINIMUM_PRICE, HennaProduct
+from .timeline import get_timeline
+
+REFRESH_BATCH_SIZE = 500
+
+# Batch prices are computed as integers in units of 1/10000 of a penny,
+# which represents every price and percentage discount exactly
+SCALE = 10000
+MINIMUM_UNITS = int(MINIMUM_PRICE * 100) * SCALE
+
+ProductPrice = namedtuple('ProductPrice', ('price', 'discount'))
+
+
+def resolve_effective_price(product):
+    """
+    Return `(effective_price, active_discount_id)` for a product, resolving
+    its discount through the timeline index (or `prefetched_active_discounts`).
+    """
+    discount = product.current_discount
+    effective_price = Decimal(product.discounted_price).quantize(
+        Decimal('0.01'), rounding=ROUND_HALF_UP
+    )
+    return effective_price, discount.pk if discount else None
+
+
+def _discount_columns(discount):
+    """Return `(percent_off, amount_off)` for a discount in integer units."""
+    if discount is None:
+        return 0, 0
+    if discount.discount_type == 'percentage':
+        # Hundredths of a percent, so `price * (SCALE - percent_off)` is exact
+        return int(discount.value * 100), 0
+    if discount.discount_type == 'fixed':
+        return 0, int(discount.value * 100) * SCALE
+    return 0, 0
+
+
+def price_products(products, at=None, timeline=None):
+    """
+    Price many products at time `at` (default now) in one pass and return
+    `{pk: ProductPrice(price, discount)}`.
+
+    `products` is a queryset of products or an iterable of `(pk, price)`
+    pairs. Discounts come from the timeline index. The discounted rows are
+    converted to integer columns, and the arithmetic, the £0.99 floor and
+    the half-up rounding to pence run over whole columns, so the results
+    match `HennaProduct.get_discounted_price()` exactly.
+    """
+    at = at or timezone.now()
+    timeline = timeline or get_timeline()
+    if hasattr(products, 'values_list'):
+        products = products.values_list('pk', 'price')
+
+    ids, prices, discounts = [], [], []
+    for pk, price in products:
+        ids.append(pk)
+        prices.append(price)
+        discounts.append(timeline.active_discount(pk, at))
+
+    # Undiscounted prices pass through apart from the floor
+    effective = [price if price >= MINIMUM_PRICE else MINIMUM_PRICE for price in prices]
+
+    rows = [index for index, discount in enumerate(discounts) if discount is not None]
+    columns = {}
+    for index in rows:
+        discount = discounts[index]
+        if discount.pk not in columns:
+            columns[discount.pk] = _discount_columns(discount)
+    pence = array('q', (int(prices[index] * 100) for index in rows))
+    percent_off = array('q', (columns[discounts[index].pk][0] for index in rows))
+    amount_off = array('q', (columns[discounts[index].pk][1] for index in rows))
+
+    units = [
+        max(price * (SCALE - percent) - amount, MINIMUM_UNITS)
+        for price, percent, amount in zip(pence, percent_off, amount_off)
+    ]
+    # Round half up to whole pence, converting each distinct value once
+    decimals = {}
+    for index, value in zip(rows, units):
+        value = (value + SCALE // 2) // SCALE
+        if value not in decimals:
+            decimals[value] = Decimal(value).scaleb(-2)
+        effective[index] = decimals[value]
+
+    return {
+        pk: ProductPrice(price, discount)
+        for pk, price, discount in zip(ids, effective, discounts)
+    }
+
+
+def refresh_effective_prices(products=None):
+    """
+    Re-materialise `effective_price` and `active_discount` for the given
+    products (a queryset or iterable of ids), or for the whole catalog.
+    Prices are resolved with `price_products()` and written back with
+    `bulk_update`, which does not send signals. Returns the number of
+    products that changed.
+    """
+    queryset = HennaProduct.objects.order_by('pk')
+    if products is not None:
+        queryset = queryset.filter(pk__in=products)
+    rows = queryset.values_list(
+        'pk', 'price', 'effective_price', 'active_discount_id'
+    ).iterator(chunk_size=REFRESH_BATCH_SIZE)
+
+    now = timezone.now()
+    changed = []
+    while chunk := list(islice(rows, REFRESH_BATCH_SIZE)):
+        prices = price_products([(pk, price) for pk, price, *_ in chunk], now)
+        for pk, price, effective_price, discount_id in chunk:
+            resolved = prices[pk]
+            resolved_discount_id = resolved.discount.pk if resolved.discount else None
+            if effective_price != resolved.price or discount_id != resolved_discount_id:
+                changed.append(HennaProduct(
+                    pk=pk, effective_price=resolved.price,
+                    active_discount_id=resolved_discount_id, updated_at=now,
+                ))
+
+    if changed:
+        HennaProduct.objects.bulk_update(
+            changed, ['effective_price', 'active_discount', 'updated_at'],
+            batch_size=REFRESH_BATCH_SIZE
+        )
+        bump_catalog_version()
+    return len(changed)
@@ -0,0 +1,234 @@
+"""
+Full-text search backends for the product catalog.
+
+The index lives in a shadow table next to `products_hennaproduct`: a
+tsvector column with a GIN index on Postgres, and an FTS5 virtual table on
+SQLite. Both are created by migration 0003 and kept in sync by
+products.signals. Set `SEARCH_BACKEND` to a dotted path to override the
+backend chosen for the database vendor.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+PRODUCT_TABLE = 'products_hennaproduct'
+POSTGRES_INDEX_TABLE = 'products_search_index'
+SQLITE_INDEX_TABLE = 'products_search_fts'
+
+
+class SearchBackend:
+    """
+    Base class for search backends. Subclasses implement `match_sql()` and
+    `rank_sql()`, which the search query is built from, and the index
+    maintenance hooks.
+    """
+
+    def filter(self, queryset, query):
+        """
+        Restrict `queryset` to products matching `query`, annotated with a
+        `search_rank` (lower is a better match) for ordering. The match is
+        a subquery of the queryset's own query, so the other filters,
+        counts and facets see every matching product.
+        """
+        match = self.match_sql(query)
+        if match is None:
+            return queryset.none().annotate(search_rank=Value(0.0))
+        rank_sql, rank_params = self.rank_sql(query)
+        return queryset.filter(pk__in=RawSQL(*match)).annotate(
+            search_rank=RawSQL(rank_sql, rank_params, output_field=FloatField())
+        )
+
+    def match_sql(self, query):
+        """
+        Return `(sql, params)` selecting the ids of the products matching
+        `query`, or None if nothing can match.
+        """
+        raise NotImplementedError
+
+    def rank_sql(self, query):
+        """
+        Return `(sql, params)` computing the rank of the product in the
+        outer query, lower ranking first.
+        """
+        raise NotImplementedError
+
+    def index_products(self, product_ids):
+        """Add or refresh the index entries for the given products."""
+
+    def remove_products(self, product_ids):
+        """Drop the index entries for the given products."""
+
+    def rebuild(self):
+        """Rebuild the whole index from the product table."""
+
+
+class SimpleSearchBackend(SearchBackend):
+    """
+    Unindexed fallback using case-insensitive substring matching.
+    """
+
+    def filter(self, queryset, query):
+        queries = Q(name__icontains=query) | Q(description__icontains=query)
+        return queryset.filter(queries).annotate(search_rank=Value(0))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Weighted tsvector documents (name and SKU above description) with a GIN
+    index, ranked with ts_rank_cd. Every search term is matched as a prefix.
+    """
+
+    document_sql = (
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(sku, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    )
+
+    def tsquery(self, query):
+        """
+        Return a `to_tsquery` expression matching every word of `query` as
+        a prefix, like the SQLite backend, or None if it has no words.
+        """
+        # Words are quoted as lexemes; \w never matches a quote or backslash
+        terms = re.findall(r'\w+', query)
+        return ' & '.join(f"'{term}':*" for term in terms) or None
+
+    def match_sql(self, query):
+        tsquery = self.tsquery(query)
+        if tsquery is None:
+            return None
+        return (
+            f"SELECT product_id FROM {POSTGRES_INDEX_TABLE} "
+            "WHERE document @@ to_tsquery('english', %s)",
+            [tsquery],
+        )
+
+    def rank_sql(self, query):
+        # Negated so that, like bm25, lower ranks first
+        return (
+            "(SELECT -ts_rank_cd(document, to_tsquery('english', %s)) "
+            f"FROM {POSTGRES_INDEX_TABLE} WHERE product_id = {PRODUCT_TABLE}.id)",
+            [self.tsquery(query)],
+        )
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_INDEX_TABLE} (product_id, document) "
+                f"SELECT id, {self.document_sql} FROM {PRODUCT_TABLE} "
+                "WHERE id = ANY(%s) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                [product_ids],
+            )
+
+    def remove_products(self, product_ids):
+        # Rows are removed by the ON DELETE CASCADE foreign key
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {POSTGRES_INDEX_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_INDEX_TABLE} (product_id, document) "
+                f"SELECT id, {self.document_sql} FROM {PRODUCT_TABLE}"
+            )
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 shadow table keyed by product id, ranked with bm25.
+    Every search term is matched as a prefix.
+    """
+
+    def match_expression(self, query):
+        terms = re.findall(r'\w+', query)
+        return ' '.join(f'"{term}"*' for term in terms) or None
+
+    def match_sql(self, query):
+        match = self.match_expression(query)
+        if match is None:
+            return None
+        return (
+            f"SELECT rowid FROM {SQLITE_INDEX_TABLE} WHERE {SQLITE_INDEX_TABLE} MATCH %s",
+            [match],
+        )
+
+    def rank_sql(self, query):
+        return (
+            f"(SELECT bm25({SQLITE_INDEX_TABLE}, 10.0, 10.0, 1.0) FROM {SQLITE_INDEX_TABLE} "
+            f"WHERE {SQLITE_INDEX_TABLE} MATCH %s AND rowid = {PRODUCT_TABLE}.id)",
+            [self.match_expression(query)],
+        )
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SQLITE_INDEX_TABLE} WHERE rowid IN ({placeholders})",
+                product_ids,
+            )
+            cursor.execute(
+                f"INSERT INTO {SQLITE_INDEX_TABLE} (rowid, name, sku, description) "
+                f"SELECT id, name, coalesce(sku, ''), description FROM {PRODUCT_TABLE} "
+                f"WHERE id IN ({placeholders})",
+                product_ids,
+            )
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SQLITE_INDEX_TABLE} WHERE rowid IN ({placeholders})",
+                product_ids,
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_INDEX_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SQLITE_INDEX_TABLE} (rowid, name, sku, description) "
+                f"SELECT id, name, coalesce(sku, ''), description FROM {PRODUCT_TABLE}"
+            )
+
+
+_backends = {}
+
+
+def get_search_backend():
+    """
+    Return the configured backend, or the one matching the database vendor
+    when its index table exists, falling back to SimpleSearchBackend.
+    """
+    backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+    key = backend_path or connection.vendor
+    if key not in _backends:
+        if backend_path:
+            backend = import_string(backend_path)()
+        elif (connection.vendor == 'postgresql'
+              and POSTGRES_INDEX_TABLE in connection.introspection.table_names()):
+            backend = PostgresSearchBackend()
+        elif (connection.vendor == 'sqlite'
+              and SQLITE_INDEX_TABLE in connection.introspection.table_names()):
+            backend = SQLiteSearchBackend()
+        else:
+            backend = SimpleSearchBackend()
+        _backends[key] = backend
+    return _backends[key]
+
+
+def search_products(queryset, query):
+    """Filter a product queryset by a search query, annotated with `search_rank`."""
+    return get_search_backend().filter(queryset, query)
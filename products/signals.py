@@ -0,0 +1,163 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import bump_catalog_version
+from .images import safe_generate_variants
+from .models import HennaProduct, ProductsCategory, Discount
+from .pricing import refresh_effective_prices
+from .search import get_search_backend
+from . import timeline
+
+
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+@receiver(m2m_changed, sender=HennaProduct.discounts.through)
+def invalidate_discount_timeline(sender, **kwargs):
+    """
+    Drop the discount timeline index. Connected before the price refresh
+    receivers below so they resolve prices from the new discount state
+    """
+    timeline.invalidate()
+
+
+@receiver(post_save, sender=HennaProduct)
+@receiver(post_delete, sender=HennaProduct)
+def invalidate_product_timeline(sender, instance, created=False, **kwargs):
+    """
+    Drop the discount timeline when a product is created or deleted, since
+    product ids can be reused (e.g. after a rolled back transaction)
+    """
+    if created or kwargs['signal'] is post_delete:
+        timeline.invalidate()
+
+
+def touch_and_refresh(products):
+    """
+    Mark products as modified (for conditional GETs of their detail pages)
+    and re-materialise their prices
+    """
+    HennaProduct.objects.filter(pk__in=products).update(updated_at=timezone.now())
+    refresh_effective_prices(products)
+
+
+@receiver(post_save, sender=HennaProduct)
+def refresh_product_price(sender, instance, raw, **kwargs):
+    """
+    Refresh the materialised price when a product is saved
+    """
+    if raw:
+        return
+    refresh_effective_prices([instance.pk])
+
+
+@receiver(post_save, sender=HennaProduct)
+def index_product(sender, instance, raw, **kwargs):
+    """
+    Keep the full-text search index in sync on product create/update
+    """
+    if raw:
+        return
+    get_search_backend().index_products([instance.pk])
+
+
+@receiver(post_save, sender=HennaProduct)
+def generate_image_variants(sender, instance, raw, **kwargs):
+    """
+    Generate resized derivatives when a product image is uploaded or replaced
+    """
+    if raw:
+        return
+    image_name = instance.image.name if instance.image else None
+    if image_name == instance.image_variants.get('source'):
+        return
+
+    variants = {}
+    if image_name:
+        variants = safe_generate_variants(image_name) or {}
+    instance.image_variants = variants
+    HennaProduct.objects.filter(pk=instance.pk).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+
+
+@receiver(post_delete, sender=HennaProduct)
+def unindex_product(sender, instance, **kwargs):
+    """
+    Remove a deleted product from the full-text search index
+    """
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Discount)
+def refresh_discount_products(sender, instance, raw, **kwargs):
+    """
+    Refresh every product linked to a discount on discount create/update
+    """
+    if raw:
+        return
+    touch_and_refresh(HennaProduct.objects.filter(discounts=instance).values('pk'))
+
+
+@receiver(pre_delete, sender=Discount)
+def collect_discount_products(sender, instance, **kwargs):
+    """
+    Remember the linked products before the M2M rows are deleted
+    """
+    instance._linked_product_ids = list(
+        HennaProduct.objects.filter(discounts=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Discount)
+def refresh_deleted_discount_products(sender, instance, **kwargs):
+    """
+    Refresh the products that were linked to a deleted discount
+    """
+    product_ids = getattr(instance, '_linked_product_ids', [])
+    if product_ids:
+        touch_and_refresh(product_ids)
+
+
+@receiver(m2m_changed, sender=HennaProduct.discounts.through)
+def refresh_linked_products(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Refresh prices when discounts are added to or removed from products
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_and_refresh([instance.pk])
+        return
+
+    # Reverse side: instance is a Discount, pk_set holds product ids
+    if action == 'pre_clear':
+        instance._linked_product_ids = list(
+            instance.hennaproduct_set.values_list('pk', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        touch_and_refresh(pk_set)
+    elif action == 'post_clear':
+        touch_and_refresh(getattr(instance, '_linked_product_ids', []))
+
+
+@receiver(post_save, sender=ProductsCategory)
+def touch_category_products(sender, instance, raw, **kwargs):
+    """
+    Mark a category's products as modified when the category is renamed
+    """
+    if raw:
+        return
+    HennaProduct.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=HennaProduct)
+@receiver(post_delete, sender=HennaProduct)
+@receiver(post_save, sender=ProductsCategory)
+@receiver(post_delete, sender=ProductsCategory)
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+@receiver(m2m_changed, sender=HennaProduct.discounts.through)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Bump the catalog version so cached listings are rebuilt
+    """
+    bump_catalog_version()
@@ -21,6 +21,9 @@ $(document).ready(function() {
             }
         });
     
+        // Sorting starts again from the first page
+        currentUrl.searchParams.delete("cursor");
+
         if (selectedVal !== "reset") {
             let [sort, direction] = selectedVal.split("_");
             currentUrl.searchParams.set("sort", sort);
@@ -0,0 +1,35 @@
+$(document).ready(function() {
+    // Load the next page of product cards when the "Load more" block scrolls into view
+    let loadMore = document.getElementById('load-more');
+    if (!loadMore || !('IntersectionObserver' in window)) {
+        return;
+    }
+
+    let loading = false;
+    let observer = new IntersectionObserver(function(entries) {
+        if (!entries[0].isIntersecting || loading) {
+            return;
+        }
+        let nextUrl = loadMore.dataset.nextUrl;
+        if (!nextUrl) {
+            return;
+        }
+
+        loading = true;
+        $.getJSON(nextUrl)
+            .done(function(data) {
+                $('#product-grid').append(data.html);
+                if (data.next_page_url) {
+                    loadMore.dataset.nextUrl = data.next_page_url;
+                } else {
+                    observer.disconnect();
+                    loadMore.remove();
+                }
+            })
+            .always(function() {
+                loading = false;
+            });
+    }, { rootMargin: '400px' });
+
+    observer.observe(loadMore);
+});
@@ -20,4 +20,37 @@ document.addEventListener('DOMContentLoaded', function () {
             }
         });
     });
-});
\ No newline at end of file
+
+    // Add to cart without reloading the page, then show the cart toast
+    const addForm = document.querySelector('form[action*="add_to_cart"]');
+    if (addForm) {
+        addForm.addEventListener('submit', function (e) {
+            e.preventDefault();
+            fetch(addForm.action, {
+                method: 'POST',
+                body: new FormData(addForm),
+                headers: { 'X-Requested-With': 'XMLHttpRequest' },
+            })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    document.querySelectorAll('.cart-summary-total').forEach(total => {
+                        total.textContent = `£${data.total}`;
+                    });
+                    document.querySelectorAll('.message-container').forEach(container => container.remove());
+                    const container = document.createElement('div');
+                    container.className = 'message-container';
+                    container.innerHTML = data.mini_cart_html;
+                    document.querySelector('header').after(container);
+                    new bootstrap.Toast(container.querySelector('.toast')).show();
+                }, () => {
+                    // Fall back to a normal form submission
+                    addForm.submit();
+                });
+        });
+    }
+});
@@ -0,0 +1,26 @@
+from django import template
+from django.templatetags.static import static
+
+from products.images import variant_srcset, variant_url
+
+register = template.Library()
+
+CARD_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 50vw'
+
+
+@register.inclusion_tag('products/includes/product_picture.html')
+def product_picture(product, variant='card', css_class='', sizes=CARD_SIZES, lazy=True):
+    """
+    Render a responsive <picture> for a product image, serving WebP where
+    supported and the resized JPEG otherwise.
+    """
+    src = variant_url(product, variant) or product.image_url or static('images/noimage.png')
+    return {
+        'alt': product.name,
+        'css_class': css_class,
+        'lazy': lazy,
+        'sizes': sizes,
+        'src': src,
+        'webp_srcset': variant_srcset(product, 'webp'),
+        'jpeg_srcset': variant_srcset(product, 'jpeg'),
+    }
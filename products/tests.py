@@ -1,8 +1,32 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError 
-from decimal import Decimal
+from django.db import connection
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import tempfile
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from io import BytesIO, StringIO
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from products.models import ProductsCategory, Discount, HennaProduct
+from henna_store.admin import SALE_PREVIEW_PER_PAGE
+from products.autocomplete import PRODUCT, PrefixIndex
+from products.bulk import export_products, import_products
+from products.cache import get_cache_stats, get_catalog_version
+from products.facets import compute_facets, get_categories
+from products.listing import build_listing
+from products.pagination import PRODUCTS_PER_PAGE, count_products, encode_cursor
+from products.pricing import price_products
+from products.search import PostgresSearchBackend, get_search_backend, search_products
+from products.timeline import get_active_discount, get_timeline
 
 
 class DiscountModelTest(TestCase):
@@ -83,3 +107,722 @@ class ProductsCategoryModelTest(TestCase):
         self.assertEqual(self.category.get_friendly_name(), 'Henna Products')
         self.category.friendly_name = None
         self.assertEqual(self.category.get_friendly_name(), 'Henna')
+
+
+class ProductListingQueryCountTest(TestCase):
+    """Test suite for bulk price resolution on the product listing."""
+
+    def setUp(self):
+        """Set up a category and an active discount shared by products."""
+        self.category = ProductsCategory.objects.create(name='Henna', friendly_name='Henna')
+        self.discount = Discount.objects.create(
+            name='Sale',
+            discount_type='percentage',
+            value=Decimal('10.00'),
+            start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1)
+        )
+
+    def create_products(self, count, offset=0):
+        """Create discounted products in the shared category."""
+        for i in range(offset, offset + count):
+            product = HennaProduct.objects.create(
+                name=f'Product {i}', description='Test', price=Decimal('10.00'),
+                category=self.category
+            )
+            product.discounts.add(self.discount)
+
+    def count_listing_queries(self):
+        """Return the number of queries issued rendering the listing."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_listing_query_count_is_constant(self):
+        """Test that the listing does not issue queries per product."""
+        self.create_products(2)
+        small_catalog = self.count_listing_queries()
+        self.create_products(10, offset=2)
+        self.assertEqual(self.count_listing_queries(), small_catalog)
+
+    def test_with_pricing_resolves_discount(self):
+        """Test that prefetched pricing matches the per-object calculation."""
+        self.create_products(1)
+        product = HennaProduct.objects.with_pricing().get()
+        with self.assertNumQueries(0):
+            self.assertEqual(product.current_discount, self.discount)
+            self.assertEqual(product.discounted_price, Decimal('9.00'))
+
+
+class EffectivePriceTest(TestCase):
+    """Test suite for the materialised effective price."""
+
+    def setUp(self):
+        """Set up a product and an active fixed discount."""
+        self.product = HennaProduct.objects.create(
+            name='Henna Cone', description='Test', price=Decimal('10.00')
+        )
+        self.discount = Discount.objects.create(
+            name='£2 Off',
+            discount_type='fixed',
+            value=Decimal('2.00'),
+            start_date=timezone.now() - timezone.timedelta(days=1),
+            end_date=timezone.now() + timezone.timedelta(days=1)
+        )
+
+    def test_new_product_is_materialised(self):
+        """Test that saving a product stores its effective price."""
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('10.00'))
+        self.assertIsNone(self.product.active_discount)
+
+    def test_linking_discount_refreshes_price(self):
+        """Test that adding and removing a discount refreshes the price."""
+        self.product.discounts.add(self.discount)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('8.00'))
+        self.assertEqual(self.product.active_discount, self.discount)
+
+        self.discount.hennaproduct_set.clear()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('10.00'))
+
+    def test_discount_changes_refresh_price(self):
+        """Test that deactivating or deleting a discount refreshes the price."""
+        self.product.discounts.add(self.discount)
+        self.discount.active = False
+        self.discount.save()
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.active_discount)
+
+        self.discount.active = True
+        self.discount.save()
+        self.discount.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('10.00'))
+
+    def test_refresh_prices_command_handles_expired_discount(self):
+        """Test that the scheduler command clears discounts that have ended."""
+        self.product.discounts.add(self.discount)
+        Discount.objects.filter(pk=self.discount.pk).update(
+            end_date=timezone.now() - timezone.timedelta(minutes=1)
+        )
+        call_command('refresh_prices', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('10.00'))
+        self.assertIsNone(self.product.active_discount)
+
+    def test_refresh_prices_command_catches_up_on_started_discount(self):
+        """Test that a discount which started before the window is applied by a late run."""
+        self.product.discounts.add(self.discount)
+        Discount.objects.filter(pk=self.discount.pk).update(
+            start_date=timezone.now() - timezone.timedelta(hours=2)
+        )
+        # As left by a run that was missed when the discount started
+        HennaProduct.objects.filter(pk=self.product.pk).update(
+            effective_price=Decimal('10.00'), active_discount=None
+        )
+        call_command('refresh_prices', window=15, stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('8.00'))
+        self.assertEqual(self.product.active_discount, self.discount)
+
+
+class ProductSearchTest(TestCase):
+    """Test suite for the full-text product search."""
+
+    def setUp(self):
+        """Set up products matching a search term in different fields."""
+        self.by_description = HennaProduct.objects.create(
+            name='Aftercare Balm', description='Soothing balm to use after henna', price=Decimal('5.00')
+        )
+        self.by_name = HennaProduct.objects.create(
+            name='Natural Henna Cone', description='Ready to use cone', price=Decimal('3.50')
+        )
+        self.unrelated = HennaProduct.objects.create(
+            name='Stencil Book', description='Designs for beginners', price=Decimal('8.00')
+        )
+
+    def search(self, query):
+        """Return the names of the products found for a query, in order."""
+        products = search_products(HennaProduct.objects.all(), query).order_by('search_rank')
+        return [product.name for product in products]
+
+    def test_search_ranks_name_matches_first(self):
+        """Test that matches in the name rank above matches in the description."""
+        self.assertEqual(self.search('henna'), ['Natural Henna Cone', 'Aftercare Balm'])
+
+    def test_search_matches_prefixes(self):
+        """Test that partial words match."""
+        self.assertEqual(self.search('sten'), ['Stencil Book'])
+        self.assertEqual(self.search('hen'), ['Natural Henna Cone', 'Aftercare Balm'])
+        self.assertEqual(self.search('nat hen'), ['Natural Henna Cone'])
+
+    def test_postgres_query_matches_prefixes(self):
+        """Test that the Postgres backend matches every term as a prefix, like SQLite."""
+        backend = PostgresSearchBackend()
+        self.assertEqual(backend.tsquery("nat' hen-na"), "'nat':* & 'hen':* & 'na':*")
+        self.assertIsNone(backend.match_sql('!!'))
+
+    def test_index_follows_updates_and_deletes(self):
+        """Test that the index is kept in sync on save and delete."""
+        self.unrelated.description = 'Henna stencils'
+        self.unrelated.save()
+        self.assertIn('Stencil Book', self.search('henna'))
+
+        self.by_name.delete()
+        self.assertNotIn('Natural Henna Cone', self.search('henna'))
+
+    def test_listing_search(self):
+        """Test the search query on the product listing."""
+        response = self.client.get(reverse('products'), {'q': 'cone'})
+        self.assertEqual(response.context['result_count'], 1)
+        self.assertContains(response, 'Natural Henna Cone')
+
+    def test_search_is_filtered_in_one_query(self):
+        """Test that search and filters are applied together, whatever the number of matches."""
+        category = ProductsCategory.objects.create(name='Aftercare', friendly_name='Aftercare')
+        HennaProduct.objects.bulk_create(
+            HennaProduct(name=f'Henna Cone {i}', description='Cone', price=Decimal('3.00'))
+            for i in range(20)
+        )
+        # bulk_create skips the signals that index products
+        get_search_backend().rebuild()
+        self.by_description.category = category
+        self.by_description.save()
+
+        with self.assertNumQueries(2):
+            listing = build_listing({'q': 'henna', 'category': 'Aftercare'})
+            products = list(listing['products'])
+        self.assertEqual([p.name for p in products], ['Aftercare Balm'])
+        self.assertEqual(listing['result_count'], 1)
+
+
+class KeysetPaginationTest(TestCase):
+    """Test suite for keyset pagination of the product listing."""
+
+    def setUp(self):
+        """Set up enough products for several pages, with duplicate sort values."""
+        category = ProductsCategory.objects.create(name='Cones', friendly_name='Cones')
+        for i in range(30):
+            HennaProduct.objects.create(
+                name=f'Product {i:02d}', description='Test',
+                price=Decimal('2.50') * (i % 7 + 1),
+                rating=Decimal(i % 5) if i % 3 else None,
+                category=category if i % 2 else None,
+            )
+
+    def walk_listing(self, params):
+        """Follow cursors through every page and return the product ids seen."""
+        seen = []
+        cursor = None
+        while True:
+            listing = build_listing(dict(params, cursor=cursor) if cursor else params)
+            seen.extend(product.pk for product in listing['products'])
+            cursor = listing['next_cursor']
+            if not cursor:
+                return seen
+
+    def test_pages_cover_every_product_in_order(self):
+        """Test that each sort key pages through the catalog exactly once, in order."""
+        expected_orderings = {
+            'price': lambda p: (p.price, p.pk),
+            'rating': lambda p: (p.rating or 0, p.pk),
+            'name': lambda p: (p.name.lower(), p.pk),
+            'category': lambda p: (p.category.name if p.category else '', p.pk),
+        }
+        products = list(HennaProduct.objects.select_related('category'))
+        for sort, key in expected_orderings.items():
+            for direction in ('asc', 'desc'):
+                with self.subTest(sort=sort, direction=direction):
+                    expected = [p.pk for p in sorted(products, key=key, reverse=direction == 'desc')]
+                    seen = self.walk_listing({'sort': sort, 'direction': direction})
+                    self.assertEqual(seen, expected)
+
+    def test_listing_renders_first_page_and_count(self):
+        """Test that the listing renders one bounded page with the full count."""
+        response = self.client.get(reverse('products'))
+        self.assertEqual(response.context['grid_html'].count('product-card'), PRODUCTS_PER_PAGE)
+        self.assertEqual(response.context['result_count'], 30)
+        self.assertFalse(response.context['count_is_estimate'])
+        # The cart's own count is left alone for the cart toast
+        self.assertEqual(response.context['product_count'], 0)
+
+    def test_forged_cursor_is_rejected(self):
+        """Test that a cursor whose sort value does not fit the sort is refused."""
+        for sort in ('price', 'rating'):
+            with self.subTest(sort=sort):
+                params = {'sort': sort, 'cursor': encode_cursor('not-a-number', 1)}
+                response = self.client.get(reverse('products'), params)
+                self.assertRedirects(response, reverse('products'))
+                response = self.client.get(reverse('products_page'), params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_infinite_scroll_endpoint(self):
+        """Test that the JSON endpoint returns the next page as an HTML fragment."""
+        response = self.client.get(reverse('products'))
+        next_url = response.context['next_page_url']
+        data = self.client.get(next_url).json()
+        self.assertEqual(data['html'].count('product-card'), 30 - PRODUCTS_PER_PAGE)
+        self.assertIsNone(data['next_page_url'])
+
+    def test_count_is_estimated_above_limit(self):
+        """Test that large results report a lower bound instead of an exact count."""
+        count, is_estimate = count_products(HennaProduct.objects.all(), limit=10)
+        self.assertEqual((count, is_estimate), (10, True))
+
+
+class ListingCacheTest(TestCase):
+    """Test suite for the versioned listing cache."""
+
+    def setUp(self):
+        """Start from an empty cache with one product."""
+        cache.clear()
+        self.product = HennaProduct.objects.create(
+            name='Henna Cone', description='Test', price=Decimal('3.50')
+        )
+
+    def test_repeat_request_is_served_from_cache(self):
+        """Test that a repeated listing request does not query the catalog."""
+        self.client.get(reverse('products'), {'sort': 'price', 'direction': 'asc'})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('products'), {'direction': 'asc', 'sort': 'price'})
+        self.assertContains(response, 'Henna Cone')
+        self.assertEqual(get_cache_stats('listing'), {'hits': 1, 'misses': 1})
+
+    def test_catalog_changes_invalidate_cache(self):
+        """Test that saving a product bumps the catalog version."""
+        self.client.get(reverse('products'))
+        self.product.name = 'Renamed Cone'
+        self.product.save()
+        response = self.client.get(reverse('products'))
+        self.assertContains(response, 'Renamed Cone')
+
+    def test_discount_boundary_bumps_version(self):
+        """Test that the version changes once a discount window opens."""
+        discount = Discount.objects.create(
+            name='Flash Sale', discount_type='fixed', value=Decimal('1.00'),
+            start_date=timezone.now() + timezone.timedelta(hours=1)
+        )
+        version = get_catalog_version()
+        self.assertEqual(get_catalog_version(), version)
+        Discount.objects.filter(pk=discount.pk).update(start_date=timezone.now())
+        cache.set('catalog:next_boundary', time.time() - 1, None)
+        self.assertEqual(get_catalog_version(), version + 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductImageVariantTest(TestCase):
+    """Test suite for generated product image variants."""
+
+    def upload(self, size=(1200, 800), name='cone.png'):
+        """Return an in-memory PNG upload of the given size."""
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 100, 50, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_variants_generated_on_upload(self):
+        """Test that saving a product with an image writes every variant."""
+        product = HennaProduct.objects.create(
+            name='Henna Cone', description='Test', price=Decimal('3.50'), image=self.upload()
+        )
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        self.assertEqual(product.image_variants['card']['width'], 400)
+        with default_storage.open(product.image_variants['thumb']['webp']) as thumb:
+            self.assertEqual(Image.open(thumb).size, (100, 67))
+
+    def test_picture_tag_renders_srcset(self):
+        """Test that the template helper renders WebP and JPEG srcsets."""
+        product = HennaProduct.objects.create(
+            name='Henna Cone', description='Test', price=Decimal('3.50'), image=self.upload()
+        )
+        html = Template(
+            "{% load product_images %}{% product_picture product 'card' %}"
+        ).render(Context({'product': product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertRegex(html, r'cone-\w{8}-detail\.jpeg 900w')
+        self.assertRegex(html, r'cone-\w{8}-card\.jpeg"')
+
+    def test_sources_sharing_a_stem_keep_their_own_variants(self):
+        """Test that cone.png and cone.jpg on two products do not overwrite each other's variants."""
+        first = HennaProduct.objects.create(
+            name='Henna Cone', description='Test', price=Decimal('3.50'), image=self.upload()
+        )
+        second = HennaProduct.objects.create(
+            name='Henna Cone Large', description='Test', price=Decimal('4.50'),
+            image=self.upload((600, 300), 'cone.jpg')
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.image_variants['card']['jpeg'], second.image_variants['card']['jpeg'])
+        with default_storage.open(first.image_variants['thumb']['jpeg']) as thumb:
+            self.assertEqual(Image.open(thumb).size, (100, 67))
+
+
+class ProductFacetTest(TestCase):
+    """Test suite for listing facet counts."""
+
+    def setUp(self):
+        """Set up products across two categories and price/rating buckets."""
+        cache.clear()
+        cones = ProductsCategory.objects.create(name='cones', friendly_name='Cones')
+        kits = ProductsCategory.objects.create(name='kits', friendly_name='Kits')
+        for name, category, price, rating in [
+            ('Cone A', cones, '3.50', '4.5'),
+            ('Cone B', cones, '7.00', '3.2'),
+            ('Kit A', kits, '25.00', '4.8'),
+            ('Kit B', kits, '12.00', None),
+        ]:
+            HennaProduct.objects.create(
+                name=name, description='Test', category=category,
+                price=Decimal(price), rating=Decimal(rating) if rating else None
+            )
+
+    def counts(self, facets, dimension):
+        """Map option values to counts for one dimension."""
+        return {option['value']: option['count'] for option in facets[dimension]}
+
+    def test_facets_computed_in_one_query(self):
+        """Test that every facet count comes from a single aggregate query."""
+        get_categories()
+        with self.assertNumQueries(1):
+            facets = compute_facets({})
+        self.assertEqual(self.counts(facets, 'category'), {'Cones': 2, 'Kits': 2})
+        self.assertEqual(
+            self.counts(facets, 'price'),
+            {'under-5': 1, '5-10': 1, '10-20': 1, '20-plus': 1}
+        )
+        self.assertEqual(self.counts(facets, 'rating'), {'4-plus': 2, '3-plus': 3, '2-plus': 3})
+
+    def test_facets_respect_other_selections(self):
+        """Test that a dimension's counts apply the other dimensions' filters only."""
+        facets = compute_facets({'category': 'Kits', 'rating': '4-plus'})
+        self.assertEqual(self.counts(facets, 'category'), {'Cones': 1, 'Kits': 1})
+        self.assertEqual(self.counts(facets, 'price')['20-plus'], 1)
+        self.assertEqual(self.counts(facets, 'rating')['2-plus'], 1)
+
+    def test_facets_endpoint(self):
+        """Test the JSON endpoint and that selecting a bucket filters the listing."""
+        data = self.client.get(reverse('product_facets'), {'price': 'under-5'}).json()
+        kits = next(o for o in data['facets']['category'] if o['value'] == 'Kits')
+        self.assertEqual(kits['count'], 0)
+
+        response = self.client.get(reverse('products'), {'price': 'under-5'})
+        self.assertEqual(response.context['result_count'], 1)
+        self.assertContains(response, 'Cone A')
+
+
+class ProductDetailConditionalGetTest(TestCase):
+    """Test suite for ETag/Last-Modified handling on product detail pages."""
+
+    def setUp(self):
+        """Set up a product with a discount that ends soon."""
+        self.product = HennaProduct.objects.create(
+            name='Henna Cone', description='Test', price=Decimal('3.50')
+        )
+        self.discount = Discount.objects.create(
+            name='Flash Sale', discount_type='fixed', value=Decimal('1.00'),
+            start_date=timezone.now() - timezone.timedelta(hours=1),
+            end_date=timezone.now() + timezone.timedelta(seconds=90)
+        )
+        self.product.discounts.add(self.discount)
+        self.url = reverse('product_detail', args=[self.product.pk])
+
+    def test_matching_etag_returns_not_modified(self):
+        """Test that a repeat request with the ETag gets a 304 without rendering."""
+        # The first response sets the CSRF cookie, which is part of the ETag
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            repeat = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_cache_lifetime_stops_at_discount_end(self):
+        """Test that cookie-less clients may not cache past the discount end."""
+        etag = self.client.get(self.url)['ETag']
+        self.client.cookies.clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        max_age = int(response['Cache-Control'].split('max-age=')[1].split(',')[0])
+        self.assertLessEqual(max_age, 90)
+        self.assertIn('Last-Modified', response)
+
+    def test_public_responses_never_set_cookies(self):
+        """Test that a page carrying a CSRF token or cookie is never shareable."""
+        response = self.client.get(self.url)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+        self.client.cookies.clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(len(response.cookies), 0)
+
+    def test_product_and_discount_changes_change_etag(self):
+        """Test that editing the product or its discount invalidates the ETag."""
+        etag = self.client.get(self.url)['ETag']
+        self.product.price = Decimal('4.00')
+        self.product.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(self.url)['ETag']
+        self.discount.name = 'Renamed Sale'
+        self.discount.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Renamed Sale')
+
+
+class ProductImportExportTest(TestCase):
+    """Test suite for the streaming product import and export."""
+
+    def setUp(self):
+        """Set up a category, a discount and one existing product."""
+        self.category = ProductsCategory.objects.create(name='Henna Cones', friendly_name='henna_cones')
+        self.discount = Discount.objects.create(
+            name='10% Off', discount_type='percentage', value=Decimal('10.00')
+        )
+        HennaProduct.objects.create(
+            sku='HC001', name='Natural Henna Cone', description='Old', price=Decimal('3.50')
+        )
+
+    def import_csv(self, text, batch_size=2):
+        return import_products(StringIO(text), 'csv', batch_size)
+
+    def test_import_upserts_by_sku(self):
+        """Test that rows update existing skus, create new ones and resolve prices."""
+        importer = self.import_csv(
+            'sku,name,description,price,category,discounts\n'
+            'HC001,Natural Henna Cone,New,3.50,henna_cones,10% Off\n'
+            'HC002,Colored Henna Cone,Bright,4.00,Henna Cones,\n'
+            'HC003,Mystery Cone,?,4.00,Unknown,\n'
+        )
+        self.assertEqual((importer.created, importer.updated), (1, 1))
+        self.assertEqual(importer.errors, [(4, "unknown category 'Unknown'")])
+
+        updated = HennaProduct.objects.get(sku='HC001')
+        self.assertEqual(updated.description, 'New')
+        self.assertEqual(updated.category, self.category)
+        self.assertEqual(list(updated.discounts.all()), [self.discount])
+        self.assertEqual(updated.effective_price, Decimal('3.15'))
+        self.assertEqual(updated.active_discount, self.discount)
+        self.assertEqual(HennaProduct.objects.get(sku='HC002').effective_price, Decimal('4.00'))
+
+    def test_imported_discounts_reach_the_timeline(self):
+        """Test that the discount timeline sees discounts linked by an import."""
+        get_timeline()
+        self.import_csv(
+            'sku,name,description,price,category,discounts\n'
+            'HC001,Natural Henna Cone,Old,3.50,henna_cones,10% Off\n'
+        )
+        product = HennaProduct.objects.get(sku='HC001')
+        self.assertEqual(product.get_discounted_price(), Decimal('3.15'))
+        self.assertEqual(product.current_discount, self.discount)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """Test that a batch costs a fixed number of queries however large it is."""
+        rows = ''.join(f'SYN{i},Synthetic {i},desc,5.00\n' for i in range(50))
+        with CaptureQueriesContext(connection) as small:
+            import_products(StringIO('sku,name,description,price\n' + rows[:rows.index('SYN5')]), 'csv', 100)
+        with CaptureQueriesContext(connection) as large:
+            import_products(StringIO('sku,name,description,price\n' + rows), 'csv', 100)
+        self.assertLessEqual(len(large), len(small) + 1)
+
+    def test_export_round_trips(self):
+        """Test that an exported file imports back without changes."""
+        HennaProduct.objects.get(sku='HC001').discounts.add(self.discount)
+        for format in ('csv', 'jsonl'):
+            stream = StringIO()
+            self.assertEqual(export_products(stream, format), 1)
+            stream.seek(0)
+            importer = import_products(stream, format)
+            self.assertEqual(importer.unchanged, 1, format)
+
+
+class ProductAutocompleteTest(TestCase):
+    """Test suite for the search box autocomplete endpoint."""
+
+    def setUp(self):
+        """Set up categories and products to suggest."""
+        cache.clear()
+        cones = ProductsCategory.objects.create(name='Henna Cones', friendly_name='henna_cones')
+        HennaProduct.objects.create(
+            name='Natural Henna Cone', sku='HC001', description='Test',
+            price=Decimal('3.50'), rating=Decimal('4.0'), category=cones
+        )
+        HennaProduct.objects.create(
+            name='Bridal Henna Kit', sku='KIT01', description='Test',
+            price=Decimal('30.00'), rating=Decimal('4.9')
+        )
+        self.url = reverse('product_autocomplete')
+
+    def labels(self, query):
+        response = self.client.get(self.url, {'q': query})
+        return [suggestion['label'] for suggestion in response.json()['suggestions']]
+
+    def test_prefix_matches_names_skus_and_categories(self):
+        """Test that any word prefix, SKU or category name is suggested."""
+        self.assertEqual(self.labels('hen'), ['Henna Cones', 'Bridal Henna Kit', 'Natural Henna Cone'])
+        self.assertEqual(self.labels('kit0'), ['Bridal Henna Kit'])
+        self.assertEqual(self.labels('henna co'), ['Henna Cones', 'Natural Henna Cone'])
+        self.assertEqual(self.labels(''), [])
+
+    def test_index_is_reused_until_catalog_changes(self):
+        """Test that lookups skip the database until the catalog version changes."""
+        self.labels('bri')
+        with self.assertNumQueries(0):
+            self.labels('nat')
+        HennaProduct.objects.create(name='Brilliant Red Powder', description='Test', price=Decimal('5.00'))
+        self.assertEqual(self.labels('bri'), ['Bridal Henna Kit', 'Brilliant Red Powder'])
+
+    def test_short_prefixes_return_best_ranked_matches(self):
+        """Test that a prefix matching many keys still finds the best-ranked entries."""
+        entries = [(PRODUCT, i, f'Aa {i:04d}', f'aa {i:04d}', 0) for i in range(3000)]
+        entries.append((PRODUCT, 3000, 'Azure Cone', 'azure cone', -5))
+        entries.append((PRODUCT, 3001, 'Azure Oil', 'azure oil', 0))
+        index = PrefixIndex(entries)
+        self.assertEqual(index.lookup('a', 2)[0][2], 'Azure Cone')
+        self.assertEqual([entry[2] for entry in index.lookup('a oil')], ['Azure Oil'])
+
+
+class DiscountTimelineTest(TestCase):
+    """Test suite for the in-memory discount timeline index."""
+
+    def setUp(self):
+        """Set up a product with two overlapping discount windows."""
+        self.now = timezone.now()
+        self.product = HennaProduct.objects.create(
+            name='Henna Cone', description='Test', price=Decimal('10.00')
+        )
+        self.first = Discount.objects.create(
+            name='First', discount_type='fixed', value=Decimal('1.00'),
+            start_date=self.now + timezone.timedelta(days=1),
+            end_date=self.now + timezone.timedelta(days=3)
+        )
+        self.second = Discount.objects.create(
+            name='Second', discount_type='fixed', value=Decimal('2.00'),
+            start_date=self.now - timezone.timedelta(days=1),
+            end_date=self.now + timezone.timedelta(days=2)
+        )
+        self.product.discounts.add(self.first, self.second)
+
+    def test_lookup_matches_window_boundaries(self):
+        """Test that windows are inclusive and earlier discounts win overlaps."""
+        expected = [
+            (self.now - timezone.timedelta(days=2), None),
+            (self.second.start_date, self.second),
+            (self.first.start_date, self.first),
+            (self.first.end_date, self.first),
+            (self.first.end_date + timezone.timedelta(microseconds=1), None),
+        ]
+        for at, discount in expected:
+            self.assertEqual(get_active_discount(self.product.pk, at), discount, at)
+
+    def test_lookups_are_served_from_memory(self):
+        """Test that resolving discounts does not query the database."""
+        self.assertEqual(self.product.get_current_discount(), self.second)
+        with self.assertNumQueries(0):
+            for product in [HennaProduct(pk=self.product.pk)] * 50:
+                self.assertEqual(product.get_current_discount(), self.second)
+
+    def test_signals_invalidate_index(self):
+        """Test that discount and link changes are picked up immediately."""
+        self.assertEqual(self.product.get_current_discount(), self.second)
+        self.second.active = False
+        self.second.save()
+        self.assertIsNone(self.product.get_current_discount())
+        self.product.discounts.remove(self.first)
+        self.assertIsNone(get_active_discount(self.product.pk, self.first.start_date))
+
+
+class BatchPricingTest(TestCase):
+    """Test suite for pricing many products at a timestamp."""
+
+    def setUp(self):
+        """Set up products under percentage, fixed and future discounts."""
+        self.now = timezone.now()
+        self.percentage = Discount.objects.create(
+            name='Third Off', discount_type='percentage', value=Decimal('33.33')
+        )
+        self.fixed = Discount.objects.create(
+            name='Fiver Off', discount_type='fixed', value=Decimal('5.00')
+        )
+        self.future = Discount.objects.create(
+            name='Summer Sale', discount_type='percentage', value=Decimal('50.00'),
+            start_date=self.now + timezone.timedelta(days=10),
+            end_date=self.now + timezone.timedelta(days=20)
+        )
+        self.products = []
+        for index, (price, discount) in enumerate([
+            ('12.34', self.percentage), ('5.50', self.fixed),
+            ('9.99', self.future), ('0.50', None),
+        ]):
+            product = HennaProduct.objects.create(
+                name=f'Product {index}', sku=f'P{index}', description='Test', price=Decimal(price)
+            )
+            if discount:
+                product.discounts.add(discount)
+            self.products.append(product)
+
+    def test_batch_prices_match_per_object_prices(self):
+        """Test that batch prices equal the rounded per-object prices, floor included."""
+        prices = price_products(HennaProduct.objects.all())
+        self.assertEqual(
+            [prices[product.pk].price for product in self.products],
+            [Decimal('8.23'), Decimal('0.99'), Decimal('9.99'), Decimal('0.99')]
+        )
+        for product in self.products:
+            self.assertEqual(
+                prices[product.pk].price,
+                product.get_discounted_price().quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            )
+
+    def test_prices_at_a_future_date(self):
+        """Test that products are priced with the discounts of the given date."""
+        at = self.now + timezone.timedelta(days=15)
+        prices = price_products(HennaProduct.objects.all(), at)
+        self.assertEqual(prices[self.products[2].pk], (Decimal('5.00'), self.future))
+
+    def test_prefetched_discounts_are_checked_at_the_date(self):
+        """Test that explicitly given discounts are resolved at the given date too."""
+        product = self.products[2]
+        product.prefetched_active_discounts = [self.future]
+        at = self.now + timezone.timedelta(days=15)
+        self.assertEqual(product.get_current_discount(at), self.future)
+        self.assertIsNone(product.get_current_discount())
+
+    def test_admin_sale_preview(self):
+        """Test that the admin sale preview lists prices at the chosen date."""
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        at = timezone.localtime(self.now + timezone.timedelta(days=15))
+        response = self.client.get(
+            reverse('custom_admin:products_hennaproduct_sale_preview'),
+            {'at': at.strftime('%Y-%m-%dT%H:%M'), 'discounted_only': 'on'}
+        )
+        self.assertContains(response, 'Summer Sale')
+        self.assertContains(response, '£5.00')
+        self.assertNotContains(response, 'Product 3')
+
+    def test_admin_sale_preview_pages(self):
+        """Test that the sale preview is shown a page at a time in SKU order."""
+        HennaProduct.objects.bulk_create(
+            HennaProduct(name=f'Extra {i}', sku=f'X{i:03d}', description='Test', price=Decimal('1.00'))
+            for i in range(SALE_PREVIEW_PER_PAGE - 3)
+        )
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        url = reverse('custom_admin:products_hennaproduct_sale_preview')
+        response = self.client.get(url, {'at': timezone.localtime(self.now).strftime('%Y-%m-%dT%H:%M')})
+        rows = response.context['rows']
+        self.assertEqual(len(rows), SALE_PREVIEW_PER_PAGE)
+        self.assertEqual([row['product'].sku for row in rows[:2]], ['P0', 'P1'])
+
+        response = self.client.get(url + response.context['next_page_url'])
+        last_sku = f'X{SALE_PREVIEW_PER_PAGE - 4:03d}'
+        self.assertEqual([row['product'].sku for row in response.context['rows']], [last_sku])
+        self.assertIsNone(response.context['next_page_url'])
@@ -0,0 +1,173 @@
+"""
+Process-local interval index of discount windows.
+
+For every product with discounts the index keeps the times at which its
+applicable discount can change and the discount that applies between
+them, so "which discount applies to product X at time T" is a dict lookup
+plus a `bisect`. The index is built from two queries and reused until a
+discount or product link changes (products.signals calls `invalidate()`,
+which also bumps a shared stamp so other processes rebuild) or the next
+discount window opens or closes.
+
+Discounts returned from the index are shared between requests and must be
+treated as read-only.
+"""
+import threading
+import time
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Discount, HennaProduct
+
+STAMP_KEY = 'catalog:discount_timeline'
+# Seconds between checks of the shared stamp written by other processes
+STAMP_CHECK_INTERVAL = 1
+
+# `is_active()` treats end dates as inclusive, so a window closes just after
+END_OFFSET = timedelta(microseconds=1)
+
+
+class DiscountTimeline:
+    """
+    Per-product discount timelines. `timelines[product_id]` is a pair of
+    lists `(boundaries, discounts)` where `discounts[i]` applies from
+    `boundaries[i - 1]` (inclusive) until `boundaries[i]` (exclusive).
+    """
+
+    def __init__(self, discounts, links, now=None):
+        now = now or timezone.now()
+        by_pk = {discount.pk: discount for discount in discounts}
+        linked = {}
+        for product_id, discount_id in links:
+            if discount_id in by_pk:
+                linked.setdefault(product_id, []).append(by_pk[discount_id])
+
+        self.timelines = {}
+        for product_id, product_discounts in linked.items():
+            # Earlier discounts win, matching `HennaProduct.get_current_discount`
+            product_discounts.sort(key=lambda discount: discount.pk)
+            self.timelines[product_id] = self.build_timeline(product_discounts)
+
+        upcoming = [
+            boundary
+            for boundaries, _ in self.timelines.values()
+            for boundary in boundaries if boundary > now
+        ]
+        self.expires_at = min(upcoming) if upcoming else None
+
+    @staticmethod
+    def build_timeline(discounts):
+        boundaries = set()
+        for discount in discounts:
+            if discount.start_date is not None:
+                boundaries.add(discount.start_date)
+            if discount.end_date is not None:
+                boundaries.add(discount.end_date + END_OFFSET)
+        boundaries = sorted(boundaries)
+
+        applicable = []
+        for index in range(len(boundaries) + 1):
+            # Nothing changes inside a segment, so test a point within it
+            if index == 0:
+                point = boundaries[0] - END_OFFSET if boundaries else None
+            else:
+                point = boundaries[index - 1]
+            applicable.append(next(
+                (discount for discount in discounts if _applies(discount, point)), None
+            ))
+        return boundaries, applicable
+
+    def active_discount(self, product_id, at):
+        """Return the discount applying to a product at time `at`, or None."""
+        timeline = self.timelines.get(product_id)
+        if timeline is None:
+            return None
+        boundaries, applicable = timeline
+        return applicable[bisect_right(boundaries, at)]
+
+    def discounted_products(self, at):
+        """Return the ids of the products with a discount applying at time `at`."""
+        return [
+            product_id for product_id in self.timelines
+            if self.active_discount(product_id, at) is not None
+        ]
+
+
+def _applies(discount, point):
+    if point is None:
+        return discount.start_date is None and discount.end_date is None
+    return ((discount.start_date is None or discount.start_date <= point)
+            and (discount.end_date is None or discount.end_date >= point))
+
+
+def build_timeline():
+    """Build a DiscountTimeline from the active discounts and their links."""
+    discounts = list(Discount.objects.filter(active=True))
+    links = HennaProduct.discounts.through.objects.filter(
+        discount__active=True
+    ).values_list('hennaproduct_id', 'discount_id')
+    return DiscountTimeline(discounts, links)
+
+
+_timeline = None
+_stamp = None
+_stamp_checked = 0
+_lock = threading.Lock()
+
+
+def _current_stamp():
+    stamp = cache.get(STAMP_KEY)
+    if stamp is None:
+        cache.add(STAMP_KEY, 1, None)
+        stamp = cache.get(STAMP_KEY, 1)
+    return stamp
+
+
+def get_timeline():
+    """Return this process's timeline, rebuilding it when it is stale."""
+    global _timeline, _stamp, _stamp_checked
+    timeline = _timeline
+    now = timezone.now()
+    if (timeline is not None and timeline.expires_at is not None
+            and now >= timeline.expires_at):
+        timeline = None
+    if timeline is not None and time.monotonic() - _stamp_checked > STAMP_CHECK_INTERVAL:
+        _stamp_checked = time.monotonic()
+        if _current_stamp() != _stamp:
+            timeline = None
+
+    if timeline is None:
+        with _lock:
+            stamp = _current_stamp()
+            timeline = build_timeline()
+            _timeline, _stamp, _stamp_checked = timeline, stamp, time.monotonic()
+    return timeline
+
+
+def get_active_discount(product_id, at=None):
+    """Return the discount applying to a product at `at` (default now)."""
+    return get_timeline().active_discount(product_id, at or timezone.now())
+
+
+def _reset():
+    global _timeline
+    _timeline = None
+    try:
+        cache.incr(STAMP_KEY)
+    except ValueError:
+        cache.add(STAMP_KEY, 1, None)
+        cache.incr(STAMP_KEY)
+
+
+def invalidate():
+    """
+    Drop the timeline in this process and tell other processes to rebuild
+    theirs. Repeated on commit, so nobody keeps a timeline built from data
+    that was later rolled back or not yet visible to them.
+    """
+    _reset()
+    transaction.on_commit(_reset)
@@ -3,6 +3,9 @@ from . import views
 
 urlpatterns = [
     path('', views.all_products, name='products'),
+    path('more/', views.products_page, name='products_page'),
+    path('facets/', views.product_facets, name='product_facets'),
+    path('autocomplete/', views.product_autocomplete, name='product_autocomplete'),
     path('<int:product_id>/', views.product_detail, name='product_detail'),  
     path('product/add/', views.add_product, name='add_product'),  
     path('product/edit/<int:product_id>/', views.edit_product, name='edit_product'),  
@@ -1,75 +1,117 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q
-from django.db.models.functions import Lower
-from django.utils import timezone
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.urls import reverse 
-from .models import HennaProduct, ProductsCategory, Discount
+from .models import HennaProduct, Discount
 from .forms import ProductForm, DiscountForm
+from .autocomplete import get_suggestions
+from .cache import get_cached_listing
+from .facets import get_facets
+from .http import get_not_modified_response, get_product_validators, patch_product_cache_headers
+from .listing import render_listing, EmptySearch
+from .pagination import InvalidCursor
 
 def all_products(request):
     """A view to show all products, including sorting and search queries."""
 
-    products = HennaProduct.objects.all()
-    query = None
-    categories = None
-    sort = None
-    direction = None
-    discounted = request.GET.get('discounted') == 'true'
-
-    if request.GET:
-        if 'sort' in request.GET:
-            sortkey = request.GET['sort']
-            sort = sortkey
-            if sortkey == 'name':
-                sortkey = 'lower_name'
-                products = products.annotate(lower_name=Lower('name'))
-            if sortkey == 'category':
-                sortkey = 'category__name'
-
-            if 'direction' in request.GET:
-                direction = request.GET['direction']
-                if direction == 'desc':
-                    sortkey = f'-{sortkey}'
-            products = products.order_by(sortkey)
-
-        if 'category' in request.GET:
-            categories = request.GET['category'].split(',')
-            products = products.filter(category__friendly_name__in=categories)
-            categories = ProductsCategory.objects.filter(friendly_name__in=categories).order_by('friendly_name')
-
-        if 'q' in request.GET:
-            query = request.GET['q']
-            if not query:
-                messages.error(request, "You didn't enter any search criteria!")
-                return redirect(reverse('products'))
-
-            queries = Q(name__icontains=query) | Q(description__icontains=query)
-            products = products.filter(queries)
-
-        if discounted:
-            products = products.filter(
-                discounts__active=True,
-                discounts__start_date__lte=timezone.now(),
-                discounts__end_date__gte=timezone.now()
-            ).distinct()
-
-    current_sorting = f'{sort}_{direction}'
+    try:
+        listing = get_cached_listing(request.GET, lambda: render_listing(request.GET))
+    except EmptySearch:
+        messages.error(request, "You didn't enter any search criteria!")
+        return redirect(reverse('products'))
+    except InvalidCursor:
+        return redirect(reverse('products'))
 
-    context = {
-        'products': products,
-        'search_term': query,
-        'current_categories': categories,
-        'current_sorting': current_sorting,
-    }
+    context = dict(listing)
+    context['facets'] = get_facet_links(request, get_facets(request.GET))
+    context['next_page_url'] = get_next_page_url(request, listing['next_cursor'], 'products_page')
+    context['load_more_url'] = get_next_page_url(request, listing['next_cursor'], 'products')
 
     return render(request, 'products/products.html', context)
 
 
+def products_page(request):
+    """
+    AJAX endpoint returning the next page of product cards for infinite scroll.
+    """
+    try:
+        listing = get_cached_listing(request.GET, lambda: render_listing(request.GET))
+    except (EmptySearch, InvalidCursor):
+        return JsonResponse({'error': 'Invalid listing parameters.'}, status=400)
+
+    return JsonResponse({
+        'html': listing['grid_html'],
+        'next_page_url': get_next_page_url(request, listing['next_cursor'], 'products_page'),
+    })
+
+
+def product_facets(request):
+    """
+    AJAX endpoint returning facet counts for the current listing filters.
+    """
+    try:
+        facets = get_facets(request.GET)
+    except EmptySearch:
+        return JsonResponse({'error': 'Invalid listing parameters.'}, status=400)
+
+    return JsonResponse({'facets': get_facet_links(request, facets)})
+
+
+def product_autocomplete(request):
+    """
+    AJAX endpoint returning search box suggestions for a partial query.
+    """
+    query = request.GET.get('q', '')[:100]
+    return JsonResponse({'suggestions': get_suggestions(query) if query.strip() else []})
+
+
+def get_facet_links(request, facets):
+    """
+    Add to each facet option the listing URL that toggles it. Categories
+    can be combined; price and rating buckets replace each other.
+    """
+    linked = {}
+    for dimension, options in facets.items():
+        linked[dimension] = []
+        for option in options:
+            params = request.GET.copy()
+            params.pop('cursor', None)
+            if dimension == 'category':
+                values = [v for v in params.get('category', '').split(',') if v]
+                if option['selected']:
+                    values.remove(option['value'])
+                else:
+                    values.append(option['value'])
+                if values:
+                    params['category'] = ','.join(values)
+                else:
+                    params.pop('category', None)
+            elif option['selected']:
+                params.pop(dimension, None)
+            else:
+                params[dimension] = option['value']
+            linked[dimension].append(dict(option, url=f"{reverse('products')}?{params.urlencode()}"))
+    return linked
+
+
+def get_next_page_url(request, next_cursor, url_name):
+    """Build the URL of the listing page after `next_cursor`."""
+    if not next_cursor:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = next_cursor
+    return f"{reverse(url_name)}?{params.urlencode()}"
+
+
 def product_detail(request, product_id):
     """A view to show individual product details, including discounted price and discount name."""
 
+    validators = get_product_validators(request, product_id)
+    if validators:
+        not_modified = get_not_modified_response(request, validators)
+        if not_modified:
+            return not_modified
+
     product = get_object_or_404(HennaProduct, pk=product_id)
     discounted_price = product.get_discounted_price()
 
@@ -84,7 +126,10 @@ def product_detail(request, product_id):
         'discount_name': discount_name,
     }
 
-    return render(request, 'products/product_detail.html', context)
+    response = render(request, 'products/product_detail.html', context)
+    if validators:
+        patch_product_cache_headers(request, response, validators)
+    return response
 
 
 def add_product(request):
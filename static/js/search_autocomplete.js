@@ -0,0 +1,77 @@
+$(document).ready(function() {
+    // Suggest products and categories while typing in the search boxes
+    $('input[data-autocomplete-url]').each(function() {
+        let input = $(this);
+        let menu = $('<ul class="dropdown-menu w-100 rounded-0 search-suggestions"></ul>');
+        let timer = null;
+        let request = null;
+        let active = -1;
+
+        input.closest('.input-group').css('position', 'relative').append(menu);
+
+        function close() {
+            menu.removeClass('show').empty();
+            active = -1;
+        }
+
+        function highlight(index) {
+            let items = menu.find('.dropdown-item');
+            items.removeClass('active');
+            active = Math.max(-1, Math.min(index, items.length - 1));
+            if (active >= 0) {
+                items.eq(active).addClass('active');
+            }
+        }
+
+        function render(suggestions) {
+            menu.empty();
+            suggestions.forEach(function(suggestion) {
+                let icon = suggestion.type === 'category' ? 'fa-tag' : 'fa-search';
+                let link = $('<a class="dropdown-item"></a>').attr('href', suggestion.url);
+                link.append($('<i class="fas me-2"></i>').addClass(icon));
+                link.append(document.createTextNode(suggestion.label));
+                menu.append($('<li></li>').append(link));
+            });
+            menu.toggleClass('show', suggestions.length > 0);
+            active = -1;
+        }
+
+        input.on('input', function() {
+            clearTimeout(timer);
+            let query = input.val().trim();
+            if (!query) {
+                close();
+                return;
+            }
+            timer = setTimeout(function() {
+                if (request) {
+                    request.abort();
+                }
+                request = $.getJSON(input.data('autocomplete-url'), { q: query })
+                    .done(function(data) {
+                        render(data.suggestions);
+                    });
+            }, 150);
+        });
+
+        input.on('keydown', function(event) {
+            if (!menu.hasClass('show')) {
+                return;
+            }
+            if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+                event.preventDefault();
+                highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+            } else if (event.key === 'Enter' && active >= 0) {
+                event.preventDefault();
+                window.location = menu.find('.dropdown-item').eq(active).attr('href');
+            } else if (event.key === 'Escape') {
+                close();
+            }
+        });
+
+        input.on('blur', function() {
+            // Let clicks on a suggestion land before the menu closes
+            setTimeout(close, 200);
+        });
+    });
+});